@@ -1,27 +1,56 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, make_response
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, make_response, g, stream_with_context, abort, send_file
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
 from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime, timedelta
 import plotly.graph_objs as go
 import plotly.utils
 import json
-from collections import defaultdict
-from functools import wraps
+from collections import OrderedDict, defaultdict, namedtuple
+from functools import wraps, lru_cache, partial
+from itertools import chain
+from bisect import bisect_left
+import sys
+import threading
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 import pymysql
 import os
 from dotenv import load_dotenv
 from werkzeug.utils import secure_filename
+from urllib.parse import quote
 import uuid
 import csv
 import io
+import math
+import re
+import base64
+import hashlib
+import secrets
+import tempfile
+import shutil
+import zipfile
+from xml.sax.saxutils import escape
+import db_backend
 try:
-    from openpyxl import Workbook
+    from openpyxl import Workbook, load_workbook
     from openpyxl.styles import Font, PatternFill, Alignment
     EXCEL_AVAILABLE = True
 except ImportError:
     EXCEL_AVAILABLE = False
 
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    ARROW_AVAILABLE = True
+except ImportError:
+    ARROW_AVAILABLE = False
+
 try:
     from reportlab.lib.pagesizes import letter, A4
     from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, Image
@@ -36,10 +65,17 @@ try:
     from reportlab.graphics.charts.piecharts import Pie
     from reportlab.graphics.widgetbase import Widget
     from reportlab.graphics import renderPDF
+    from pdf_engine import get_pdf_engine
     PDF_AVAILABLE = True
 except ImportError:
     PDF_AVAILABLE = False
 
+try:
+    from ledger_engine import LedgerEngine, GROUP_KEYS as LEDGER_GROUP_KEYS, month_label, month_number
+    LEDGER_ENGINE_AVAILABLE = True
+except ImportError:
+    LEDGER_ENGINE_AVAILABLE = False
+
 # 加载环境变量
 load_dotenv()
 
@@ -49,15 +85,39 @@ app = Flask(__name__)
 
 # 从环境变量加载配置
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'your-secret-key-here')
-app.config['SQLALCHEMY_DATABASE_URI'] = f"mysql://{os.getenv('DB_USER', '')}:{os.getenv('DB_PASSWORD', '')}@{os.getenv('DB_HOST', '')}/{os.getenv('DB_NAME', '')}?charset=utf8mb4&connect_timeout=60&read_timeout=60&write_timeout=60"
+# 数据库：默认 MySQL，DB_BACKEND=sqlite 时使用本地 SQLite 文件（WAL 模式），见 db_backend.py
+app.config['SQLALCHEMY_DATABASE_URI'] = db_backend.database_url()
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
-    'pool_size': 10,
-    'pool_timeout': 20,
-    'pool_recycle': 3600,
-    'max_overflow': 20,
-    'pool_pre_ping': True
-}
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = db_backend.engine_options(app.config['SQLALCHEMY_DATABASE_URI'])
+if db_backend.is_sqlite(app.config['SQLALCHEMY_DATABASE_URI']):
+    db_backend.configure_sqlite(db_backend.sqlite_pragmas())
+
+# 仪表板缓存配置：每个工作进程内缓存，写入提交后立即失效；TTL 用于限制多进程部署时其他进程的数据滞后
+app.config['DASHBOARD_CACHE_SIZE'] = int(os.getenv('DASHBOARD_CACHE_SIZE', 256))
+app.config['DASHBOARD_CACHE_TTL'] = int(os.getenv('DASHBOARD_CACHE_TTL', 300))
+# 实体计数器与数据库核对的间隔（秒）
+app.config['COUNTER_RECONCILE_INTERVAL'] = int(os.getenv('COUNTER_RECONCILE_INTERVAL', 600))
+# 下拉框参考数据（分类、供应商、在售商品）缓存的过期秒数，作用同仪表板缓存 TTL
+app.config['REFERENCE_CACHE_TTL'] = int(os.getenv('REFERENCE_CACHE_TTL', 300))
+# 收支记录列表筛选结果的记录数与收支小计的缓存秒数：本进程写入后立即失效，
+# 其他进程、导入脚本、迁移脚本写入的数据最多在这段时间后反映到列表
+app.config['TRANSACTION_TOTALS_CACHE_TTL'] = int(os.getenv('TRANSACTION_TOTALS_CACHE_TTL', 300))
+# 财务分析结果（分析页面、财务数据导出、PDF 报告共用）在每个进程内缓存的报告期个数
+app.config['ANALYTICS_CACHE_SIZE'] = int(os.getenv('ANALYTICS_CACHE_SIZE', 64))
+# 交易列存分析引擎（可选，需要 numpy）：设为 true 后每个 Web 进程启动时把精简的交易明细载入内存，
+# 财务分析与仪表板的分组汇总直接在内存中计算；默认关闭，使用数据库查询
+app.config['LEDGER_ENGINE'] = os.getenv('LEDGER_ENGINE', 'false').lower() == 'true'
+# API 令牌校验结果在每个工作进程内的缓存秒数；用脚本吊销令牌后，其他进程最多在这段时间后生效
+app.config['API_TOKEN_CACHE_TTL'] = int(os.getenv('API_TOKEN_CACHE_TTL', 60))
+# 后台任务（PDF 报告、Excel 导出）：独立进程池执行，结果文件保存在 JOB_FOLDER，JOB_RESULT_TTL 秒后清理；
+# 每个任务进程执行 JOB_MAX_TASKS_PER_CHILD 个任务后退出重建，reportlab/openpyxl 占用的内存随之释放
+app.config['JOB_FOLDER'] = os.getenv('JOB_FOLDER', os.path.join(app.instance_path, 'jobs'))
+app.config['JOB_WORKERS'] = int(os.getenv('JOB_WORKERS', 2))
+app.config['JOB_MAX_TASKS_PER_CHILD'] = int(os.getenv('JOB_MAX_TASKS_PER_CHILD', 20))
+app.config['JOB_RESULT_TTL'] = int(os.getenv('JOB_RESULT_TTL', 3600))
+# PDF 报告缓存目录；数据未变的报告期再次导出时直接返回缓存文件。上月结束后自动在后台预生成上月报告
+app.config['PDF_CACHE_FOLDER'] = os.getenv('PDF_CACHE_FOLDER', os.path.join(app.instance_path, 'report_cache'))
+app.config['PDF_REPORT_PREGENERATE'] = os.getenv('PDF_REPORT_PREGENERATE', 'true').lower() == 'true'
 
 # 文件上传配置
 app.config['UPLOAD_FOLDER'] = 'static/uploads/suppliers'
@@ -137,7 +197,7 @@ class Product(db.Model):
     image_path = db.Column(db.String(255))  # 商品图片路径
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     is_active = db.Column(db.Boolean, default=True)
-    supplier = db.relationship('Supplier', backref='product_list')
+    supplier = db.relationship('Supplier', backref=db.backref('product_list', lazy='dynamic'))
 
 class Receivable(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -196,15 +256,77 @@ class Transaction(db.Model):
     product_id = db.Column(db.Integer, db.ForeignKey('product.id'))
     quantity = db.Column(db.Float)
     unit_price = db.Column(db.Float)
+    # 日期分桶：年月（YYYY-MM）与天序号（自 1970-01-01 起的天数），写入时随 date 一起填写（见 date_buckets），
+    # 按月、按日分组直接按索引顺序读取，不必逐行计算日期函数
+    month = db.Column(db.String(7))
+    day_number = db.Column(db.Integer)
+
+    # 加载策略：多对一关系默认按需加载，逐行展示的列表查询显式 joinedload；
+    # 分类/供应商/商品下的交易集合可能很大，设为 dynamic，只在需要时按条件查询
+    category = db.relationship('Category', backref=db.backref('transactions', lazy='dynamic'))
+    supplier = db.relationship('Supplier', backref=db.backref('transactions', lazy='dynamic'))
+    product = db.relationship('Product', backref=db.backref('transactions', lazy='dynamic'))
+
+    # 热点查询都是 “类型/分类/供应商/商品 + 日期范围，按日期倒序”，索引与之对应；
+    # 已有库通过 migrate.py 补建
+    __table_args__ = (
+        db.Index('ix_transaction_date_id', 'date', 'id'),
+        db.Index('ix_transaction_type_date_amount', 'type', 'date', 'amount'),
+        db.Index('ix_transaction_category_date', 'category_id', 'date'),
+        db.Index('ix_transaction_supplier_date', 'supplier_id', 'date'),
+        db.Index('ix_transaction_product_date', 'product_id', 'date'),
+        # 月度汇总重建、报告期首尾明细按 (年月, 类型, 分类, 供应商) 分组；每日余额按天序号分组
+        db.Index('ix_transaction_month_bucket', 'month', 'type', 'category_id', 'supplier_id', 'day_number', 'amount'),
+        db.Index('ix_transaction_day_bucket', 'day_number', 'type', 'amount'),
+        # 描述全文索引：ngram 分词支持中文，仅 MySQL 创建；SQLite 使用 FTS5 全文索引表（见 create_transaction_fts）
+        db.Index('ft_transaction_text', 'description', 'supplier_description',
+                 mysql_prefix='FULLTEXT', mysql_with_parser='ngram').ddl_if(dialect='mysql'),
+    )
+
+class TransactionMonthlyRollup(db.Model):
+    """交易月度汇总：年月 × 类型 × 分类 × 供应商，随交易写入同步维护"""
+    id = db.Column(db.Integer, primary_key=True)
+    month = db.Column(db.String(7), nullable=False)  # 年月，格式 YYYY-MM
+    type = db.Column(db.String(10), nullable=False)
+    category_id = db.Column(db.Integer, nullable=False)
+    supplier_id = db.Column(db.Integer, nullable=False, default=0)  # 0 表示无供应商，便于唯一约束生效
+    total = db.Column(db.Float, nullable=False, default=0)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        db.UniqueConstraint('month', 'type', 'category_id', 'supplier_id', name='uq_rollup_bucket'),
+    )
+
+class TransactionMonthVersion(db.Model):
+    """每月交易数据版本号：该月汇总数据有变化时加一，用作报表缓存键的一部分"""
+    month = db.Column(db.String(7), primary_key=True)  # 年月，格式 YYYY-MM
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+class DailyBalance(db.Model):
+    """每日收支净额及截至当日的累计余额，随交易写入同步维护"""
+    day = db.Column(db.Date, primary_key=True)
+    net = db.Column(db.Float, nullable=False, default=0)  # 当日收入减支出
+    balance = db.Column(db.Float, nullable=False, default=0)  # 截至当日（含）的累计余额
 
-    category = db.relationship('Category', backref='transactions')
-    supplier = db.relationship('Supplier', backref='transactions')
-    product = db.relationship('Product', backref='transactions')
+class ApiToken(db.Model):
+    """收银机、移动端等外部客户端使用的 API 令牌，只保存令牌的 SHA-256 摘要"""
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)  # 客户端名称，便于识别和吊销
+    token_hash = db.Column(db.String(64), unique=True, nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)  # 通过该令牌写入的记录归属此用户
+    is_active = db.Column(db.Boolean, default=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    user = db.relationship('User', backref='api_tokens')
 
 @login_manager.user_loader
 def load_user(user_id):
     return User.query.get(int(user_id))
 
+def has_related(*conditions):
+    """用 EXISTS 判断是否存在满足条件的关联记录，不加载关联集合"""
+    return db.session.query(db.exists().where(*conditions)).scalar()
+
 def admin_required(f):
     @wraps(f)
     @login_required
@@ -225,400 +347,1542 @@ def edit_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+# 进程内缓存：带容量上限的 LRU，记录命中、未命中、淘汰次数
+caches = {}
+
+class LRUCache:
+    def __init__(self, name, maxsize, ttl=None):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        caches[name] = self
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and (self.ttl is None or time.monotonic() - entry[1] < self.ttl):
+                self._data.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            if entry is not None:
+                del self._data[key]
+            self.misses += 1
+            return None
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.monotonic())
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_compute(self, key, compute):
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            self.set(key, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.invalidations += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations
+            }
+
+# 数据变更通知：在会话提交后把本次提交涉及的模型名称通知给订阅者
+data_change_listeners = []
+
+def on_data_changed(*model_names):
+    """注册回调，当给定模型中任意一个有写入提交时调用"""
+    def decorator(f):
+        data_change_listeners.append((set(model_names), f))
+        return f
+    return decorator
+
+def mark_data_changed(*model_names):
+    """批量 SQL 等不经过 ORM flush 的写入，需手动登记变更的模型"""
+    db.session.info.setdefault('changed_models', set()).update(model_names)
+
+@event.listens_for(Session, 'after_flush')
+def _collect_changed_models(session, flush_context):
+    changed = session.info.setdefault('changed_models', set())
+    for instance in chain(session.new, session.dirty, session.deleted):
+        changed.add(type(instance).__name__)
+
+@event.listens_for(Session, 'after_commit')
+def _notify_data_changed(session):
+    changed = session.info.pop('changed_models', None)
+    if not changed:
+        return
+    for model_names, listener in data_change_listeners:
+        if changed & model_names:
+            listener(changed)
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_changed_models(session):
+    session.info.pop('changed_models', None)
+
+@app.route('/api/cache_stats')
+@admin_required
+def api_cache_stats():
+    """各进程内缓存的命中率等统计"""
+    return jsonify({name: cache.stats() for name, cache in caches.items()})
+
+# 实体计数器：启动后从数据库统计一次，之后随 ORM 插入/删除/启停增量维护，并定期与数据库核对
+class EntityCounters:
+    def __init__(self, models, reconcile_interval):
+        self.models = models  # 名称 -> (模型, 是否有 is_active 字段)
+        self.reconcile_interval = reconcile_interval
+        self.reconciliations = 0
+        self._values = None
+        self._reconciled_at = 0.0
+        self._lock = threading.Lock()
+
+    def _count_all(self):
+        columns = []
+        for name, (model, has_active) in self.models.items():
+            columns.append(db.session.query(db.func.count(model.id)).scalar_subquery().label(name))
+            if has_active:
+                columns.append(db.session.query(db.func.count(model.id)).filter(
+                    model.is_active == True).scalar_subquery().label(name + '_active'))
+        row = db.session.query(*columns).one()._mapping
+        return {name: {'total': row[name], 'active': row[name + '_active'] if has_active else row[name]}
+                for name, (model, has_active) in self.models.items()}
+
+    def reconcile(self):
+        """与数据库核对，返回核对前后不一致的计数"""
+        values = self._count_all()
+        with self._lock:
+            drift = {name: {'counted': value, 'tracked': self._values.get(name)}
+                     for name, value in values.items()
+                     if self._values is not None and self._values.get(name) != value}
+            self._values = values
+            self._reconciled_at = time.monotonic()
+            self.reconciliations += 1
+        return drift
+
+    def get(self, name):
+        if self._values is None or time.monotonic() - self._reconciled_at > self.reconcile_interval:
+            self.reconcile()
+        with self._lock:
+            return dict(self._values[name])
+
+    def apply(self, deltas):
+        with self._lock:
+            if self._values is None:
+                return
+            for (name, field), delta in deltas.items():
+                self._values[name][field] += delta
+
+    def invalidate(self):
+        """批量写入等无法逐条跟踪的情况，下次读取时重新统计"""
+        with self._lock:
+            self._values = None
+
+entity_counters = EntityCounters({
+    'Transaction': (Transaction, False),
+    'User': (User, True),
+    'Supplier': (Supplier, True),
+    'Product': (Product, True),
+    'Category': (Category, False),
+}, app.config['COUNTER_RECONCILE_INTERVAL'])
+
+def stage_counter_delta(name, total=0, active=0):
+    """登记本事务内的计数变化，提交后生效，回滚则丢弃"""
+    deltas = db.session.info.setdefault('counter_deltas', defaultdict(int))
+    deltas[(name, 'total')] += total
+    deltas[(name, 'active')] += active
+
+def _counter_after_insert(mapper, connection, target):
+    name = type(target).__name__
+    active = getattr(target, 'is_active', True) is not False
+    stage_counter_delta(name, total=1, active=1 if active else 0)
+
+def _counter_after_delete(mapper, connection, target):
+    name = type(target).__name__
+    was_active = getattr(target, 'is_active', True) is not False
+    stage_counter_delta(name, total=-1, active=-1 if was_active else 0)
+
+def _counter_after_update(mapper, connection, target):
+    history = db.inspect(target).attrs.is_active.history
+    if not history.has_changes() or not history.deleted:
+        return
+    was_active = history.deleted[0] is not False
+    is_active = target.is_active is not False
+    if was_active != is_active:
+        stage_counter_delta(type(target).__name__, active=1 if is_active else -1)
+
+for _name, (_model, _has_active) in entity_counters.models.items():
+    event.listen(_model, 'after_insert', _counter_after_insert)
+    event.listen(_model, 'after_delete', _counter_after_delete)
+    if _has_active:
+        event.listen(_model, 'after_update', _counter_after_update)
+
+@event.listens_for(Session, 'after_commit')
+def _apply_counter_deltas(session):
+    deltas = session.info.pop('counter_deltas', None)
+    if deltas:
+        entity_counters.apply(deltas)
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_counter_deltas(session):
+    session.info.pop('counter_deltas', None)
+
+# 参考数据缓存：表单下拉框用到的分类、供应商、在售商品，缓存为与会话无关的只读记录
+CategoryRef = namedtuple('CategoryRef', ['id', 'name', 'type', 'color'])
+SupplierRef = namedtuple('SupplierRef', ['id', 'name', 'is_active'])
+ProductRef = namedtuple('ProductRef', ['id', 'name', 'category', 'supplier_id', 'unit', 'cost_price', 'selling_price'])
+
+reference_cache = LRUCache('reference_data', 8, app.config['REFERENCE_CACHE_TTL'])
+
+@on_data_changed('Category', 'Supplier', 'Product')
+def _invalidate_reference_cache(changed):
+    reference_cache.clear()
+
+def reference_categories():
+    """全部分类"""
+    return reference_cache.get_or_compute('categories', lambda: tuple(
+        CategoryRef(*row) for row in db.session.query(
+            Category.id, Category.name, Category.type, Category.color
+        ).order_by(Category.id)
+    ))
+
+def reference_suppliers():
+    """全部供应商"""
+    return reference_cache.get_or_compute('suppliers', lambda: tuple(
+        SupplierRef(*row) for row in db.session.query(
+            Supplier.id, Supplier.name, Supplier.is_active
+        ).order_by(Supplier.id)
+    ))
+
+def reference_active_products():
+    """在售商品"""
+    return reference_cache.get_or_compute('active_products', lambda: tuple(
+        ProductRef(*row) for row in db.session.query(
+            Product.id, Product.name, Product.category, Product.supplier_id,
+            Product.unit, Product.cost_price, Product.selling_price
+        ).filter(Product.is_active == True).order_by(Product.id)
+    ))
+
+# 交易汇总维护：交易增删改时在同一数据库事务内更新月度汇总表
+DailyNet = namedtuple('DailyNet', ['day', 'net'])
+TransactionSnapshot = namedtuple('TransactionSnapshot', ['date', 'type', 'amount', 'category_id', 'supplier_id', 'product_id'])
+
+def month_floor(day, months_back=0):
+    """返回 day 所在月份往前推 months_back 个月的月初"""
+    index = day.year * 12 + day.month - 1 - months_back
+    return datetime(index // 12, index % 12 + 1, 1)
+
+def transaction_snapshot(transaction):
+    """记录交易中影响汇总数据和分析结果的字段"""
+    return TransactionSnapshot(transaction.date, transaction.type, transaction.amount,
+                               transaction.category_id, transaction.supplier_id, transaction.product_id)
+
+EPOCH_DAY = datetime(1970, 1, 1)
+
+def date_buckets(value):
+    """日期对应的分桶值 (年月 'YYYY-MM', 天序号)，天序号为自 1970-01-01 起的天数"""
+    return value.strftime('%Y-%m'), (datetime(value.year, value.month, value.day) - EPOCH_DAY).days
+
+def day_from_number(number):
+    """天序号对应的日期"""
+    return (EPOCH_DAY + timedelta(days=number)).date()
+
+@event.listens_for(Transaction, 'before_insert')
+@event.listens_for(Transaction, 'before_update')
+def _fill_date_buckets(mapper, connection, target):
+    """写入交易时按 date 填写分桶列；批量导入走 Core 插入，由 parse_import_row 直接给出"""
+    if target.date is None:
+        target.date = datetime.utcnow()
+    target.month, target.day_number = date_buckets(target.date)
+
+def _as_day(value):
+    return value.date() if isinstance(value, datetime) else value
+
+class TransactionDeltas:
+    """累积交易变化对月度汇总与每日余额的影响，占用内存只与涉及的汇总键、日期数有关"""
+    def __init__(self):
+        self.rollup = defaultdict(lambda: [0.0, 0])
+        self.days = defaultdict(float)
+        self.months = set()  # 有交易变化的月份，即使月度合计不变（如同月内改日期、改商品）也要更新版本号
+
+    def add(self, snapshots, sign=1):
+        for snapshot in snapshots:
+            month = snapshot.date.strftime('%Y-%m')
+            self.months.add(month)
+            key = (month, snapshot.type, snapshot.category_id, snapshot.supplier_id or 0)
+            self.rollup[key][0] += sign * snapshot.amount
+            self.rollup[key][1] += sign
+            if snapshot.type in BALANCE_SIGNS:
+                self.days[_as_day(snapshot.date)] += sign * BALANCE_SIGNS[snapshot.type] * snapshot.amount
+
+    def replace(self, previous, current):
+        """一条交易由 previous 改为 current；只改了备注等无关字段时不记录"""
+        if previous != current:
+            self.add([previous], -1)
+            self.add([current])
+
+def record_transaction_changes(removed=(), added=()):
+    """把一组交易变化（removed 为旧值，added 为新值）累加到月度汇总表和每日余额账，不提交事务"""
+    if list(removed) == list(added):
+        return
+    deltas = TransactionDeltas()
+    deltas.add(removed, -1)
+    deltas.add(added)
+    apply_transaction_deltas(deltas)
+
+def apply_transaction_deltas(deltas):
+    """把累积的 TransactionDeltas 写入月度汇总表和每日余额账，不提交事务"""
+    # 按键的顺序写入，批量写入的事务之间加锁顺序一致，不会互相死锁
+    for (month, transaction_type, category_id, supplier_id), (amount, count) in sorted(deltas.rollup.items()):
+        if not amount and not count:
+            continue
+        increment_row(TransactionMonthlyRollup,
+                      {'month': month, 'type': transaction_type, 'category_id': category_id, 'supplier_id': supplier_id},
+                      {'total': amount, 'count': count})
+
+    bump_month_versions(deltas.months)
+    apply_balance_deltas(deltas.days)
+
+def increment_row(model, keys, increments):
+    """给 keys 对应的行累加 increments，行不存在时插入，不提交事务。
+    多个事务同时写入同一新行时不会因唯一约束失败：后插入的一方改为累加"""
+    dialect = db.session.get_bind().dialect
+    if db_backend.supports_upsert(dialect):
+        db.session.execute(db_backend.increment_upsert(dialect, model.__table__, keys, increments))
+        return
+    # 不支持单条语句插入或更新时先更新，行不存在再插入；插入与并发事务冲突时回到保存点重新更新
+    update = db.update(model).where(*(getattr(model, name) == value for name, value in keys.items())).values(
+        {name: getattr(model, name) + value for name, value in increments.items()}
+    ).execution_options(synchronize_session=False)
+    if db.session.execute(update).rowcount:
+        return
+    try:
+        with db.session.begin_nested():
+            db.session.execute(db.insert(model).values(**keys, **increments))
+    except IntegrityError:
+        db.session.execute(update)
+
+def bump_month_versions(months):
+    """给各月的数据版本号加一，不提交事务"""
+    for month in sorted(months):
+        increment_row(TransactionMonthVersion, {'month': month}, {'version': 1})
+
+# 交易类型对余额的影响方向
+BALANCE_SIGNS = {'income': 1, 'expense': -1}
+
+def _lock_balance_rows(first_day):
+    """锁定余额账中从 first_day 之前最近的已有日期起的全部行，返回其最新的 {日期: 累计余额}（按日期升序）。
+
+    新日期的累计余额从前一个已有日期推算。锁定期间其他事务不能修改这些行，也不能在其间插入新日期，
+    读到的是已提交的最新值，而不是本事务开始时的快照（MySQL 为加锁读；SQLite 的写事务本身互斥）。
+    各事务都按日期升序加锁，加锁顺序一致。
+    """
+    previous = db.session.query(db.func.max(DailyBalance.day)).filter(DailyBalance.day < first_day).scalar()
+    query = db.session.query(DailyBalance.day, DailyBalance.balance)
+    if previous is not None:
+        query = query.filter(DailyBalance.day >= previous)
+    return OrderedDict(query.order_by(DailyBalance.day).with_for_update().all())
+
+def apply_balance_deltas(day_deltas):
+    """把每日净额变化写入余额账：更新当日净额，并只对受影响的日期区间调整累计余额"""
+    days = sorted(day for day, delta in day_deltas.items() if delta)
+    if not days:
+        return
+    ledger = _lock_balance_rows(days[0])
+    ledger_days = list(ledger)
+    for day in days:
+        delta = day_deltas[day]
+        if day in ledger:
+            db.session.execute(
+                db.update(DailyBalance).where(DailyBalance.day == day).values(
+                    net=DailyBalance.net + delta
+                ).execution_options(synchronize_session=False)
+            )
+        else:
+            # 新日期的累计余额先取前一个已有日期的余额，下面的区间调整会再加上当日及之前变动日的净额
+            position = bisect_left(ledger_days, day)
+            seed = ledger[ledger_days[position - 1]] if position else 0.0
+            db.session.execute(db.insert(DailyBalance).values(day=day, net=delta, balance=seed))
+
+    # 第 i 个变动日到第 i+1 个变动日之间的累计余额都加上前 i 个变动之和；移动交易日期时只会修补两日期之间的区间
+    running = 0.0
+    for i, day in enumerate(days):
+        running += day_deltas[day]
+        if abs(running) < 1e-9:
+            continue
+        condition = DailyBalance.day >= day
+        if i + 1 < len(days):
+            condition = db.and_(condition, DailyBalance.day < days[i + 1])
+        db.session.execute(
+            db.update(DailyBalance).where(condition).values(
+                balance=DailyBalance.balance + running
+            ).execution_options(synchronize_session=False)
+        )
+
+def balance_as_of(day=None):
+    """截至某日（含）的累计余额，不传日期时返回当前余额"""
+    query = db.session.query(DailyBalance.balance)
+    if day is not None:
+        query = query.filter(DailyBalance.day <= day)
+    balance = query.order_by(DailyBalance.day.desc()).limit(1).scalar()
+    return balance or 0.0
+
+def balance_change(start_day, end_day=None):
+    """[start_day, end_day] 期间的余额变化，end_day 为空时截至当前"""
+    return balance_as_of(end_day) - balance_as_of(start_day - timedelta(days=1))
+
+def _daily_net_from_transactions():
+    """直接从交易明细计算每日净额，按日期升序，返回 [(日期, 净额)]"""
+    net = db.func.sum(db.case(
+        (Transaction.type == 'income', Transaction.amount),
+        (Transaction.type == 'expense', -Transaction.amount),
+        else_=0
+    ))
+    rows = db.session.query(Transaction.day_number, net).filter(
+        Transaction.type.in_(list(BALANCE_SIGNS))
+    ).group_by(Transaction.day_number).order_by(Transaction.day_number)
+    return [DailyNet(day_from_number(number), value) for number, value in rows]
+
+def rebuild_daily_balance():
+    """根据交易明细重建每日余额账，返回写入的天数"""
+    rows = []
+    balance = 0.0
+    for row in _daily_net_from_transactions():
+        balance += row.net
+        rows.append({'day': row.day, 'net': row.net, 'balance': balance})
+    db.session.query(DailyBalance).delete()
+    if rows:
+        db.session.execute(db.insert(DailyBalance), rows)
+    db.session.commit()
+    return len(rows)
+
+def verify_daily_balance(tolerance=0.005):
+    """核对余额账与交易明细，返回不一致的日期及双方的 (净额, 累计余额)"""
+    expected = {}
+    balance = 0.0
+    for row in _daily_net_from_transactions():
+        balance += row.net
+        expected[row.day] = (row.net, balance)
+    actual = {row.day: (row.net, row.balance) for row in DailyBalance.query}
+    mismatches = []
+    for day in sorted(set(expected) | set(actual)):
+        expected_net, expected_balance = expected.get(day, (0.0, None))
+        actual_net, actual_balance = actual.get(day, (0.0, None))
+        if expected_balance is None:
+            # 净额归零的日期可以保留在余额账中，只要累计余额与前一日一致
+            expected_balance = _balance_before(expected, day)
+        if actual_balance is None:
+            actual_balance = _balance_before(actual, day)
+        # 写成 not <=：账中出现 inf/nan 时差值为 nan，与容差的 > 比较恒为 False
+        if not (abs(expected_net - actual_net) <= tolerance and abs(expected_balance - actual_balance) <= tolerance):
+            mismatches.append((day, (expected_net, expected_balance), (actual_net, actual_balance)))
+    return mismatches
+
+def _balance_before(ledger, day):
+    earlier = [d for d in ledger if d < day]
+    return ledger[max(earlier)][1] if earlier else 0.0
+
+def _rollup_rows_from_transactions():
+    """直接从交易明细计算月度汇总"""
+    # 按原始列分组，与 (month, type, category_id, supplier_id) 索引顺序一致；空供应商记为 0
+    return db.session.query(
+        Transaction.month,
+        Transaction.type,
+        Transaction.category_id,
+        db.func.coalesce(Transaction.supplier_id, 0).label('supplier_id'),
+        db.func.sum(Transaction.amount).label('total'),
+        db.func.count(Transaction.id).label('count')
+    ).group_by(
+        Transaction.month, Transaction.type, Transaction.category_id, Transaction.supplier_id
+    ).all()
+
+def rebuild_transaction_rollup():
+    """根据交易明细重建月度汇总表，返回写入的行数"""
+    rows = _rollup_rows_from_transactions()
+    db.session.query(TransactionMonthlyRollup).delete()
+    if rows:
+        db.session.execute(db.insert(TransactionMonthlyRollup), [
+            {'month': row.month, 'type': row.type, 'category_id': row.category_id,
+             'supplier_id': row.supplier_id, 'total': row.total, 'count': row.count}
+            for row in rows
+        ])
+    # 重建可能修正了汇总数据，基于旧汇总生成的报表缓存一并失效
+    bump_month_versions({row.month for row in rows} |
+                        {month for month, in db.session.query(TransactionMonthVersion.month)})
+    db.session.commit()
+    return len(rows)
+
+def verify_transaction_rollup(tolerance=0.005):
+    """核对月度汇总表与交易明细，返回不一致的汇总键及双方数值"""
+    expected = {(row.month, row.type, row.category_id, row.supplier_id): (float(row.total), row.count)
+                for row in _rollup_rows_from_transactions()}
+    actual = {(row.month, row.type, row.category_id, row.supplier_id): (row.total, row.count)
+              for row in TransactionMonthlyRollup.query.filter(TransactionMonthlyRollup.count != 0)}
+    mismatches = []
+    for key in sorted(set(expected) | set(actual)):
+        expected_total, expected_count = expected.get(key, (0.0, 0))
+        actual_total, actual_count = actual.get(key, (0.0, 0))
+        if expected_count != actual_count or not abs(expected_total - actual_total) <= tolerance:
+            mismatches.append((key, (expected_total, expected_count), (actual_total, actual_count)))
+    return mismatches
+
+# 交易列存引擎：首次使用时全量载入，之后每次使用前比对各月数据版本号，只重新读取有变化的月份
+_ledger_engine = None
+_ledger_engine_lock = threading.Lock()
+
+def _ledger_rows(*ranges):
+    """读取明细行 (日期, 金额, 类型, 分类ID, 供应商ID, 商品ID)，按批产出；ranges 为 [开始, 结束) 区间，缺省为全部"""
+    query = db.session.query(
+        Transaction.date, Transaction.amount, Transaction.type,
+        Transaction.category_id, Transaction.supplier_id, Transaction.product_id
+    )
+    if ranges:
+        query = query.filter(db.or_(*(db.and_(Transaction.date >= start, Transaction.date < end)
+                                      for start, end in ranges)))
+    result = db.session.execute(query.statement.execution_options(yield_per=EXPORT_BATCH_SIZE))
+    for rows in result.partitions():
+        yield rows
+
+def _month_ranges(months):
+    """把年月列表合并为连续的 [开始, 结束) 日期区间"""
+    numbers = sorted(month_number(month) for month in months)
+    ranges = []
+    for number in numbers:
+        if ranges and ranges[-1][1] == number:
+            ranges[-1][1] = number + 1
+        else:
+            ranges.append([number, number + 1])
+    return [(datetime.strptime(month_label(start), '%Y-%m'), datetime.strptime(month_label(end), '%Y-%m'))
+            for start, end in ranges]
+
+def ledger_engine():
+    """本进程的交易列存引擎（已与数据库同步），未启用或未安装 numpy 时返回 None；同一请求内只同步一次"""
+    if not LEDGER_ENGINE_AVAILABLE or not app.config['LEDGER_ENGINE']:
+        return None
+    if 'ledger_engine' not in g:
+        g.ledger_engine = _sync_ledger_engine()
+    return g.ledger_engine
+
+def _sync_ledger_engine():
+    """比对各月数据版本号，重新读取有变化的月份；引擎尚未载入时全量载入"""
+    global _ledger_engine
+    versions = dict(db.session.query(TransactionMonthVersion.month, TransactionMonthVersion.version).all())
+    with _ledger_engine_lock:
+        if _ledger_engine is None:
+            engine = LedgerEngine()
+            engine.load(_ledger_rows())
+            engine.versions = versions
+            _ledger_engine = engine
+            app.logger.info('交易列存引擎已载入 %d 条，占用 %.1f MB，用时 %.2f 秒', len(engine.columns.day),
+                            engine.memory_bytes() / 1048576, engine.load_seconds)
+            return engine
+        engine = _ledger_engine
+        changed = [month for month, version in versions.items() if engine.versions.get(month) != version]
+        if changed:
+            engine.replace_months(changed, _ledger_rows(*_month_ranges(changed)))
+            engine.versions = versions
+        return engine
+
+def preload_ledger_engine():
+    """在后台线程中载入列存引擎，避免第一个使用它的请求等待全量读取"""
+    def load():
+        with app.app_context():
+            try:
+                ledger_engine()
+            except Exception as e:
+                app.logger.warning(f'交易列存引擎载入失败: {e}')
+    if LEDGER_ENGINE_AVAILABLE and app.config['LEDGER_ENGINE']:
+        threading.Thread(target=load, name='ledger-engine-preload', daemon=True).start()
+
+@app.route('/api/ledger_engine')
+@admin_required
+def api_ledger_engine():
+    """本进程列存引擎的行数、内存占用、载入耗时与增量刷新次数"""
+    if _ledger_engine is None:
+        return jsonify({'enabled': LEDGER_ENGINE_AVAILABLE and app.config['LEDGER_ENGINE'], 'loaded': False})
+    return jsonify(dict(_ledger_engine.stats(), enabled=True, loaded=True))
+
+def _ledger_period_totals(engine, by, start_date, end_date, **filters):
+    """列存引擎中 [start_date, end_date] 按类型和 by 分组的收支合计 {(类型, 分组值): 合计}，只含收入、支出"""
+    return {(transaction_type, key): total
+            for (transaction_type, key), (total, count) in engine.aggregate(by, start_date, end_date, **filters).items()
+            if transaction_type in BALANCE_SIGNS}
+
+def report_months(start_date, end_date):
+    """报告期覆盖的年月列表"""
+    first = start_date.year * 12 + start_date.month - 1
+    last = end_date.year * 12 + end_date.month - 1
+    return [f'{index // 12:04d}-{index % 12 + 1:02d}' for index in range(first, last + 1)]
+
+def _split_period(start_date, end_date):
+    """把 [start_date, end_date] 拆成可走汇总表的整月区间和需要回查明细的首尾区间"""
+    start = datetime(start_date.year, start_date.month, start_date.day)
+    end = datetime(end_date.year, end_date.month, end_date.day) + timedelta(days=1)
+    first_full = start if start.day == 1 else month_floor(start, -1)
+    last_full = month_floor(end)
+    if first_full >= last_full:
+        return None, [(start, end)] if start < end else []
+    raw_ranges = []
+    if start < first_full:
+        raw_ranges.append((start, first_full))
+    if last_full < end:
+        raw_ranges.append((last_full, end))
+    full_months = (first_full.strftime('%Y-%m'), month_floor(last_full, 1).strftime('%Y-%m'))
+    return full_months, raw_ranges
+
+def _period_source(start_date, end_date):
+    """[start_date, end_date] 内收支的来源子查询 (month, type, category_id, total)：
+    整月取月度汇总表，首尾不足整月的部分取交易明细，合并为一条 UNION ALL；期间为空时返回 None"""
+    full_months, raw_ranges = _split_period(start_date, end_date)
+    parts = []
+    if full_months:
+        parts.append(db.select(
+            TransactionMonthlyRollup.month,
+            TransactionMonthlyRollup.type,
+            TransactionMonthlyRollup.category_id,
+            TransactionMonthlyRollup.total
+        ).where(
+            TransactionMonthlyRollup.type.in_(list(BALANCE_SIGNS)),
+            TransactionMonthlyRollup.month.between(*full_months),
+            TransactionMonthlyRollup.count != 0
+        ))
+    for range_start, range_end in raw_ranges:
+        # 区间边界都是零点，按年月、天序号筛选，走 (month, type, category_id, ...) 覆盖索引
+        first_month, first_day = date_buckets(range_start)
+        last_month, _ = date_buckets(range_end - timedelta(days=1))
+        parts.append(db.select(
+            Transaction.month,
+            Transaction.type,
+            Transaction.category_id,
+            db.func.sum(Transaction.amount).label('total')
+        ).where(
+            Transaction.month.between(first_month, last_month),
+            Transaction.type.in_(list(BALANCE_SIGNS)),
+            Transaction.day_number >= first_day,
+            Transaction.day_number < first_day + (range_end - range_start).days
+        ).group_by(Transaction.month, Transaction.type, Transaction.category_id))
+    if not parts:
+        return None
+    return (db.union_all(*parts) if len(parts) > 1 else parts[0]).subquery('source')
+
+def period_monthly_totals(start_date, end_date):
+    """[start_date, end_date] 内按月汇总的收支，返回 {'YYYY-MM': {'income': x, 'expense': y}}，只含有数据的月份"""
+    month_data = defaultdict(lambda: {'income': 0, 'expense': 0})
+    engine = ledger_engine()
+    if engine is not None:
+        for (transaction_type, month), total in _ledger_period_totals(engine, 'month', start_date, end_date).items():
+            month_data[month][transaction_type] += total
+        return month_data
+    source = _period_source(start_date, end_date)
+    if source is None:
+        return month_data
+    rows = db.session.execute(
+        db.select(source.c.month, source.c.type, db.func.sum(source.c.total).label('total'))
+        .group_by(source.c.month, source.c.type)
+    )
+    for row in rows:
+        month_data[row.month][row.type] += row.total
+    return month_data
+
+def period_category_totals(start_date, end_date):
+    """[start_date, end_date] 内按分类、类型汇总的金额，返回 [(name, type, total)]"""
+    totals = defaultdict(float)
+    engine = ledger_engine()
+    if engine is not None:
+        names = {category.id: category.name for category in reference_categories()}
+        for (transaction_type, category_id), total in _ledger_period_totals(engine, 'category', start_date, end_date).items():
+            if category_id in names:
+                totals[(names[category_id], transaction_type)] += total
+        return [(name, transaction_type, total) for (name, transaction_type), total in sorted(totals.items())]
+    source = _period_source(start_date, end_date)
+    if source is None:
+        return []
+    rows = db.session.execute(
+        db.select(Category.name, source.c.type, db.func.sum(source.c.total).label('total'))
+        .join(Category, Category.id == source.c.category_id)
+        .group_by(Category.name, source.c.type)
+        .order_by(Category.name, source.c.type)
+    )
+    return [(row.name, row.type, row.total) for row in rows]
+
+MonthlyStat = namedtuple('MonthlyStat', ['month', 'income', 'expense', 'profit', 'mom_growth', 'yoy_growth'])
+
+def _growth_rate(current, previous):
+    """相对 previous 的增长百分比，previous 为 0 时记为 0"""
+    return (current - previous) / abs(previous) * 100 if previous else 0
+
+def period_monthly_stats(start_date, end_date):
+    """报告期内每个日历月的收支、利润及环比（与上月比较）、同比（与去年同月比较）增长 [MonthlyStat]；
+    没有数据的月份补 0，各序列按月对齐。支持窗口函数时由一条 SQL 完成：日历月份 LEFT JOIN 各月汇总，LAG 取上月与去年同月利润"""
+    months = report_months(start_date, end_date) if start_date <= end_date else []
+    if not months:
+        return []
+    if ledger_engine() is not None or not db_backend.supports_window_functions(db.engine.dialect):
+        month_data = period_monthly_totals(start_date, end_date)
+        profits = [month_data[month]['income'] - month_data[month]['expense'] if month in month_data else 0
+                   for month in months]
+        return [MonthlyStat(month,
+                            month_data[month]['income'] if month in month_data else 0,
+                            month_data[month]['expense'] if month in month_data else 0,
+                            profit,
+                            _growth_rate(profit, profits[i - 1]) if i >= 1 else 0,
+                            _growth_rate(profit, profits[i - 12]) if i >= 12 else 0)
+                for i, (month, profit) in enumerate(zip(months, profits))]
+
+    source = _period_source(start_date, end_date)
+    monthly = db.select(
+        source.c.month,
+        db.func.sum(db.case((source.c.type == 'income', source.c.total), else_=0)).label('income'),
+        db.func.sum(db.case((source.c.type == 'expense', source.c.total), else_=0)).label('expense')
+    ).group_by(source.c.month).subquery('monthly')
+    calendar = db.union_all(*(db.select(db.literal(month).label('month')) for month in months)) \
+        if len(months) > 1 else db.select(db.literal(months[0]).label('month'))
+    calendar = calendar.subquery('calendar')
+
+    series = db.select(
+        calendar.c.month,
+        db.func.coalesce(monthly.c.income, 0).label('income'),
+        db.func.coalesce(monthly.c.expense, 0).label('expense'),
+        (db.func.coalesce(monthly.c.income, 0) - db.func.coalesce(monthly.c.expense, 0)).label('profit')
+    ).select_from(calendar.outerjoin(monthly, monthly.c.month == calendar.c.month)).subquery('series')
+    lagged = db.select(
+        series,
+        db.func.lag(series.c.profit, db.literal_column('1')).over(order_by=series.c.month).label('previous_profit'),
+        db.func.lag(series.c.profit, db.literal_column('12')).over(order_by=series.c.month).label('year_ago_profit')
+    ).subquery('lagged')
+
+    def growth(previous):
+        return db.case((previous != 0, (lagged.c.profit - previous) * 100.0 / db.func.abs(previous)), else_=0)
+
+    rows = db.session.execute(
+        db.select(lagged.c.month, lagged.c.income, lagged.c.expense, lagged.c.profit,
+                  growth(lagged.c.previous_profit).label('mom_growth'),
+                  growth(lagged.c.year_ago_profit).label('yoy_growth'))
+        .order_by(lagged.c.month)
+    )
+    return [MonthlyStat(*row) for row in rows]
+
+ReportSeries = namedtuple('ReportSeries', ['income', 'expense', 'profit'])
+
+class FinancialReportData:
+    """报表数据：月度收支（含环比、同比）、分类汇总、排行和趋势序列，来自两条汇总查询（或列存引擎），不读取交易明细"""
+    def __init__(self, start_date, end_date):
+        self.start_date = start_date
+        self.end_date = end_date
+        # 报告期内全部日历月，没有数据的月份为 0
+        self.monthly_stats = period_monthly_stats(start_date, end_date)
+        self.months = [stat.month for stat in self.monthly_stats]
+        self.month_data = {stat.month: {'income': stat.income, 'expense': stat.expense} for stat in self.monthly_stats}
+        self.total_income = sum(stat.income for stat in self.monthly_stats)
+        self.total_expense = sum(stat.expense for stat in self.monthly_stats)
+        self.net_profit = self.total_income - self.total_expense
+        # 各月都补了 0 行，期间内没有交易时所有行的收支均为 0
+        self.has_transactions = any(stat.income or stat.expense for stat in self.monthly_stats)
+
+        # 类型 -> {分类名: 金额}，按金额从大到小排列
+        self.category_totals = {transaction_type: {} for transaction_type in BALANCE_SIGNS}
+        for name, transaction_type, total in sorted(period_category_totals(start_date, end_date), key=lambda row: -row[2]):
+            self.category_totals.setdefault(transaction_type, {})[name] = total
+
+    def series(self, months=None):
+        """各月收入、支出、利润序列，默认为报告期内全部月份"""
+        months = self.months if months is None else months
+        income = [self.month_data[month]['income'] for month in months]
+        expense = [self.month_data[month]['expense'] for month in months]
+        return ReportSeries(income, expense, [i - e for i, e in zip(income, expense)])
+
+    def top_categories(self, transaction_type, n=None):
+        """金额最大的前 n 个分类 [CategoryAmount]，n 为空时返回全部"""
+        items = [CategoryAmount(name, amount) for name, amount in self.category_totals.get(transaction_type, {}).items()]
+        return items if n is None else items[:n]
+
+# 财务分析服务：分析页面、财务数据导出和 PDF 报告都从 period_analytics 取同一份结果。
+# 以 (开始日期, 结束日期, 数据版本) 为键缓存，数据有变化时自然换用新键，不需要主动失效
+analytics_cache = LRUCache('analytics', app.config['ANALYTICS_CACHE_SIZE'])
+
+def period_data_version(start_date, end_date):
+    """报告期的数据版本：期间内各月的版本号和分类名称，交易或分类有变化时随之改变"""
+    months = report_months(start_date, end_date)
+    versions = db.session.query(TransactionMonthVersion.month, TransactionMonthVersion.version).filter(
+        TransactionMonthVersion.month.between(months[0], months[-1])
+    ).order_by(TransactionMonthVersion.month).all() if months else []
+    return (tuple(tuple(row) for row in versions),
+            tuple((category.id, category.name) for category in reference_categories()))
+
+def period_analytics(start_date, end_date):
+    """[start_date, end_date] 的财务分析结果（FinancialReportData），同一数据版本下只计算一次；结果只读"""
+    key = (start_date, end_date, period_data_version(start_date, end_date))
+    return analytics_cache.get_or_compute(key, lambda: FinancialReportData(start_date, end_date))
+
+# 仪表板聚合层：用少量分组查询一次性算出仪表板所需的全部数据
+CategoryStat = namedtuple('CategoryStat', ['name', 'total'])
+SupplierStat = namedtuple('SupplierStat', ['name', 'total'])
+CategoryAmount = namedtuple('CategoryAmount', ['name', 'amount'])
+RecentTransaction = namedtuple('RecentTransaction', ['id', 'date', 'type', 'amount', 'description', 'category_name'])
+
+def dashboard_summary(today):
+    """本月/本年/累计收支以及12个月、6年趋势，一次读取月度汇总表完成"""
+    current_month = today.strftime('%Y-%m')
+    year_start = f'{today.year}-01'
+    month_buckets = [month_floor(today, i).strftime('%Y-%m') for i in range(11, -1, -1)]
+    year_buckets = [today.year - offset for offset in range(5, -1, -1)]
+
+    rows = db.session.query(
+        TransactionMonthlyRollup.month,
+        TransactionMonthlyRollup.type,
+        db.func.sum(TransactionMonthlyRollup.total).label('total')
+    ).filter(
+        TransactionMonthlyRollup.type.in_(['income', 'expense']),
+        TransactionMonthlyRollup.count != 0
+    ).group_by(TransactionMonthlyRollup.month, TransactionMonthlyRollup.type).all()
+
+    totals = defaultdict(float)
+    for row in rows:
+        amount = float(row.total)
+        totals[('total', row.type)] += amount
+        totals[(row.month, row.type)] += amount
+        totals[(int(row.month[:4]), row.type)] += amount
+        if row.month >= current_month:
+            totals[('month', row.type)] += amount
+        if row.month >= year_start:
+            totals[('year', row.type)] += amount
+
+    return {
+        'month_income': totals[('month', 'income')],
+        'month_expense': totals[('month', 'expense')],
+        'year_income': totals[('year', 'income')],
+        'year_expense': totals[('year', 'expense')],
+        'total_income': totals[('total', 'income')],
+        'total_expense': totals[('total', 'expense')],
+        'trend_data': [{
+            'month': f'{month[5:]}月',
+            'income': totals[(month, 'income')],
+            'expense': totals[(month, 'expense')]
+        } for month in month_buckets],
+        'year_data': [{
+            'year': str(year),
+            'income': totals[(year, 'income')],
+            'expense': totals[(year, 'expense')]
+        } for year in year_buckets],
+    }
+
+def dashboard_category_stats(today):
+    """本月与本年的收支分类汇总，一条汇总表查询同时返回两个时间段"""
+    engine = ledger_engine()
+    if engine is not None:
+        return _ledger_category_stats(engine, today)
+    in_month = TransactionMonthlyRollup.month >= today.strftime('%Y-%m')
+    rows = db.session.query(
+        Category.name,
+        TransactionMonthlyRollup.type,
+        db.func.sum(db.case((in_month, TransactionMonthlyRollup.total), else_=0)).label('month_total'),
+        db.func.sum(db.case((in_month, TransactionMonthlyRollup.count), else_=0)).label('month_count'),
+        db.func.sum(TransactionMonthlyRollup.total).label('year_total')
+    ).join(Category, Category.id == TransactionMonthlyRollup.category_id).filter(
+        TransactionMonthlyRollup.month >= f'{today.year}-01',
+        TransactionMonthlyRollup.count != 0
+    ).group_by(Category.name, TransactionMonthlyRollup.type).order_by(Category.name).all()
+
+    stats = {'income': [], 'expense': [], 'year_income': [], 'year_expense': []}
+    for row in rows:
+        if row.type not in ('income', 'expense'):
+            continue
+        if row.month_count:
+            stats[row.type].append(CategoryStat(row.name, float(row.month_total)))
+        stats['year_' + row.type].append(CategoryStat(row.name, float(row.year_total)))
+    return {
+        'category_stats': stats['expense'],
+        'income_category_stats': stats['income'],
+        'expense_category_stats': stats['expense'],
+        'year_income_category_stats': stats['year_income'],
+        'year_expense_category_stats': stats['year_expense'],
+    }
+
+def _ledger_category_stats(engine, today):
+    """dashboard_category_stats 的列存引擎版本"""
+    names = {category.id: category.name for category in reference_categories()}
+    stats = {'income': [], 'expense': [], 'year_income': [], 'year_expense': []}
+    for prefix, start in (('', month_floor(today)), ('year_', datetime(today.year, 1, 1))):
+        totals = defaultdict(float)
+        for (transaction_type, category_id), total in _ledger_period_totals(engine, 'category', start, None).items():
+            if category_id in names:
+                totals[(names[category_id], transaction_type)] += total
+        for (name, transaction_type), total in sorted(totals.items()):
+            stats[prefix + transaction_type].append(CategoryStat(name, total))
+    return {
+        'category_stats': stats['expense'],
+        'income_category_stats': stats['income'],
+        'expense_category_stats': stats['expense'],
+        'year_income_category_stats': stats['year_income'],
+        'year_expense_category_stats': stats['year_expense'],
+    }
+
+def dashboard_supplier_stats(today, limit=5):
+    """本月支出最多的供应商"""
+    engine = ledger_engine()
+    if engine is not None:
+        names = {supplier.id: supplier.name for supplier in reference_suppliers()}
+        totals = defaultdict(float)
+        for (_, supplier_id), total in _ledger_period_totals(engine, 'supplier', month_floor(today), None,
+                                                            type='expense').items():
+            if supplier_id in names:
+                totals[names[supplier_id]] += total
+        return [SupplierStat(name, total) for name, total in sorted(totals.items(), key=lambda item: -item[1])[:limit]]
+    total = db.func.sum(TransactionMonthlyRollup.total).label('total')
+    return db.session.query(Supplier.name, total).join(
+        Supplier, Supplier.id == TransactionMonthlyRollup.supplier_id
+    ).filter(
+        TransactionMonthlyRollup.type == 'expense',
+        TransactionMonthlyRollup.month >= today.strftime('%Y-%m'),
+        TransactionMonthlyRollup.count != 0
+    ).group_by(Supplier.name).order_by(total.desc()).limit(limit).all()
+
+def dashboard_entity_counts():
+    """各实体数量，读取进程内计数器"""
+    counts = {}
+    for name, key in (('Transaction', 'transactions'), ('User', 'users'), ('Supplier', 'suppliers'),
+                      ('Product', 'products'), ('Category', 'categories')):
+        value = entity_counters.get(name)
+        counts['total_' + key] = value['total']
+        if name in ('User', 'Supplier', 'Product'):
+            counts['active_' + key] = value['active']
+    return counts
+
+def dashboard_receivables(user_id):
+    """当前用户的应收款汇总"""
+    totals = db.session.query(
+        db.func.coalesce(db.func.sum(Receivable.amount), 0).label('total'),
+        db.func.coalesce(db.func.sum(db.case((Receivable.status == 'received', Receivable.amount), else_=0)), 0).label('received')
+    ).filter(Receivable.user_id == user_id).one()
+    total_receivables = float(totals.total)
+    received_receivables = float(totals.received)
+    return {
+        'total_receivables': total_receivables,
+        'received_receivables': received_receivables,
+        'pending_receivables': total_receivables - received_receivables,
+    }
+
+def dashboard_recent_transactions(limit=10):
+    """最近交易，返回与会话无关的轻量记录，便于缓存"""
+    rows = db.session.query(
+        Transaction.id, Transaction.date, Transaction.type, Transaction.amount,
+        Transaction.description, Category.name.label('category_name')
+    ).outerjoin(Category, Category.id == Transaction.category_id).order_by(
+        Transaction.date.desc(), Transaction.id.desc()
+    ).limit(limit).all()
+    return [RecentTransaction(*row) for row in rows]
+
+def _stats_payload(stats):
+    return [{'name': stat.name, 'value': stat.total} for stat in stats]
+
+def _cached_dashboard_summary(today):
+    """摘要卡片与两张趋势图共用同一次汇总查询"""
+    return dashboard_cache.get_or_compute(('summary_data', today), lambda: dashboard_summary(today))
+
+def widget_summary(user, today):
+    summary = _cached_dashboard_summary(today)
+    return {
+        'month': {'income': summary['month_income'], 'expense': summary['month_expense'],
+                  'profit': summary['month_income'] - summary['month_expense']},
+        'year': {'income': summary['year_income'], 'expense': summary['year_expense'],
+                 'profit': summary['year_income'] - summary['year_expense']},
+        'cash_balance': balance_as_of()
+    }
+
+def widget_trend_month(user, today):
+    return _cached_dashboard_summary(today)['trend_data']
+
+def widget_trend_year(user, today):
+    return _cached_dashboard_summary(today)['year_data']
+
+def widget_category_pies(user, today):
+    stats = dashboard_category_stats(today)
+    return {
+        'month': {'income': _stats_payload(stats['income_category_stats']),
+                  'expense': _stats_payload(stats['expense_category_stats'])},
+        'year': {'income': _stats_payload(stats['year_income_category_stats']),
+                 'expense': _stats_payload(stats['year_expense_category_stats'])}
+    }
+
+def widget_suppliers(user, today):
+    return [{'name': row.name, 'value': float(row.total)} for row in dashboard_supplier_stats(today)]
+
+def widget_recent_transactions(user, today):
+    return [{
+        'id': row.id,
+        'date': row.date.strftime('%Y-%m-%d'),
+        'type': row.type,
+        'amount': row.amount,
+        'description': row.description or '',
+        'category_name': row.category_name or ''
+    } for row in dashboard_recent_transactions()]
+
+def widget_counts(user, today):
+    return dashboard_entity_counts()
+
+def widget_receivables(user, today):
+    return dashboard_receivables(user.id)
+
+# 仪表板小组件：名称 -> (计算函数, 是否按用户区分缓存)
+DASHBOARD_WIDGETS = {
+    'summary': (widget_summary, False),
+    'trend_month': (widget_trend_month, False),
+    'trend_year': (widget_trend_year, False),
+    'category_pies': (widget_category_pies, False),
+    'suppliers': (widget_suppliers, False),
+    'recent_transactions': (widget_recent_transactions, False),
+    'counts': (widget_counts, False),
+    'receivables': (widget_receivables, True),
+}
+
+dashboard_cache = LRUCache('dashboard', app.config['DASHBOARD_CACHE_SIZE'], app.config['DASHBOARD_CACHE_TTL'])
+dashboard_widget_timings = defaultdict(lambda: {'requests': 0, 'computed': 0, 'total_ms': 0.0, 'max_ms': 0.0})
+dashboard_timings_lock = threading.Lock()
+
+@on_data_changed('Transaction', 'Receivable', 'Supplier', 'Product', 'Category', 'User')
+def _invalidate_dashboard_cache(changed):
+    dashboard_cache.clear()
+
 @app.route('/')
 @app.route('/dashboard')
 @login_required
 def dashboard():
+    """仪表板外壳页面，各小组件数据在页面加载后通过 /api/dashboard/<widget> 获取"""
+    return render_template('dashboard.html')
+
+@app.route('/api/dashboard/<widget>')
+@login_required
+def api_dashboard_widget(widget):
+    """单个仪表板小组件的数据，独立缓存与计时"""
+    if widget not in DASHBOARD_WIDGETS:
+        return jsonify({'error': '未知的仪表板组件'}), 404
+    compute, per_user = DASHBOARD_WIDGETS[widget]
     today = datetime.now().date()
-    month_start = today.replace(day=1)
-    
-    # 本月收支统计
-    month_income = db.session.query(db.func.sum(Transaction.amount)).filter(
-        Transaction.type == 'income',
-        Transaction.date >= month_start
-    ).scalar() or 0
-    
-    month_expense = db.session.query(db.func.sum(Transaction.amount)).filter(
-        Transaction.type == 'expense',
-        Transaction.date >= month_start
-    ).scalar() or 0
-    
-    # 总体统计数据
-    total_transactions = Transaction.query.count()
-    total_users = User.query.count()
-    total_suppliers = Supplier.query.count()
-    total_products = Product.query.count()
-    total_categories = Category.query.count()
-    
-    # 活跃数据统计
-    active_suppliers = Supplier.query.count()
-    active_products = Product.query.filter_by(is_active=True).count()
-    active_users = User.query.filter_by(is_active=True).count()
-    
-    # 总收入支出统计
-    total_income = db.session.query(db.func.sum(Transaction.amount)).filter(
-        Transaction.type == 'income'
-    ).scalar() or 0
-    
-    total_expense = db.session.query(db.func.sum(Transaction.amount)).filter(
-        Transaction.type == 'expense'
-    ).scalar() or 0
-    
-    # 最近交易
-    recent_transactions = Transaction.query.order_by(Transaction.date.desc()).limit(10).all()
-    
-    # 分类统计
-    category_stats = db.session.query(
-        Category.name,
-        db.func.sum(Transaction.amount).label('total')
-    ).join(Transaction).filter(
-        Transaction.type == 'expense',
-        Transaction.date >= month_start
-    ).group_by(Category.name).all()
-    
-    # 供应商统计
-    supplier_stats = db.session.query(
-        Supplier.name,
-        db.func.sum(Transaction.amount).label('total')
-    ).join(Transaction).filter(
-        Transaction.type == 'expense',
-        Transaction.date >= month_start
-    ).group_by(Supplier.name).limit(5).all()
-    
-    # 应收款统计
-    receivables_list = Receivable.query.filter_by(user_id=current_user.id).all()
-    total_receivables = sum(r.amount for r in receivables_list)
-    received_receivables = sum(r.amount for r in receivables_list if r.status == 'received')
-    pending_receivables = total_receivables - received_receivables
-    
-    # 计算现金余额（总收入 - 总支出）
-    cash_balance = total_income - total_expense
-    
-    # 获取过去12个月的收支数据用于趋势图
-    trend_data = []
-    for i in range(12):
-        month_date = (today.replace(day=1) - timedelta(days=32*i)).replace(day=1)
-        next_month = (month_date.replace(day=28) + timedelta(days=4)).replace(day=1)
-        
-        month_income_trend = db.session.query(db.func.sum(Transaction.amount)).filter(
-            Transaction.type == 'income',
-            Transaction.date >= month_date,
-            Transaction.date < next_month
-        ).scalar() or 0
-        
-        month_expense_trend = db.session.query(db.func.sum(Transaction.amount)).filter(
-            Transaction.type == 'expense',
-            Transaction.date >= month_date,
-            Transaction.date < next_month
-        ).scalar() or 0
-        
-        trend_data.insert(0, {
-            'month': month_date.strftime('%m月'),
-            'income': float(month_income_trend),
-            'expense': float(month_expense_trend)
-        })
-    
-    # 获取收入分类数据用于饼图
-    income_category_stats = db.session.query(
-        Category.name,
-        db.func.sum(Transaction.amount).label('total')
-    ).join(Transaction).filter(
-        Transaction.type == 'income',
-        Transaction.date >= month_start
-    ).group_by(Category.name).all()
-    
-    # 获取支出分类数据用于饼图
-    expense_category_stats = db.session.query(
-        Category.name,
-        db.func.sum(Transaction.amount).label('total')
-    ).join(Transaction).filter(
-        Transaction.type == 'expense',
-        Transaction.date >= month_start
-    ).group_by(Category.name).all()
-    
-    # 本年收支统计
-    year_start = today.replace(month=1, day=1)
-    year_income = db.session.query(db.func.sum(Transaction.amount)).filter(
-        Transaction.type == 'income',
-        Transaction.date >= year_start
-    ).scalar() or 0
-    
-    year_expense = db.session.query(db.func.sum(Transaction.amount)).filter(
-        Transaction.type == 'expense',
-        Transaction.date >= year_start
-    ).scalar() or 0
-    
-    # 获取年度收入分类数据用于饼图
-    year_income_category_stats = db.session.query(
-        Category.name,
-        db.func.sum(Transaction.amount).label('total')
-    ).join(Transaction).filter(
-        Transaction.type == 'income',
-        Transaction.date >= year_start
-    ).group_by(Category.name).all()
-    
-    # 获取年度支出分类数据用于饼图
-    year_expense_category_stats = db.session.query(
-        Category.name,
-        db.func.sum(Transaction.amount).label('total')
-    ).join(Transaction).filter(
-        Transaction.type == 'expense',
-        Transaction.date >= year_start
-    ).group_by(Category.name).all()
-    
-    # 获取年度数据用于趋势图
-    current_year = today.year
-    year_data = []
-    
-    # 获取过去6年的数据
-    for year_offset in range(5, -1, -1):
-        target_year = current_year - year_offset
-        year_start_trend = datetime(target_year, 1, 1)
-        year_end_trend = datetime(target_year + 1, 1, 1)
-        
-        year_income_trend = db.session.query(db.func.sum(Transaction.amount)).filter(
-            Transaction.type == 'income',
-            Transaction.date >= year_start_trend,
-            Transaction.date < year_end_trend
-        ).scalar() or 0
-        
-        year_expense_trend = db.session.query(db.func.sum(Transaction.amount)).filter(
-            Transaction.type == 'expense',
-            Transaction.date >= year_start_trend,
-            Transaction.date < year_end_trend
-        ).scalar() or 0
-        
-        year_data.append({
-            'year': str(target_year),
-            'income': float(year_income_trend),
-            'expense': float(year_expense_trend)
-        })
-    
-    return render_template('dashboard.html', 
-                         month_income=month_income,
-                         month_expense=month_expense,
-                         year_income=year_income,
-                         year_expense=year_expense,
-                         recent_transactions=recent_transactions,
-                         category_stats=category_stats,
-                         supplier_stats=supplier_stats,
-                         total_transactions=total_transactions,
-                         total_users=total_users,
-                         total_suppliers=total_suppliers,
-                         total_products=total_products,
-                         total_categories=total_categories,
-                         active_suppliers=active_suppliers,
-                         active_products=active_products,
-                         active_users=active_users,
-                         total_income=total_income,
-                         total_expense=total_expense,
-                         total_receivables=total_receivables,
-                         received_receivables=received_receivables,
-                         pending_receivables=pending_receivables,
-                         cash_balance=cash_balance,
-                         trend_data=trend_data,
-                         year_data=year_data,
-                         income_category_stats=income_category_stats,
-                         expense_category_stats=expense_category_stats,
-                         year_income_category_stats=year_income_category_stats,
-                         year_expense_category_stats=year_expense_category_stats)
+    key = (widget, today, current_user.id if per_user else current_user.role)
 
-@app.route('/transactions')
+    started = time.perf_counter()
+    data = dashboard_cache.get(key)
+    computed = data is None
+    if computed:
+        data = compute(current_user, today)
+        dashboard_cache.set(key, data)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+
+    with dashboard_timings_lock:
+        timing = dashboard_widget_timings[widget]
+        timing['requests'] += 1
+        timing['total_ms'] += elapsed_ms
+        timing['max_ms'] = max(timing['max_ms'], elapsed_ms)
+        if computed:
+            timing['computed'] += 1
+
+    response = jsonify(data)
+    response.headers['Server-Timing'] = f'{widget};desc="{"miss" if computed else "hit"}";dur={elapsed_ms:.2f}'
+    response.headers['Cache-Control'] = 'private, no-cache'
+    response.add_etag()
+    return response.make_conditional(request)
+
+@app.route('/api/balance')
 @login_required
-def transactions():
-    page = request.args.get('page', 1, type=int)
-    
-    # 获取筛选参数
-    start_date = request.args.get('start_date')
-    end_date = request.args.get('end_date')
-    transaction_type = request.args.get('type')
-    category_id = request.args.get('category_id')
-    
-    # 构建查询
-    query = Transaction.query
-    
+def api_balance():
+    """余额查询：date 为截至日期（默认当前），同时提供 start 时返回期间余额变化"""
+    try:
+        end_day = datetime.strptime(request.args['date'], '%Y-%m-%d').date() if request.args.get('date') else None
+        start_day = datetime.strptime(request.args['start'], '%Y-%m-%d').date() if request.args.get('start') else None
+    except ValueError:
+        return jsonify({'error': '日期格式应为 YYYY-MM-DD'}), 400
+
+    result = {
+        'date': end_day.strftime('%Y-%m-%d') if end_day else None,
+        'balance': balance_as_of(end_day)
+    }
+    if start_day:
+        result['start'] = start_day.strftime('%Y-%m-%d')
+        result['change'] = balance_change(start_day, end_day)
+    return jsonify(result)
+
+@app.route('/api/dashboard_metrics')
+@admin_required
+def api_dashboard_metrics():
+    """各仪表板小组件的请求次数、实际计算次数与耗时"""
+    with dashboard_timings_lock:
+        widgets = {
+            name: dict(timing, avg_ms=round(timing['total_ms'] / timing['requests'], 3) if timing['requests'] else 0)
+            for name, timing in dashboard_widget_timings.items()
+        }
+    return jsonify({'widgets': widgets, 'cache': dashboard_cache.stats()})
+
+# 收支记录筛选与游标分页
+TRANSACTIONS_PER_PAGE = 20
+
+TransactionPage = namedtuple('TransactionPage', [
+    'items', 'per_page', 'has_prev', 'has_next', 'prev_cursor', 'next_cursor',
+    'total', 'income', 'expense'
+])
+
+def parse_transaction_filters(args):
+    """解析收支记录筛选参数，返回 (筛选条件列表, 回显到模板的筛选参数)"""
+    start_date = args.get('start_date')
+    end_date = args.get('end_date')
+    transaction_type = args.get('type')
+    category_id = args.get('category_id')
+    keyword = (args.get('q') or '').strip()
+    conditions = []
+
     # 日期范围筛选
     if start_date:
         try:
-            start_date_obj = datetime.strptime(start_date, '%Y-%m-%d')
-            query = query.filter(Transaction.date >= start_date_obj)
+            conditions.append(Transaction.date >= datetime.strptime(start_date, '%Y-%m-%d'))
         except ValueError:
             pass
-    
+
     if end_date:
         try:
-            end_date_obj = datetime.strptime(end_date, '%Y-%m-%d')
             # 包含结束日期的整天
-            end_date_obj = end_date_obj.replace(hour=23, minute=59, second=59)
-            query = query.filter(Transaction.date <= end_date_obj)
+            conditions.append(Transaction.date < datetime.strptime(end_date, '%Y-%m-%d') + timedelta(days=1))
         except ValueError:
             pass
-    
+
     # 交易类型筛选
     if transaction_type and transaction_type in ['income', 'expense']:
-        query = query.filter(Transaction.type == transaction_type)
-    
+        conditions.append(Transaction.type == transaction_type)
+
     # 分类筛选
     if category_id:
         try:
-            category_id_int = int(category_id)
-            query = query.filter(Transaction.category_id == category_id_int)
+            conditions.append(Transaction.category_id == int(category_id))
         except ValueError:
             pass
-    
-    # 排序和分页
-    transactions = query.order_by(Transaction.date.desc()).paginate(
-        page=page, per_page=20, error_out=False)
-    
-    categories = Category.query.all()
-    suppliers = Supplier.query.all()
-    products = Product.query.filter_by(is_active=True).all()
-    
-    # 传递当前筛选参数到模板
+
+    # 关键词搜索
+    if keyword:
+        conditions.append(transaction_search_condition(keyword))
+
     filter_params = {
         'start_date': start_date,
         'end_date': end_date,
         'type': transaction_type,
-        'category_id': category_id
+        'category_id': category_id,
+        'q': keyword
     }
+    return conditions, filter_params
+
+# SQLite 关键词检索使用的 FTS5 trigram 全文索引表：新建库时随交易表创建，已有库由 migrate.py 补建
+TRANSACTION_FTS_TABLE = 'transaction_fts'
+_transaction_fts_ready = False
+_transaction_fts_warned = False
+
+def create_transaction_fts(connection):
+    """建立（或重建）交易描述的 FTS5 全文索引表及同步触发器"""
+    for statement in db_backend.sqlite_fts_ddl(Transaction.__tablename__, TRANSACTION_FTS_TABLE,
+                                               ('description', 'supplier_description')):
+        connection.exec_driver_sql(statement)
+
+@event.listens_for(Transaction.__table__, 'after_create')
+def _create_transaction_fts(target, connection, **kw):
+    if db_backend.supports_trigram_fts(connection.dialect):
+        create_transaction_fts(connection)
+
+@event.listens_for(Transaction.__table__, 'before_drop')
+def _drop_transaction_fts(target, connection, **kw):
+    if connection.dialect.name == 'sqlite':
+        connection.exec_driver_sql(f'DROP TABLE IF EXISTS {TRANSACTION_FTS_TABLE}')
+
+def transaction_fts_table():
+    """可用的 SQLite 全文索引表名；不是 SQLite、版本不支持或尚未建立时为 None（检索退回全表扫描的 LIKE）"""
+    global _transaction_fts_ready, _transaction_fts_warned
+    if not db_backend.supports_trigram_fts(db.engine.dialect):
+        return None
+    if not _transaction_fts_ready:
+        _transaction_fts_ready = db.session.execute(
+            db.text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+            {'name': TRANSACTION_FTS_TABLE}).first() is not None
+        if not _transaction_fts_ready:
+            if not _transaction_fts_warned:
+                app.logger.warning('交易描述全文索引表 %s 不存在，关键词检索为全表扫描，请执行 python migrate.py',
+                                   TRANSACTION_FTS_TABLE)
+                _transaction_fts_warned = True
+            return None
+    return TRANSACTION_FTS_TABLE
+
+def transaction_search_condition(keyword):
+    """描述/供应商描述的关键词条件，多个词以空格分隔且需同时命中"""
+    return db_backend.keyword_condition(db.engine.dialect,
+                                        (Transaction.description, Transaction.supplier_description), keyword,
+                                        fts_table=transaction_fts_table(), id_column=Transaction.id)
+
+def encode_cursor(transaction_date, transaction_id, direction):
+    """把分页位置 (日期, id, 方向) 编码为不透明的游标"""
+    payload = json.dumps([transaction_date.isoformat(), transaction_id, direction])
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_cursor(token):
+    """解析游标，格式不正确时返回 None（回到第一页）"""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        date_text, transaction_id, direction = json.loads(base64.urlsafe_b64decode(padded).decode('utf-8'))
+        if direction not in ('next', 'prev'):
+            return None
+        return datetime.fromisoformat(date_text), int(transaction_id), direction
+    except (ValueError, TypeError, json.JSONDecodeError):
+        return None
+
+def keyset_page(query, cursor, per_page=TRANSACTIONS_PER_PAGE):
+    """按 (date, id) 倒序的游标分页，任意页的代价与第一页相同"""
+    if cursor and cursor[2] == 'prev':
+        cursor_date, cursor_id, _ = cursor
+        rows = query.filter(
+            db.tuple_(Transaction.date, Transaction.id) > db.tuple_(cursor_date, cursor_id)
+        ).order_by(Transaction.date.asc(), Transaction.id.asc()).limit(per_page + 1).all()
+        has_prev = len(rows) > per_page
+        items = list(reversed(rows[:per_page]))
+        has_next = True
+    else:
+        if cursor:
+            cursor_date, cursor_id, _ = cursor
+            # 行值比较可直接在 (date, id) 索引上定位，比展开成 OR 条件快得多
+            query = query.filter(
+                db.tuple_(Transaction.date, Transaction.id) < db.tuple_(cursor_date, cursor_id)
+            )
+        rows = query.order_by(Transaction.date.desc(), Transaction.id.desc()).limit(per_page + 1).all()
+        has_next = len(rows) > per_page
+        items = rows[:per_page]
+        has_prev = cursor is not None
+
+    prev_cursor = encode_cursor(items[0].date, items[0].id, 'prev') if items and has_prev else None
+    next_cursor = encode_cursor(items[-1].date, items[-1].id, 'next') if items and has_next else None
+    return items, has_prev, has_next, prev_cursor, next_cursor
+
+transaction_totals_cache = LRUCache('transaction_totals', 256, app.config['TRANSACTION_TOTALS_CACHE_TTL'])
+
+@on_data_changed('Transaction')
+def _invalidate_transaction_totals(changed):
+    transaction_totals_cache.clear()
+
+def transaction_filter_totals(conditions, filter_params):
+    """筛选结果的记录数与收入、支出小计，按筛选参数缓存，本进程交易写入后或 TTL 到期后失效"""
+    def compute():
+        if not any(filter_params.get(key) for key in ('start_date', 'end_date', 'q')):
+            # 不含日期和关键词条件时可直接读月度汇总表
+            rollup_conditions = [TransactionMonthlyRollup.count != 0]
+            if filter_params.get('type') in ('income', 'expense'):
+                rollup_conditions.append(TransactionMonthlyRollup.type == filter_params['type'])
+            if filter_params.get('category_id'):
+                try:
+                    rollup_conditions.append(TransactionMonthlyRollup.category_id == int(filter_params['category_id']))
+                except ValueError:
+                    pass
+            row = db.session.query(
+                db.func.coalesce(db.func.sum(TransactionMonthlyRollup.count), 0).label('total'),
+                db.func.coalesce(db.func.sum(db.case((TransactionMonthlyRollup.type == 'income', TransactionMonthlyRollup.total), else_=0)), 0).label('income'),
+                db.func.coalesce(db.func.sum(db.case((TransactionMonthlyRollup.type == 'expense', TransactionMonthlyRollup.total), else_=0)), 0).label('expense')
+            ).filter(*rollup_conditions).one()
+        else:
+            row = db.session.query(
+                db.func.count(Transaction.id).label('total'),
+                db.func.coalesce(db.func.sum(db.case((Transaction.type == 'income', Transaction.amount), else_=0)), 0).label('income'),
+                db.func.coalesce(db.func.sum(db.case((Transaction.type == 'expense', Transaction.amount), else_=0)), 0).label('expense')
+            ).filter(*conditions).one()
+        return int(row.total), float(row.income), float(row.expense)
+
+    key = tuple(sorted((k, v) for k, v in filter_params.items() if v))
+    return transaction_totals_cache.get_or_compute(key, compute)
+
+@app.route('/transactions')
+@login_required
+def transactions():
+    conditions, filter_params = parse_transaction_filters(request.args)
+    cursor = decode_cursor(request.args['cursor']) if request.args.get('cursor') else None
+
+    # 游标分页；总数与收支小计按筛选条件缓存
+    items, has_prev, has_next, prev_cursor, next_cursor = keyset_page(
+        Transaction.query.options(db.joinedload(Transaction.category)).filter(*conditions), cursor)
+    total, income, expense = transaction_filter_totals(conditions, filter_params)
+    transactions = TransactionPage(items, TRANSACTIONS_PER_PAGE, has_prev, has_next,
+                                   prev_cursor, next_cursor, total, income, expense)
+    
+    categories = reference_categories()
+    suppliers = reference_suppliers()
+    products = reference_active_products()
     
     return render_template('transactions.html', 
                          transactions=transactions, 
                          categories=categories, 
                          suppliers=suppliers, 
                          products=products,
-                         filter_params=filter_params)
+                         filter_params=filter_params,
+                         arrow_available=ARROW_AVAILABLE)
+
+# 收支记录导出：导出列与 IMPORT_COLUMNS 的前五列一致，导出文件可直接再导入
+EXPORT_HEADERS = ['交易日期', '交易类型', '分类', '金额', '备注信息']
+EXPORT_BATCH_SIZE = 1000
+
+def iter_export_rows(conditions):
+    """按导出顺序分批读取导出列，不构造 ORM 对象；yield_per 在 MySQL 上使用服务端游标"""
+    return db.session.query(
+        Transaction.date, Transaction.type, Category.name, Transaction.amount, Transaction.description
+    ).join(Category, Category.id == Transaction.category_id).filter(*conditions).order_by(
+        Transaction.date.desc(), Transaction.id.desc()
+    ).execution_options(yield_per=EXPORT_BATCH_SIZE)
+
+def iter_transactions_csv(conditions):
+    """逐批生成 CSV 文本，每批约 EXPORT_BATCH_SIZE 行"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_HEADERS)
+    for count, (date, transaction_type, category_name, amount, description) in enumerate(iter_export_rows(conditions), 1):
+        writer.writerow([
+            date.strftime('%Y-%m-%d'),
+            '收入' if transaction_type == 'income' else '支出',
+            category_name,
+            amount,
+            description or ''
+        ])
+        if count % EXPORT_BATCH_SIZE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+# Excel 导出：版式固定（蓝底白字居中表头，收入绿色、支出红色，固定列宽），直接写出 SpreadsheetML，
+# 行数据逐批写入 zip 条目，不在内存中保留单元格对象；由后台任务写到结果文件
+EXPORT_COLUMN_WIDTHS = [12, 10, 15, 12, 35]
+
+XLSX_XML_HEADER = '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+XLSX_MAIN_NS = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+XLSX_REL_NS = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+XLSX_STATIC_PARTS = {
+    '[Content_Types].xml': (
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '<Override PartName="/xl/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+        '</Types>'),
+    '_rels/.rels': (
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        f'<Relationship Id="rId1" Type="{XLSX_REL_NS}/officeDocument" Target="xl/workbook.xml"/>'
+        '</Relationships>'),
+    'xl/_rels/workbook.xml.rels': (
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        f'<Relationship Id="rId1" Type="{XLSX_REL_NS}/worksheet" Target="worksheets/sheet1.xml"/>'
+        f'<Relationship Id="rId2" Type="{XLSX_REL_NS}/styles" Target="styles.xml"/>'
+        '</Relationships>'),
+    # 共享样式：0 默认，1 表头，2 收入，3 支出
+    'xl/styles.xml': (
+        f'<styleSheet xmlns="{XLSX_MAIN_NS}">'
+        '<fonts count="4"><font><sz val="11"/><name val="Calibri"/></font>'
+        '<font><b/><sz val="11"/><color rgb="00FFFFFF"/><name val="Calibri"/></font>'
+        '<font><sz val="11"/><color rgb="0000B050"/><name val="Calibri"/></font>'
+        '<font><sz val="11"/><color rgb="00FF0000"/><name val="Calibri"/></font></fonts>'
+        '<fills count="3"><fill><patternFill patternType="none"/></fill><fill><patternFill patternType="gray125"/></fill>'
+        '<fill><patternFill patternType="solid"><fgColor rgb="004472C4"/><bgColor rgb="004472C4"/></patternFill></fill></fills>'
+        '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+        '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+        '<cellXfs count="4"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+        '<xf numFmtId="0" fontId="1" fillId="2" borderId="0" xfId="0" applyFont="1" applyFill="1" applyAlignment="1">'
+        '<alignment horizontal="center" vertical="center"/></xf>'
+        '<xf numFmtId="0" fontId="2" fillId="0" borderId="0" xfId="0" applyFont="1"/>'
+        '<xf numFmtId="0" fontId="3" fillId="0" borderId="0" xfId="0" applyFont="1"/></cellXfs>'
+        '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+        '</styleSheet>'),
+}
+XLSX_COLUMNS = 'ABCDE'
+# XML 1.0 不允许的控制字符
+XLSX_ILLEGAL_CHARS = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+def _xlsx_text(column, row_number, value, style=0):
+    text = escape(XLSX_ILLEGAL_CHARS.sub('', value))
+    style_attr = f' s="{style}"' if style else ''
+    return f'<c r="{column}{row_number}"{style_attr} t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+
+def write_transactions_xlsx(conditions, output, progress=None):
+    """收支记录写成 Excel 工作簿，output 为文件路径或文件对象；每写完一批调用 progress(已写行数)"""
+    with zipfile.ZipFile(output, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for name, body in XLSX_STATIC_PARTS.items():
+            archive.writestr(name, XLSX_XML_HEADER + body)
+        archive.writestr('xl/workbook.xml', XLSX_XML_HEADER + (
+            f'<workbook xmlns="{XLSX_MAIN_NS}" xmlns:r="{XLSX_REL_NS}">'
+            '<sheets><sheet name="收支记录" sheetId="1" r:id="rId1"/></sheets></workbook>'))
+
+        with archive.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as sheet:
+            cols = ''.join(f'<col min="{i}" max="{i}" width="{width}" customWidth="1"/>'
+                           for i, width in enumerate(EXPORT_COLUMN_WIDTHS, 1))
+            header = ''.join(_xlsx_text(column, 1, title, 1) for column, title in zip(XLSX_COLUMNS, EXPORT_HEADERS))
+            sheet.write((XLSX_XML_HEADER + f'<worksheet xmlns="{XLSX_MAIN_NS}"><cols>{cols}</cols>'
+                         f'<sheetData><row r="1">{header}</row>').encode('utf-8'))
+            chunk = []
+            for row_number, (date, transaction_type, category_name, amount, description) in enumerate(iter_export_rows(conditions), 2):
+                income = transaction_type == 'income'
+                chunk.append(
+                    f'<row r="{row_number}">'
+                    + _xlsx_text('A', row_number, date.strftime('%Y-%m-%d'))
+                    + _xlsx_text('B', row_number, '收入' if income else '支出', 2 if income else 3)
+                    + _xlsx_text('C', row_number, category_name or '')
+                    + f'<c r="D{row_number}"><v>{amount!r}</v></c>'
+                    + _xlsx_text('E', row_number, description or '')
+                    + '</row>')
+                if len(chunk) >= EXPORT_BATCH_SIZE:
+                    sheet.write(''.join(chunk).encode('utf-8'))
+                    chunk.clear()
+                    if progress:
+                        progress(row_number - 1)
+            sheet.write((''.join(chunk) + '</sheetData></worksheet>').encode('utf-8'))
+
+# 列式导出（Parquet / Arrow IPC）：供数据分析直接读取，列带类型；每批数据写成一个行组并立即发送
+ARROW_BATCH_SIZE = 50000
+ARROW_FORMATS = {
+    # 格式: (扩展名, MIME 类型)
+    'parquet': ('parquet', 'application/vnd.apache.parquet'),
+    'arrow': ('arrow', 'application/vnd.apache.arrow.stream'),
+}
+
+if ARROW_AVAILABLE:
+    LEDGER_SCHEMA = pa.schema([
+        ('id', pa.int64()),
+        ('date', pa.timestamp('us')),
+        ('type', pa.string()),
+        ('category', pa.string()),
+        ('amount', pa.float64()),
+        ('description', pa.string()),
+        ('supplier_id', pa.int64()),
+        ('product_id', pa.int64()),
+        ('quantity', pa.float64()),
+        ('unit_price', pa.float64()),
+    ])
+
+def iter_ledger_batches(conditions):
+    """按导出顺序读取明细列，每 ARROW_BATCH_SIZE 行组装成一个 RecordBatch"""
+    rows = db.session.query(
+        Transaction.id, Transaction.date, Transaction.type, Category.name, Transaction.amount,
+        Transaction.description, Transaction.supplier_id, Transaction.product_id,
+        Transaction.quantity, Transaction.unit_price
+    ).join(Category, Category.id == Transaction.category_id).filter(*conditions).order_by(
+        Transaction.date.desc(), Transaction.id.desc()
+    ).execution_options(yield_per=EXPORT_BATCH_SIZE)
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= ARROW_BATCH_SIZE:
+            yield _ledger_record_batch(batch)
+            batch = []
+    if batch:
+        yield _ledger_record_batch(batch)
+
+def _ledger_record_batch(rows):
+    columns = list(zip(*rows))
+    return pa.RecordBatch.from_arrays(
+        [pa.array(values, type=field.type) for values, field in zip(columns, LEDGER_SCHEMA)],
+        schema=LEDGER_SCHEMA)
+
+class ChunkSink(io.RawIOBase):
+    """只追加的输出目标：写入的数据暂存到取走为止，tell() 返回累计写入量（Parquet 页脚记录的偏移依赖它）"""
+
+    def __init__(self):
+        super().__init__()
+        self.chunks = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks.clear()
+        return data
+
+def iter_transactions_arrow(conditions, export_format):
+    """逐行组生成 Parquet 或 Arrow IPC 流，内存占用约为一个行组"""
+    sink = ChunkSink()
+    if export_format == 'parquet':
+        writer = pq.ParquetWriter(sink, LEDGER_SCHEMA, compression='zstd')
+    else:
+        writer = pa.ipc.new_stream(sink, LEDGER_SCHEMA, options=pa.ipc.IpcWriteOptions(compression='zstd'))
+    try:
+        for batch in iter_ledger_batches(conditions):
+            if export_format == 'parquet':
+                writer.write_batch(batch, row_group_size=ARROW_BATCH_SIZE)
+            else:
+                writer.write_batch(batch)
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
 
 @app.route('/export_transactions')
 @login_required
 def export_transactions():
     """导出收支记录为CSV文件"""
-    # 获取筛选参数
-    start_date = request.args.get('start_date')
-    end_date = request.args.get('end_date')
-    transaction_type = request.args.get('type')
-    category_id = request.args.get('category_id')
+    # 获取筛选参数（与transactions路由相同的逻辑）
+    conditions, filter_params = parse_transaction_filters(request.args)
     export_format = request.args.get('format', 'csv')  # 默认CSV格式
     
-    # 构建查询（与transactions路由相同的逻辑）
-    query = Transaction.query
-    
-    # 日期范围筛选
-    if start_date:
-        try:
-            start_date_obj = datetime.strptime(start_date, '%Y-%m-%d')
-            query = query.filter(Transaction.date >= start_date_obj)
-        except ValueError:
-            pass
-    
-    if end_date:
-        try:
-            end_date_obj = datetime.strptime(end_date, '%Y-%m-%d')
-            end_date_obj = end_date_obj.replace(hour=23, minute=59, second=59)
-            query = query.filter(Transaction.date <= end_date_obj)
-        except ValueError:
-            pass
-    
-    # 交易类型筛选
-    if transaction_type and transaction_type in ['income', 'expense']:
-        query = query.filter(Transaction.type == transaction_type)
-    
-    # 分类筛选
-    if category_id:
-        try:
-            category_id_int = int(category_id)
-            query = query.filter(Transaction.category_id == category_id_int)
-        except ValueError:
-            pass
-    
-    # 获取所有符合条件的交易记录
-    transactions = query.order_by(Transaction.date.desc()).all()
-    
     # 检查是否有数据
-    if not transactions:
+    if not db.session.query(Transaction.query.filter(*conditions).exists()).scalar():
         flash('没有符合条件的交易记录可以导出', 'warning')
         return redirect(url_for('transactions'))
     
     if export_format == 'csv':
-        # 创建CSV文件
-        output = io.StringIO()
-        writer = csv.writer(output)
-        
-        # 写入表头
-        writer.writerow(['交易日期', '交易类型', '分类', '金额', '备注信息'])
-        
-        # 写入数据
-        for transaction in transactions:
-            writer.writerow([
-                transaction.date.strftime('%Y-%m-%d'),
-                '收入' if transaction.type == 'income' else '支出',
-                transaction.category.name,
-                transaction.amount,
-                transaction.description or ''
-            ])
-        
-        # 创建响应
-        response = make_response(output.getvalue())
+        # 流式输出：逐批读取投影列并立即发送，内存占用与记录数无关
+        response = app.response_class(stream_with_context(iter_transactions_csv(conditions)),
+                                      mimetype='text/csv')
         response.headers['Content-Type'] = 'text/csv; charset=utf-8'
         
         # 生成文件名
         filename = f'transactions_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'
         filename_utf8 = f'收支记录_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'
-        response.headers['Content-Disposition'] = f'attachment; filename="{filename}"; filename*=UTF-8\'\'{filename_utf8.encode("utf-8").decode("latin1")}"'
+        response.headers['Content-Disposition'] = f'attachment; filename="{filename}"; filename*=UTF-8\'\'{quote(filename_utf8)}'
         
         return response
     
     elif export_format == 'excel':
-        if not EXCEL_AVAILABLE:
-            flash('Excel导出功能不可用，请安装openpyxl库', 'error')
+        # 工作簿由后台任务生成，页面跳转到任务进度，完成后下载
+        job_id = submit_job('transactions_excel', request.args.to_dict(), current_user.id)
+        return redirect(url_for('job_status', job_id=job_id))
+    
+    elif export_format in ARROW_FORMATS:
+        if not ARROW_AVAILABLE:
+            flash('Parquet/Arrow导出功能不可用，请安装pyarrow库', 'error')
             return redirect(url_for('transactions'))
         
-        # 创建Excel工作簿
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "收支记录"
-        
-        # 设置表头
-        headers = ['交易日期', '交易类型', '分类', '金额', '备注信息']
-        for col, header in enumerate(headers, 1):
-            cell = ws.cell(row=1, column=col, value=header)
-            cell.font = Font(bold=True, color="FFFFFF")
-            cell.fill = PatternFill(start_color="4472C4", end_color="4472C4", fill_type="solid")
-            cell.alignment = Alignment(horizontal="center", vertical="center")
-        
-        # 写入数据
-        for row, transaction in enumerate(transactions, 2):
-            ws.cell(row=row, column=1, value=transaction.date.strftime('%Y-%m-%d'))
-            ws.cell(row=row, column=2, value='收入' if transaction.type == 'income' else '支出')
-            ws.cell(row=row, column=3, value=transaction.category.name)
-            ws.cell(row=row, column=4, value=transaction.amount)
-            ws.cell(row=row, column=5, value=transaction.description or '')
-            
-            # 设置交易类型颜色
-            type_cell = ws.cell(row=row, column=2)
-            if transaction.type == 'income':
-                type_cell.font = Font(color="00B050")
-            else:
-                type_cell.font = Font(color="FF0000")
-        
-        # 调整列宽
-        column_widths = [12, 10, 15, 12, 35]
-        for col, width in enumerate(column_widths, 1):
-            ws.column_dimensions[ws.cell(row=1, column=col).column_letter].width = width
-        
-        # 保存到内存
-        output = io.BytesIO()
-        wb.save(output)
-        output.seek(0)
-        
-        # 创建响应
-        response = make_response(output.getvalue())
-        response.headers['Content-Type'] = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+        extension, mimetype = ARROW_FORMATS[export_format]
+        response = app.response_class(stream_with_context(iter_transactions_arrow(conditions, export_format)),
+                                      mimetype=mimetype)
         
         # 生成文件名
-        filename = f'transactions_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx'
-        filename_utf8 = f'收支记录_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx'
-        response.headers['Content-Disposition'] = f'attachment; filename="{filename}"; filename*=UTF-8\'\'{filename_utf8.encode("utf-8").decode("latin1")}"'
+        filename = f'transactions_{datetime.now().strftime("%Y%m%d_%H%M%S")}.{extension}'
+        filename_utf8 = f'收支记录_{datetime.now().strftime("%Y%m%d_%H%M%S")}.{extension}'
+        response.headers['Content-Disposition'] = f'attachment; filename="{filename}"; filename*=UTF-8\'\'{quote(filename_utf8)}'
         
         return response
     
@@ -626,6 +1890,435 @@ def export_transactions():
         flash('不支持的导出格式', 'error')
         return redirect(url_for('transactions'))
 
+# 收支记录批量导入：流式读取 CSV/XLSX，逐行校验后分批插入；列名与 export_transactions() 导出的表头一致
+IMPORT_BATCH_SIZE = 1000
+IMPORT_ERROR_LIMIT = 1000  # 错误报告最多保留的条数，超出部分只计数
+
+IMPORT_COLUMNS = {
+    '交易日期': 'date',
+    '交易类型': 'type',
+    '分类': 'category',
+    '金额': 'amount',
+    '备注信息': 'description',
+    '供应商描述': 'supplier_description',
+    '供应商': 'supplier',
+    '商品': 'product',
+    '数量': 'quantity',
+    '单价': 'unit_price',
+}
+IMPORT_REQUIRED = ('date', 'type', 'category', 'amount')
+IMPORT_TYPES = {'收入': 'income', '支出': 'expense', 'income': 'income', 'expense': 'expense'}
+IMPORT_DATE_FORMATS = ('%Y-%m-%d', '%Y-%m-%d %H:%M:%S', '%Y/%m/%d', '%Y/%m/%d %H:%M:%S')
+
+ImportResult = namedtuple('ImportResult', ['inserted', 'skipped', 'errors', 'error_count'])
+
+class TransactionImportError(ValueError):
+    """整个文件无法导入（格式不支持、缺少必需列等）"""
+
+def iter_import_rows(stream, filename, encoding='utf-8-sig'):
+    """逐行读取导入文件，产出 (行号, {字段: 值})；表头按 IMPORT_COLUMNS 映射，未知列忽略"""
+    extension = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+    workbook = None
+    if extension == 'csv':
+        rows = csv.reader(io.TextIOWrapper(stream, encoding=encoding, newline=''))
+    elif extension == 'xlsx':
+        if not EXCEL_AVAILABLE:
+            raise TransactionImportError('Excel导入功能不可用，请安装openpyxl库')
+        # 只读模式按需解析工作表，内存占用与文件行数无关
+        workbook = load_workbook(stream, read_only=True, data_only=True)
+        rows = workbook.active.iter_rows(values_only=True)
+    else:
+        raise TransactionImportError('仅支持 .csv 和 .xlsx 文件')
+
+    try:
+        header = next(rows, None)
+        fields = [IMPORT_COLUMNS.get(str(name).strip()) if name is not None else None for name in header or ()]
+        missing = [name for name, field in IMPORT_COLUMNS.items() if field in IMPORT_REQUIRED and field not in fields]
+        if missing:
+            raise TransactionImportError(f"缺少必需的列：{'、'.join(missing)}")
+
+        for line_number, row in enumerate(rows, 2):
+            values = {field: value for field, value in zip(fields, row) if field}
+            if any(value not in (None, '') for value in values.values()):
+                yield line_number, values
+    finally:
+        if workbook is not None:
+            workbook.close()
+
+def _import_text(value):
+    return str(value).strip() if value is not None else ''
+
+def _import_number(value, label, required=False, positive=False):
+    if value is None or _import_text(value) == '':
+        if required:
+            raise ValueError(f'{label}不能为空')
+        return None
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f'{label}不是有效数字：{value}')
+    # float 能解析 inf、nan、1e400 等，写入后汇总表和之后每一天的余额都会变成 inf/nan
+    if not math.isfinite(number):
+        raise ValueError(f'{label}不是有效数字：{value}')
+    if positive and number <= 0:
+        raise ValueError(f'{label}必须大于0')
+    return number
+
+def _import_date(value):
+    if isinstance(value, datetime):
+        return value
+    if hasattr(value, 'year'):
+        return datetime(value.year, value.month, value.day)
+    return _parse_import_date(_import_text(value))
+
+@lru_cache(maxsize=4096)
+def _parse_import_date(text):
+    # 同一文件中的日期大量重复，缓存解析结果
+    for date_format in IMPORT_DATE_FORMATS:
+        try:
+            return datetime.strptime(text, date_format)
+        except ValueError:
+            continue
+    raise ValueError(f'交易日期格式无效：{text or "（空）"}')
+
+class ImportLookup:
+    """导入时用到的名称 -> id 对照表，一次性载入内存"""
+    def __init__(self):
+        self.categories = defaultdict(list)
+        for category in reference_categories():
+            self.categories[category.name].append(category)
+        self.suppliers = {supplier.name: supplier.id for supplier in reference_suppliers()}
+        self.products = {name: id for id, name in db.session.query(Product.id, Product.name)}
+
+    def category_id(self, name, transaction_type):
+        matches = self.categories.get(name)
+        if not matches:
+            raise ValueError(f'分类不存在：{name}')
+        for category in matches:
+            if category.type == transaction_type:
+                return category.id
+        raise ValueError(f'分类“{name}”不属于{"收入" if transaction_type == "income" else "支出"}')
+
+    def optional_id(self, mapping, name, label):
+        if not name:
+            return None
+        if name not in mapping:
+            raise ValueError(f'{label}不存在：{name}')
+        return mapping[name]
+
+def parse_import_row(values, lookup, user_id):
+    """校验一行导入数据并转换为 Transaction 插入参数，有问题时抛出 ValueError"""
+    transaction_type = IMPORT_TYPES.get(_import_text(values.get('type')))
+    if transaction_type is None:
+        raise ValueError(f"交易类型无效：{_import_text(values.get('type')) or '（空）'}")
+    amount = _import_number(values.get('amount'), '金额', required=True, positive=True)
+    transaction_date = _import_date(values.get('date'))
+    month, day = date_buckets(transaction_date)
+    return {
+        'date': transaction_date,
+        'month': month,
+        'day_number': day,
+        'type': transaction_type,
+        'category_id': lookup.category_id(_import_text(values.get('category')), transaction_type),
+        'amount': amount,
+        'description': _import_text(values.get('description'))[:200],
+        'supplier_description': _import_text(values.get('supplier_description'))[:200],
+        'supplier_id': lookup.optional_id(lookup.suppliers, _import_text(values.get('supplier')), '供应商'),
+        'product_id': lookup.optional_id(lookup.products, _import_text(values.get('product')), '商品'),
+        'quantity': _import_number(values.get('quantity'), '数量'),
+        'unit_price': _import_number(values.get('unit_price'), '单价'),
+        'user_id': user_id,
+    }
+
+def import_transactions_file(stream, filename, user_id, encoding='utf-8-sig', dry_run=False):
+    """流式导入交易：有问题的行跳过并记入错误报告，其余行分批批量插入，最后一次性提交
+
+    批量插入不经过 ORM flush，汇总表、每日余额、实体计数和缓存失效在这里统一登记。
+    """
+    lookup = ImportLookup()
+    deltas = TransactionDeltas()
+    batch = []
+    inserted = skipped = error_count = 0
+    errors = []
+
+    def flush_batch():
+        if batch and not dry_run:
+            # 直接用表级 INSERT 执行 executemany，省去 ORM 批量插入的逐行处理
+            db.session.execute(Transaction.__table__.insert(), batch)
+            deltas.add(TransactionSnapshot(row['date'], row['type'], row['amount'], row['category_id'],
+                                           row['supplier_id'], row['product_id']) for row in batch)
+        batch.clear()
+
+    try:
+        for line_number, values in iter_import_rows(stream, filename, encoding):
+            try:
+                batch.append(parse_import_row(values, lookup, user_id))
+            except ValueError as e:
+                skipped += 1
+                error_count += 1
+                if len(errors) < IMPORT_ERROR_LIMIT:
+                    errors.append((line_number, str(e)))
+                continue
+            inserted += 1
+            if len(batch) >= IMPORT_BATCH_SIZE:
+                flush_batch()
+        flush_batch()
+
+        if inserted and not dry_run:
+            apply_transaction_deltas(deltas)
+            stage_counter_delta('Transaction', total=inserted, active=inserted)
+            mark_data_changed('Transaction')
+            db.session.commit()
+    except UnicodeDecodeError:
+        db.session.rollback()
+        raise TransactionImportError(f'文件不是 {encoding} 编码，请另存为 UTF-8 后重试')
+    except Exception:
+        db.session.rollback()
+        raise
+    return ImportResult(inserted, skipped, errors, error_count)
+
+@app.route('/import_transactions', methods=['GET', 'POST'])
+@edit_required
+def import_transactions():
+    """上传 CSV/XLSX 批量导入收支记录"""
+    result = None
+    if request.method == 'POST':
+        file = request.files.get('file')
+        if not file or not file.filename:
+            flash('请选择要导入的文件', 'error')
+            return redirect(url_for('import_transactions'))
+        try:
+            result = import_transactions_file(file.stream, file.filename, current_user.id,
+                                              dry_run=request.form.get('dry_run') == '1')
+        except TransactionImportError as e:
+            flash(str(e), 'error')
+            return redirect(url_for('import_transactions'))
+        if request.form.get('dry_run') == '1':
+            flash(f'校验完成：{result.inserted} 行可导入，{result.skipped} 行有问题', 'info')
+        elif result.inserted:
+            flash(f'成功导入 {result.inserted} 条记录，跳过 {result.skipped} 行', 'success')
+        else:
+            flash('没有可导入的记录', 'warning')
+    return render_template('import_transactions.html', result=result, error_limit=IMPORT_ERROR_LIMIT,
+                           columns=list(IMPORT_COLUMNS))
+
+# 收支记录批量接口：供收银机、移动端用 API 令牌一次提交多条新增/修改/删除，全部在同一事务内完成
+API_BATCH_LIMIT = 5000
+API_TRANSACTION_FIELDS = ('date', 'type', 'amount', 'category_id', 'description', 'supplier_description',
+                          'supplier_id', 'product_id', 'quantity', 'unit_price')
+
+ApiPrincipal = namedtuple('ApiPrincipal', ['token_id', 'user_id', 'role'])
+
+api_token_cache = LRUCache('api_tokens', 256, app.config['API_TOKEN_CACHE_TTL'])
+
+@on_data_changed('ApiToken', 'User')
+def _invalidate_api_tokens(changed):
+    api_token_cache.clear()
+
+def hash_api_token(token):
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+def create_api_token(name, user_id):
+    """生成新令牌并保存摘要，返回明文令牌（只在此时可见）"""
+    token = secrets.token_urlsafe(32)
+    db.session.add(ApiToken(name=name, token_hash=hash_api_token(token), user_id=user_id))
+    db.session.commit()
+    return token
+
+def _lookup_api_token(token_hash):
+    row = db.session.query(ApiToken.id, User.id, User.role).join(User, User.id == ApiToken.user_id).filter(
+        ApiToken.token_hash == token_hash,
+        ApiToken.is_active == True,
+        User.is_active == True
+    ).first()
+    return ApiPrincipal(*row) if row else None
+
+def api_token_required(f):
+    """校验 Authorization: Bearer <令牌>，通过后把调用方放在 g.api_principal；不经过会话登录和 load_user"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+        if scheme.lower() != 'bearer' or not token.strip():
+            return jsonify({'success': False, 'message': '缺少 API 令牌'}), 401
+        token_hash = hash_api_token(token.strip())
+        principal = api_token_cache.get_or_compute(token_hash, lambda: _lookup_api_token(token_hash))
+        if principal is None:
+            return jsonify({'success': False, 'message': 'API 令牌无效或已停用'}), 401
+        if principal.role == 'employee':
+            return jsonify({'success': False, 'message': '员工权限不足，只能查看数据'}), 403
+        g.api_principal = principal
+        return f(*args, **kwargs)
+    return decorated_function
+
+def _api_date(value):
+    if not isinstance(value, str):
+        raise ValueError('date 必须是 YYYY-MM-DD 或 ISO 8601 格式的字符串')
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f'date 格式无效：{value}')
+
+def _api_number(data, field, required=False):
+    value = data.get(field)
+    if value is None:
+        if required:
+            raise ValueError(f'缺少 {field}')
+        return None
+    # JSON 解析会接受 NaN、Infinity，这里一并拒绝
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+        raise ValueError(f'{field} 必须是数字')
+    return float(value)
+
+def _api_id(data, field, valid_ids, label):
+    value = data.get(field)
+    if value is None:
+        return None
+    if isinstance(value, bool) or not isinstance(value, int) or value not in valid_ids:
+        raise ValueError(f'{label}不存在：{value}')
+    return value
+
+def parse_api_transaction(data, lookup, current=None):
+    """校验接口提交的一条交易字段，返回可直接赋给 Transaction 的字段；current 为修改前的值"""
+    if not isinstance(data, dict):
+        raise ValueError('data 必须是对象')
+    unknown = set(data) - set(API_TRANSACTION_FIELDS)
+    if unknown:
+        raise ValueError(f"不支持的字段：{', '.join(sorted(unknown))}")
+    merged = dict(current or {}, **data)
+    for field in ('date', 'type', 'amount', 'category_id'):
+        if merged.get(field) is None:
+            raise ValueError(f'缺少 {field}')
+    values = {}
+    if 'date' in data:
+        values['date'] = _api_date(data['date'])
+    if merged['type'] not in BALANCE_SIGNS:
+        raise ValueError('type 必须是 income 或 expense')
+    values['type'] = merged['type']
+    if 'amount' in data:
+        values['amount'] = _api_number(data, 'amount', required=True)
+        if values['amount'] <= 0:
+            raise ValueError('amount 必须大于0')
+    category = lookup['categories'].get(merged['category_id'])
+    if category is None:
+        raise ValueError(f"分类不存在：{merged['category_id']}")
+    if category.type != merged['type']:
+        raise ValueError(f'分类“{category.name}”与交易类型不符')
+    values['category_id'] = category.id
+    for field in ('description', 'supplier_description'):
+        if field in data:
+            values[field] = str(data[field] or '')[:200]
+    if 'supplier_id' in data:
+        values['supplier_id'] = _api_id(data, 'supplier_id', lookup['suppliers'], '供应商')
+    if 'product_id' in data:
+        values['product_id'] = _api_id(data, 'product_id', lookup['products'], '商品')
+    for field in ('quantity', 'unit_price'):
+        if field in data:
+            values[field] = _api_number(data, field)
+    return values
+
+@app.route('/api/transactions/batch', methods=['POST'])
+@api_token_required
+def api_transactions_batch():
+    """批量新增/修改/删除交易
+
+    请求体：{"items": [{"op": "create", "data": {...}}, {"op": "update", "id": 1, "data": {...}},
+                      {"op": "delete", "id": 2}]}
+    先校验全部条目，任意一条有误则整批不写入并返回 422；全部通过后在一个事务内写入。
+    """
+    payload = request.get_json(silent=True)
+    items = payload.get('items') if isinstance(payload, dict) else None
+    if not isinstance(items, list) or not items:
+        return jsonify({'success': False, 'message': '请求体需包含非空的 items 数组'}), 400
+    if len(items) > API_BATCH_LIMIT:
+        return jsonify({'success': False, 'message': f'单次最多提交 {API_BATCH_LIMIT} 条'}), 400
+
+    # 一次性载入校验所需的对照数据和待修改/删除的交易
+    target_ids = {item.get('id') for item in items
+                  if isinstance(item, dict) and isinstance(item.get('id'), int) and not isinstance(item.get('id'), bool)}
+    referenced = defaultdict(set)
+    for item in items:
+        data = item.get('data') if isinstance(item, dict) else None
+        if isinstance(data, dict):
+            for field in ('supplier_id', 'product_id'):
+                if isinstance(data.get(field), int):
+                    referenced[field].add(data[field])
+    lookup = {
+        'categories': {category.id: category for category in reference_categories()},
+        'suppliers': {row.id for row in db.session.query(Supplier.id).filter(Supplier.id.in_(referenced['supplier_id']))}
+        if referenced['supplier_id'] else set(),
+        'products': {row.id for row in db.session.query(Product.id).filter(Product.id.in_(referenced['product_id']))}
+        if referenced['product_id'] else set(),
+    }
+    existing = {transaction.id: transaction for transaction in
+                Transaction.query.filter(Transaction.id.in_(target_ids))} if target_ids else {}
+
+    results = []
+    planned = []
+    seen_ids = set()
+    for index, item in enumerate(items):
+        op = item.get('op') if isinstance(item, dict) else None
+        try:
+            if op == 'create':
+                values = parse_api_transaction(item.get('data'), lookup)
+                planned.append((index, op, None, values))
+            elif op in ('update', 'delete'):
+                transaction = existing.get(item.get('id'))
+                if transaction is None:
+                    raise ValueError(f"交易不存在：{item.get('id')}")
+                if transaction.id in seen_ids:
+                    raise ValueError(f'同一批次中重复操作交易：{transaction.id}')
+                seen_ids.add(transaction.id)
+                values = None
+                if op == 'update':
+                    current = {field: getattr(transaction, field) for field in ('type', 'category_id', 'date', 'amount')}
+                    values = parse_api_transaction(item.get('data'), lookup, current)
+                planned.append((index, op, transaction, values))
+            else:
+                raise ValueError('op 必须是 create、update 或 delete')
+            results.append({'index': index, 'status': 'ok'})
+        except ValueError as e:
+            results.append({'index': index, 'status': 'error', 'message': str(e)})
+
+    if any(result['status'] == 'error' for result in results):
+        return jsonify({'success': False, 'message': '部分条目校验未通过，整批未写入', 'results': results}), 422
+
+    deltas = TransactionDeltas()
+    created = []
+    try:
+        for index, op, transaction, values in planned:
+            if op == 'create':
+                transaction = Transaction(user_id=g.api_principal.user_id, **values)
+                db.session.add(transaction)
+                created.append((index, transaction))
+                deltas.add([transaction_snapshot(transaction)])
+            elif op == 'update':
+                previous = transaction_snapshot(transaction)
+                for field, value in values.items():
+                    setattr(transaction, field, value)
+                deltas.replace(previous, transaction_snapshot(transaction))
+                results[index].update(status='updated', id=transaction.id)
+            else:
+                deltas.add([transaction_snapshot(transaction)], -1)
+                db.session.delete(transaction)
+                results[index].update(status='deleted', id=transaction.id)
+        db.session.flush()
+        # 在提交前取新记录的 id，提交后属性过期，逐条访问会触发刷新查询
+        for index, transaction in created:
+            results[index].update(status='created', id=transaction.id)
+        apply_transaction_deltas(deltas)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        # 异常信息含 SQL 语句和参数，只记入日志，不返回给调用方
+        app.logger.exception('交易批量接口写入失败')
+        return jsonify({'success': False, 'message': '写入失败，请稍后重试'}), 500
+
+    counts = defaultdict(int)
+    for result in results:
+        counts[result['status']] += 1
+    return jsonify({'success': True, 'created': counts['created'], 'updated': counts['updated'],
+                    'deleted': counts['deleted'], 'results': results})
+
 @app.route('/add_transaction', methods=['GET', 'POST'])
 @edit_required
 def add_transaction():
@@ -666,16 +2359,17 @@ def add_transaction():
 
         )
         db.session.add(transaction)
+        record_transaction_changes(added=[transaction_snapshot(transaction)])
         db.session.commit()
         flash('交易记录添加成功！', 'success')
         return redirect(url_for('transactions'))
     
     # 获取所有分类，让前端JavaScript根据类型过滤
     transaction_type = request.args.get('type', 'expense')
-    categories = Category.query.all()
+    categories = reference_categories()
     
-    suppliers = Supplier.query.all()
-    products = Product.query.filter_by(is_active=True).all()
+    suppliers = reference_suppliers()
+    products = reference_active_products()
     today = datetime.now().strftime('%Y-%m-%d')
     return render_template('add_transaction.html', categories=categories, suppliers=suppliers, products=products, today=today, transaction_type=transaction_type)
 
@@ -685,6 +2379,7 @@ def edit_transaction(id):
     transaction = Transaction.query.get_or_404(id)
     
     if request.method == 'POST':
+        previous = transaction_snapshot(transaction)
         transaction.amount = float(request.form['amount'])
         transaction.type = request.form['type']
         transaction.description = request.form['description']
@@ -692,16 +2387,14 @@ def edit_transaction(id):
         transaction.category_id = int(request.form['category_id'])
         transaction.date = datetime.strptime(request.form['date'], '%Y-%m-%d')
         
-
-
-        
+        record_transaction_changes(removed=[previous], added=[transaction_snapshot(transaction)])
         db.session.commit()
         flash('交易记录更新成功！', 'success')
         return redirect(url_for('transactions'))
     
-    categories = Category.query.all()
-    suppliers = Supplier.query.all()
-    products = Product.query.filter_by(is_active=True).all()
+    categories = reference_categories()
+    suppliers = reference_suppliers()
+    products = reference_active_products()
     return render_template('edit_transaction.html', transaction=transaction, categories=categories, suppliers=suppliers, products=products)
 
 @app.route('/delete_transaction/<int:id>', methods=['GET', 'POST'])
@@ -710,6 +2403,7 @@ def delete_transaction(id):
     transaction = Transaction.query.get_or_404(id)
     
     db.session.delete(transaction)
+    record_transaction_changes(removed=[transaction_snapshot(transaction)])
     db.session.commit()
     flash('交易记录删除成功！', 'success')
     
@@ -764,7 +2458,7 @@ def delete_category(id):
     category = Category.query.get_or_404(id)
     
     # 检查是否有关联的交易
-    if category.transactions:
+    if has_related(Transaction.category_id == category.id):
         flash('无法删除：该分类下有关联的交易记录', 'error')
     else:
         db.session.delete(category)
@@ -876,7 +2570,7 @@ def delete_supplier(id):
     supplier = Supplier.query.get_or_404(id)
     
     # 检查是否有关联的交易或商品
-    if supplier.transactions or supplier.product_list:
+    if has_related(Transaction.supplier_id == supplier.id) or has_related(Product.supplier_id == supplier.id):
         flash('无法删除：该供应商下有关联的交易记录或商品', 'error')
     else:
         # 删除供应商图片
@@ -897,8 +2591,7 @@ def delete_supplier(id):
 @login_required
 def api_products():
     """获取所有商品名称，用于供货品类选择"""
-    products = Product.query.filter_by(is_active=True).all()
-    product_names = [product.name for product in products]
+    product_names = [product.name for product in reference_active_products()]
     return jsonify(product_names)
 
 @app.route('/api/product/<int:id>')
@@ -1111,9 +2804,11 @@ def api_delete_supplier_image(supplier_id, image_id):
 @login_required
 def products():
     products = Product.query.all()
-    suppliers = Supplier.query.all()
-    categories = Category.query.all()
-    return render_template('products.html', products=products, suppliers=suppliers, categories=categories)
+    suppliers = reference_suppliers()
+    categories = reference_categories()
+    product_count = entity_counters.get('Product')
+    return render_template('products.html', products=products, suppliers=suppliers, categories=categories,
+                           product_count=product_count)
 
 @app.route('/add_product', methods=['GET', 'POST'])
 @edit_required
@@ -1136,7 +2831,7 @@ def add_product():
             if is_ajax:
                 return jsonify({'success': False, 'message': '商品名称已存在'}), 400
             flash('商品名称已存在', 'error')
-            suppliers = Supplier.query.all()
+            suppliers = reference_suppliers()
             return render_template('add_product.html', suppliers=suppliers)
         
         # 处理图片上传
@@ -1160,7 +2855,7 @@ def add_product():
                     if is_ajax:
                         return jsonify({'success': False, 'message': f'图片上传失败: {str(e)}'}), 500
                     flash(f'图片上传失败: {str(e)}', 'error')
-                    suppliers = Supplier.query.all()
+                    suppliers = reference_suppliers()
                     return render_template('add_product.html', suppliers=suppliers)
         
         product = Product(
@@ -1183,8 +2878,8 @@ def add_product():
         flash('商品添加成功！', 'success')
         return redirect(url_for('products'))
     
-    suppliers = Supplier.query.all()
-    categories = Category.query.all()  # 添加分类数据
+    suppliers = reference_suppliers()
+    categories = reference_categories()  # 添加分类数据
     return render_template('add_product.html', suppliers=suppliers, categories=categories)
 
 @app.route('/edit_product/<int:id>', methods=['GET', 'POST'])
@@ -1262,7 +2957,7 @@ def edit_product(id):
             else:
                 flash(error_message, 'error')
     
-    suppliers = Supplier.query.all()
+    suppliers = reference_suppliers()
     return render_template('edit_product.html', product=product, suppliers=suppliers)
 
 @app.route('/delete_product/<int:id>')
@@ -1273,7 +2968,7 @@ def delete_product(id):
     # 检查是否为AJAX请求
     if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
         # 检查是否有关联的交易
-        if product.transactions:
+        if has_related(Transaction.product_id == product.id):
             return jsonify({'success': False, 'message': '无法删除：该商品下有关联的交易记录'})
         else:
             try:
@@ -1285,7 +2980,7 @@ def delete_product(id):
                 return jsonify({'success': False, 'message': f'删除失败：{str(e)}'})
     else:
         # 非AJAX请求，保持原有逻辑
-        if product.transactions:
+        if has_related(Transaction.product_id == product.id):
             flash('无法删除：该商品下有关联的交易记录', 'error')
         else:
             db.session.delete(product)
@@ -1423,43 +3118,23 @@ def delete_user(id):
 def statistics():
     """财务分析页面 - 增强版本"""
     try:
-        # 获取筛选参数
-        start_date = request.args.get('start_date')
-        end_date = request.args.get('end_date')
+        # 获取筛选参数（默认最近12个月）
+        start_date_obj, end_date_obj = parse_report_period(request.args)
+        start_date = start_date_obj.strftime('%Y-%m-%d')
+        end_date = end_date_obj.strftime('%Y-%m-%d')
         
         # 获取当前日期
         today = datetime.now().date()
         month_start = today.replace(day=1)
         
-        # 设置默认时间范围（最近12个月）
-        if not start_date:
-            default_start = today - timedelta(days=365)
-            start_date = default_start.strftime('%Y-%m-%d')
-        if not end_date:
-            end_date = today.strftime('%Y-%m-%d')
-            
-        # 转换日期
-        try:
-            start_date_obj = datetime.strptime(start_date, '%Y-%m-%d').date()
-            end_date_obj = datetime.strptime(end_date, '%Y-%m-%d').date()
-        except ValueError:
-            start_date_obj = today - timedelta(days=365)
-            end_date_obj = today
+        # 报告期分析结果（与财务数据导出、PDF 报告共用缓存）
+        analytics = period_analytics(start_date_obj, end_date_obj)
         
         # 基础财务数据（基于选定时间范围）
-        total_income = db.session.query(db.func.sum(Transaction.amount)).filter(
-            Transaction.type == 'income',
-            Transaction.date >= start_date_obj,
-            Transaction.date <= end_date_obj
-        ).scalar() or 0
-        
-        total_expense = db.session.query(db.func.sum(Transaction.amount)).filter(
-            Transaction.type == 'expense',
-            Transaction.date >= start_date_obj,
-            Transaction.date <= end_date_obj
-        ).scalar() or 0
-        
-        net_assets = total_income - total_expense
+        total_income = analytics.total_income
+        total_expense = analytics.total_expense
+        
+        net_assets = analytics.net_profit
         liability_ratio = (total_expense / total_income * 100) if total_income > 0 else 0
         
         # 财务健康度评分
@@ -1468,85 +3143,14 @@ def statistics():
         else:
             health_score = 0
         
-        # 获取月度统计数据
-        monthly_stats = db.session.query(
-            db.func.date_format(Transaction.date, '%Y-%m').label('month'),
-            Transaction.type,
-            db.func.sum(Transaction.amount).label('total')
-        ).filter(
-            Transaction.date >= start_date_obj,
-            Transaction.date <= end_date_obj
-        ).group_by(
-            db.func.date_format(Transaction.date, '%Y-%m'),
-            Transaction.type
-        ).order_by('month').all()
-        
-        # 处理趋势数据
-        month_data = defaultdict(lambda: {'income': 0, 'expense': 0})
-        for stat in monthly_stats:
-            month_data[stat.month][stat.type] = stat.total
-        
-        trend_months = []
-        trend_income = []
-        trend_expense = []
-        trend_profit = []
-        monthly_data = []
-        
-        # 计算环比和同比增长
-        sorted_months = sorted(month_data.keys())
-        for i, month in enumerate(sorted_months):
-            income = month_data[month]['income']
-            expense = month_data[month]['expense']
-            profit = income - expense
-            
-            # 环比增长（与上月比较）
-            mom_growth = 0
-            if i > 0:
-                prev_month = sorted_months[i-1]
-                prev_profit = month_data[prev_month]['income'] - month_data[prev_month]['expense']
-                if prev_profit != 0:
-                    mom_growth = ((profit - prev_profit) / abs(prev_profit)) * 100
-            
-            # 同比增长（与去年同月比较）
-            yoy_growth = 0
-            year_ago_month = f"{int(month[:4])-1}-{month[5:]}"
-            if year_ago_month in month_data:
-                year_ago_profit = month_data[year_ago_month]['income'] - month_data[year_ago_month]['expense']
-                if year_ago_profit != 0:
-                    yoy_growth = ((profit - year_ago_profit) / abs(year_ago_profit)) * 100
-            
-            trend_months.append(month)
-            trend_income.append(income)
-            trend_expense.append(expense)
-            trend_profit.append(profit)
-            
-            monthly_data.append({
-                'date': month,
-                'income': income,
-                'expense': expense,
-                'profit': profit,
-                'mom_growth': mom_growth,
-                'yoy_growth': yoy_growth
-            })
+        # 趋势数据与月度明细（含环比、同比增长）
+        trend_months = analytics.months
+        trend_income, trend_expense, trend_profit = analytics.series()
+        monthly_data = analytics.monthly_stats
         
-        # 收支分类数据（基于选定时间范围）
-        income_categories = db.session.query(
-            Category.name,
-            db.func.sum(Transaction.amount).label('amount')
-        ).join(Transaction).filter(
-            Transaction.type == 'income',
-            Transaction.date >= start_date_obj,
-            Transaction.date <= end_date_obj
-        ).group_by(Category.name).all()
-        
-        expense_categories = db.session.query(
-            Category.name,
-            db.func.sum(Transaction.amount).label('amount')
-        ).join(Transaction).filter(
-            Transaction.type == 'expense',
-            Transaction.date >= start_date_obj,
-            Transaction.date <= end_date_obj
-        ).group_by(Category.name).all()
+        # 收支分类数据（基于选定时间范围，按金额从大到小）
+        income_categories = analytics.top_categories('income')
+        expense_categories = analytics.top_categories('expense')
         
         # 饼图数据
         income_colors = ['#57B5E7', '#8DD3C7', '#9333EA', '#FB923C', '#F59E0B']
@@ -1571,34 +3175,17 @@ def statistics():
         ]
         
         # 现金流瀑布图数据（简化版）
-        # 本月数据
-        current_month_income = db.session.query(db.func.sum(Transaction.amount)).filter(
-            Transaction.type == 'income',
-            Transaction.date >= month_start,
-            Transaction.date <= today
-        ).scalar() or 0
-        
-        current_month_expense = db.session.query(db.func.sum(Transaction.amount)).filter(
-            Transaction.type == 'expense',
-            Transaction.date >= month_start,
-            Transaction.date <= today
-        ).scalar() or 0
+        # 本月与上月数据（一次查询）
+        last_month_start = (month_start - timedelta(days=1)).replace(day=1)
+        recent_months = period_monthly_totals(last_month_start, today)
+        current_month = recent_months[month_start.strftime('%Y-%m')]
+        current_month_income = current_month['income']
+        current_month_expense = current_month['expense']
         
         # 上月结余（简化计算）
-        last_month_end = month_start - timedelta(days=1)
-        last_month_start = last_month_end.replace(day=1)
-        
-        last_month_income = db.session.query(db.func.sum(Transaction.amount)).filter(
-            Transaction.type == 'income',
-            Transaction.date >= last_month_start,
-            Transaction.date <= last_month_end
-        ).scalar() or 0
-        
-        last_month_expense = db.session.query(db.func.sum(Transaction.amount)).filter(
-            Transaction.type == 'expense',
-            Transaction.date >= last_month_start,
-            Transaction.date <= last_month_end
-        ).scalar() or 0
+        last_month = recent_months[last_month_start.strftime('%Y-%m')]
+        last_month_income = last_month['income']
+        last_month_expense = last_month['expense']
         
         initial_cash = last_month_income - last_month_expense
         operating_cash = current_month_income
@@ -1666,88 +3253,101 @@ def statistics():
                              net_assets_growth=0,
                              liability_ratio_change=0)
 
+WEEKDAY_NAMES = ['周一', '周二', '周三', '周四', '周五', '周六', '周日']
+
+@app.route('/api/statistics/breakdown')
+@login_required
+def api_statistics_breakdown():
+    """报告期内收支按分类、供应商、商品、星期、月份等维度的分组汇总，可用 type/category/supplier/product 参数筛选"""
+    engine = ledger_engine()
+    if engine is None:
+        return jsonify({'error': '分组分析需要安装 numpy 并启用 LEDGER_ENGINE'}), 503
+    by = request.args.get('by', 'category')
+    if by not in LEDGER_GROUP_KEYS:
+        return jsonify({'error': f'分组维度应为 {", ".join(LEDGER_GROUP_KEYS)} 之一'}), 400
+    start_date_obj, end_date_obj = parse_report_period(request.args)
+    filters = {}
+    if request.args.get('type') in BALANCE_SIGNS:
+        filters['type'] = request.args['type']
+    for name in ('category', 'supplier', 'product'):
+        if request.args.get(name, '').isdigit():
+            filters[name] = int(request.args[name])
+
+    totals = engine.aggregate(by, start_date_obj, end_date_obj, **filters)
+    if by == 'category':
+        names = {category.id: category.name for category in reference_categories()}
+    elif by == 'supplier':
+        names = {supplier.id: supplier.name for supplier in reference_suppliers()}
+    elif by == 'product':
+        product_ids = [key for _, key in totals if key is not None]
+        names = dict(db.session.query(Product.id, Product.name).filter(Product.id.in_(product_ids))) if product_ids else {}
+    elif by == 'weekday':
+        names = dict(enumerate(WEEKDAY_NAMES))
+    else:
+        names = {}
+
+    result = {transaction_type: [] for transaction_type in BALANCE_SIGNS}
+    for (transaction_type, key), (total, count) in totals.items():
+        if transaction_type in result:
+            result[transaction_type].append({'key': key, 'name': names.get(key, key if key is not None else '无'),
+                                             'total': round(total, 2), 'count': count})
+    for rows in result.values():
+        # 月份、星期按时间顺序，其余按金额从大到小
+        rows.sort(key=(lambda row: row['key']) if by in ('month', 'weekday') else (lambda row: -row['total']))
+    return jsonify(dict(result, by=by, start_date=start_date_obj.strftime('%Y-%m-%d'),
+                        end_date=end_date_obj.strftime('%Y-%m-%d')))
+
+def parse_report_period(args):
+    """解析报表的起止日期参数，缺省或格式错误时为最近一年，返回 (开始日期, 结束日期)"""
+    today = datetime.now().date()
+    try:
+        start_date_obj = datetime.strptime(args['start_date'], '%Y-%m-%d').date() if args.get('start_date') \
+            else today - timedelta(days=365)
+        end_date_obj = datetime.strptime(args['end_date'], '%Y-%m-%d').date() if args.get('end_date') else today
+    except ValueError:
+        start_date_obj = today - timedelta(days=365)
+        end_date_obj = today
+    return start_date_obj, end_date_obj
+
+STATISTICS_EXPORT_HEADERS = ['月份', '收入', '支出', '利润', '环比增长(%)', '同比增长(%)']
+
+def statistics_export_rows(start_date_obj, end_date_obj):
+    """财务分析导出数据：每月收入、支出、利润及环比、同比增长 [MonthlyStat]"""
+    return period_analytics(start_date_obj, end_date_obj).monthly_stats
+
+def write_statistics_xlsx(start_date_obj, end_date_obj, output):
+    """财务分析数据写成 Excel 工作簿，output 为文件路径或文件对象"""
+    workbook = Workbook()
+    ws = workbook.active
+    ws.title = "财务分析数据"
+    
+    # 设置表头
+    for col, header in enumerate(STATISTICS_EXPORT_HEADERS, 1):
+        ws.cell(row=1, column=col, value=header)
+    
+    # 写入数据
+    for row, data in enumerate(statistics_export_rows(start_date_obj, end_date_obj), 2):
+        for col, value in enumerate(data, 1):
+            ws.cell(row=row, column=col, value=value)
+    
+    # 设置列宽
+    column_widths = [12, 15, 15, 15, 15, 15]
+    for col, width in enumerate(column_widths, 1):
+        ws.column_dimensions[chr(ord('A') + col - 1)].width = width
+    
+    workbook.save(output)
+
 @app.route('/export_statistics')
 @login_required
 def export_statistics():
-    """导出财务分析数据"""
+    """导出财务分析数据：CSV 直接返回，Excel 交给后台任务生成"""
     try:
-        # 获取筛选参数
-        start_date = request.args.get('start_date')
-        end_date = request.args.get('end_date')
         export_format = request.args.get('format', 'csv')
-        
-        # 获取当前日期
-        today = datetime.now().date()
-        
-        # 设置默认时间范围
-        if not start_date:
-            default_start = today - timedelta(days=365)
-            start_date = default_start.strftime('%Y-%m-%d')
-        if not end_date:
-            end_date = today.strftime('%Y-%m-%d')
-            
-        # 转换日期
-        try:
-            start_date_obj = datetime.strptime(start_date, '%Y-%m-%d').date()
-            end_date_obj = datetime.strptime(end_date, '%Y-%m-%d').date()
-        except ValueError:
-            start_date_obj = today - timedelta(days=365)
-            end_date_obj = today
-        
-        # 获取月度统计数据
-        monthly_stats = db.session.query(
-            db.func.date_format(Transaction.date, '%Y-%m').label('month'),
-            Transaction.type,
-            db.func.sum(Transaction.amount).label('total')
-        ).filter(
-            Transaction.date >= start_date_obj,
-            Transaction.date <= end_date_obj
-        ).group_by(
-            db.func.date_format(Transaction.date, '%Y-%m'),
-            Transaction.type
-        ).order_by('month').all()
-        
-        # 处理数据
-        month_data = defaultdict(lambda: {'income': 0, 'expense': 0})
-        for stat in monthly_stats:
-            month_data[stat.month][stat.type] = stat.total
-        
-        # 计算增长率
-        export_data = []
-        sorted_months = sorted(month_data.keys())
-        for i, month in enumerate(sorted_months):
-            income = month_data[month]['income']
-            expense = month_data[month]['expense']
-            profit = income - expense
-            
-            # 环比增长
-            mom_growth = 0
-            if i > 0:
-                prev_month = sorted_months[i-1]
-                prev_profit = month_data[prev_month]['income'] - month_data[prev_month]['expense']
-                if prev_profit != 0:
-                    mom_growth = ((profit - prev_profit) / abs(prev_profit)) * 100
-            
-            # 同比增长
-            yoy_growth = 0
-            year_ago_month = f"{int(month[:4])-1}-{month[5:]}"
-            if year_ago_month in month_data:
-                year_ago_profit = month_data[year_ago_month]['income'] - month_data[year_ago_month]['expense']
-                if year_ago_profit != 0:
-                    yoy_growth = ((profit - year_ago_profit) / abs(year_ago_profit)) * 100
-            
-            export_data.append({
-                'month': month,
-                'income': income,
-                'expense': expense,
-                'profit': profit,
-                'mom_growth': mom_growth,
-                'yoy_growth': yoy_growth
-            })
-        
-        if not export_data:
+        start_date_obj, end_date_obj = parse_report_period(request.args)
+        if not period_analytics(start_date_obj, end_date_obj).has_transactions:
             flash('没有符合条件的财务数据可以导出', 'warning')
             return redirect(url_for('statistics'))
+        export_data = statistics_export_rows(start_date_obj, end_date_obj)
         
         if export_format == 'csv':
             # 创建CSV文件
@@ -1755,17 +3355,17 @@ def export_statistics():
             writer = csv.writer(output)
             
             # 写入表头
-            writer.writerow(['月份', '收入', '支出', '利润', '环比增长(%)', '同比增长(%)'])
+            writer.writerow(STATISTICS_EXPORT_HEADERS)
             
             # 写入数据
             for data in export_data:
                 writer.writerow([
-                    data['month'],
-                    f"{data['income']:.2f}",
-                    f"{data['expense']:.2f}",
-                    f"{data['profit']:.2f}",
-                    f"{data['mom_growth']:.2f}",
-                    f"{data['yoy_growth']:.2f}"
+                    data.month,
+                    f"{data.income:.2f}",
+                    f"{data.expense:.2f}",
+                    f"{data.profit:.2f}",
+                    f"{data.mom_growth:.2f}",
+                    f"{data.yoy_growth:.2f}"
                 ])
             
             # 创建响应
@@ -1779,7 +3379,7 @@ def export_statistics():
             # 生成文件名
             filename = f'financial_analysis_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'
             filename_utf8 = f'财务分析_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'
-            response.headers['Content-Disposition'] = f'attachment; filename="{filename}"; filename*=UTF-8\'\'\'{filename_utf8.encode("utf-8").decode("latin1")}"'
+            response.headers['Content-Disposition'] = f'attachment; filename="{filename}"; filename*=UTF-8\'\'{quote(filename_utf8)}'
             
             return response
             
@@ -1787,698 +3387,735 @@ def export_statistics():
             if not EXCEL_AVAILABLE:
                 flash('Excel导出功能不可用，请安装openpyxl库或选择CSV格式导出', 'error')
                 return redirect(url_for('statistics'))
-                
-            # 创建Excel文件
-            output = io.BytesIO()
-            from openpyxl import Workbook
-            from openpyxl.utils import get_column_letter
             
-            workbook = Workbook()
-            ws = workbook.active
-            ws.title = "财务分析数据"
-            
-            # 设置表头
-            headers = ['月份', '收入', '支出', '利润', '环比增长(%)', '同比增长(%)']
-            for col, header in enumerate(headers, 1):
-                ws.cell(row=1, column=col, value=header)
-            
-            # 写入数据
-            for row, data in enumerate(export_data, 2):
-                ws.cell(row=row, column=1, value=data['month'])
-                ws.cell(row=row, column=2, value=data['income'])
-                ws.cell(row=row, column=3, value=data['expense'])
-                ws.cell(row=row, column=4, value=data['profit'])
-                ws.cell(row=row, column=5, value=data['mom_growth'])
-                ws.cell(row=row, column=6, value=data['yoy_growth'])
-            
-            # 设置列宽
-            column_widths = [12, 15, 15, 15, 15, 15]
-            for col, width in enumerate(column_widths, 1):
-                ws.column_dimensions[get_column_letter(col)].width = width
-            
-            workbook.save(output)
-            output.seek(0)
-            
-            # 创建响应
-            response = make_response(output.getvalue())
-            response.headers['Content-Type'] = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-            
-            # 生成文件名
-            filename = f'financial_analysis_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx'
-            filename_utf8 = f'财务分析_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx'
-            response.headers['Content-Disposition'] = f'attachment; filename="{filename}"; filename*=UTF-8\'\'\'{filename_utf8.encode("utf-8").decode("latin1")}"'
-            
-            # 添加安全头部减少浏览器警告
-            response.headers['X-Content-Type-Options'] = 'nosniff'
-            response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
-            response.headers['Pragma'] = 'no-cache'
-            response.headers['Expires'] = '0'
-            
-            return response
+            job_id = submit_job('statistics_excel', {
+                'start_date': start_date_obj.strftime('%Y-%m-%d'),
+                'end_date': end_date_obj.strftime('%Y-%m-%d'),
+            }, current_user.id)
+            return redirect(url_for('job_status', job_id=job_id))
             
     except Exception as e:
         flash(f'导出失败: {str(e)}', 'error')
         return redirect(url_for('statistics'))
 
-@app.route('/export_pdf_report')
-@login_required
-def export_pdf_report():
-    """导出PDF财务分析报告"""
-    try:
-        if not PDF_AVAILABLE:
-            flash('PDF生成功能不可用，请安装reportlab库', 'error')
-            return redirect(url_for('statistics'))
-        
-        # 获取筛选参数
-        start_date = request.args.get('start_date')
-        end_date = request.args.get('end_date')
-        
-        # 获取当前日期
-        today = datetime.now().date()
+def write_pdf_report(start_date_obj, end_date_obj, output, progress=None):
+    """生成 [start_date_obj, end_date_obj] 的PDF财务分析报告，写入 output（文件路径或文件对象）"""
+    progress = progress or (lambda percent, message='': None)
+    start_date = start_date_obj.strftime('%Y-%m-%d')
+    end_date = end_date_obj.strftime('%Y-%m-%d')
+    progress(10, '读取财务数据')
+    
+    # 获取财务数据（只用汇总查询，不读取交易明细）
+    report = period_analytics(start_date_obj, end_date_obj)
+    month_data = report.month_data
+    
+    # 计算关键指标
+    total_income = report.total_income
+    total_expense = report.total_expense
+    net_profit = report.net_profit
+    
+    # 字体与样式在本进程首次生成报告时初始化
+    engine = get_pdf_engine()
+    normal_style = engine.styles['normal']
+    heading_style = engine.styles['heading']
+    
+    # 创建PDF
+    doc = SimpleDocTemplate(output, pagesize=A4, topMargin=1*inch, bottomMargin=1*inch)
+    
+    # 构建PDF内容
+    story = []
+    
+    # 标题
+    story.append(Paragraph('七彩果坊财务分析报告', engine.styles['title']))
+    story.append(Paragraph(f'报告期间: {start_date} 至 {end_date}', normal_style))
+    story.append(Paragraph(f'生成时间: {datetime.now().strftime("%Y年%m月%d日 %H:%M")}', normal_style))
+    story.append(Spacer(1, 20))
+    
+    # 执行摘要
+    story.append(Paragraph('执行摘要', heading_style))
+    summary_data = [
+        ['指标', '金额', '说明'],
+        ['总收入', f'¥{total_income:,.2f}', '报告期内总收入'],
+        ['总支出', f'¥{total_expense:,.2f}', '报告期内总支出'],
+        ['净利润', f'¥{net_profit:,.2f}', '收入减去支出的净额'],
+        ['利润率', f'{(net_profit/total_income*100) if total_income > 0 else 0:.2f}%', '净利润占总收入的比例']
+    ]
+    
+    story.append(engine.table(summary_data, [2*inch, 1.5*inch, 2.5*inch], 'summary'))
+    story.append(Spacer(1, 20))
+    
+    # 添加图表分析部分
+    story.append(Paragraph('图表分析', heading_style))
+    
+    # 创建收入支出趋势图
+    if report.has_transactions:
+        # 准备趋势图数据
+        months = report.months
+        income_data, expense_data, _ = report.series(months)
+        
+        # 创建趋势图
+        drawing = engine.line_chart(
+            [income_data, expense_data], [m.replace('-', '/') for m in months], [colors.green, colors.red],
+            size=(400, 200), plot=(50, 50, 300, 125),
+            value_min=0, value_max=max(max(income_data), max(expense_data)) * 1.1)
+        
+        # 添加图例
+        drawing.add(engine.text(50, 30, '绿线: 收入', fill_color=colors.green))
+        drawing.add(engine.text(150, 30, '红线: 支出', fill_color=colors.red))
+        
+        story.append(drawing)
+        story.append(Spacer(1, 10))
         
-        # 设置默认时间范围
-        if not start_date:
-            default_start = today - timedelta(days=365)
-            start_date = default_start.strftime('%Y-%m-%d')
-        if not end_date:
-            end_date = today.strftime('%Y-%m-%d')
+        # 趋势分析文字
+        trend_analysis = []
+        if len(months) >= 2:
+            recent_income = income_data[-1] if income_data else 0
+            previous_income = income_data[-2] if len(income_data) >= 2 else 0
+            recent_expense = expense_data[-1] if expense_data else 0
+            previous_expense = expense_data[-2] if len(expense_data) >= 2 else 0
             
-        # 转换日期
-        try:
-            start_date_obj = datetime.strptime(start_date, '%Y-%m-%d').date()
-            end_date_obj = datetime.strptime(end_date, '%Y-%m-%d').date()
-        except ValueError:
-            start_date_obj = today - timedelta(days=365)
-            end_date_obj = today
-        
-        # 获取财务数据
-        monthly_stats = db.session.query(
-            db.func.date_format(Transaction.date, '%Y-%m').label('month'),
-            Transaction.type,
-            db.func.sum(Transaction.amount).label('total')
-        ).filter(
-            Transaction.date >= start_date_obj,
-            Transaction.date <= end_date_obj
-        ).group_by(
-            db.func.date_format(Transaction.date, '%Y-%m'),
-            Transaction.type
-        ).order_by('month').all()
-        
-        # 处理数据
-        month_data = defaultdict(lambda: {'income': 0, 'expense': 0})
-        for stat in monthly_stats:
-            month_data[stat.month][stat.type] = stat.total
-        
-        # 计算关键指标
-        total_income = sum(data['income'] for data in month_data.values())
-        total_expense = sum(data['expense'] for data in month_data.values())
-        net_profit = total_income - total_expense
-        
-        # 获取交易数据用于分析
-        transactions = Transaction.query.filter(
-            Transaction.date >= start_date_obj,
-            Transaction.date <= end_date_obj
-        ).all()
-        
-        # 注册中文字体
-        from reportlab.pdfbase import pdfmetrics
-        from reportlab.pdfbase.ttfonts import TTFont
-        
-        # 尝试注册系统中文字体
-        chinese_font = 'Helvetica'  # 默认字体
-        try:
-            # Windows系统字体路径
-            font_paths = [
-                'C:/Windows/Fonts/simsun.ttc',  # 宋体
-                'C:/Windows/Fonts/simhei.ttf',  # 黑体
-                'C:/Windows/Fonts/msyh.ttc',    # 微软雅黑
-                'C:/Windows/Fonts/simkai.ttf'   # 楷体
-            ]
+            income_change = ((recent_income - previous_income) / previous_income * 100) if previous_income > 0 else 0
+            expense_change = ((recent_expense - previous_expense) / previous_expense * 100) if previous_expense > 0 else 0
             
-            for font_path in font_paths:
-                if os.path.exists(font_path):
-                    try:
-                        pdfmetrics.registerFont(TTFont('ChineseFont', font_path))
-                        chinese_font = 'ChineseFont'
-                        break
-                    except:
-                        continue
-        except Exception as e:
-            print(f"字体注册失败: {e}")
-        
-        # 创建PDF
-        output = io.BytesIO()
-        doc = SimpleDocTemplate(output, pagesize=A4, topMargin=1*inch, bottomMargin=1*inch)
-        
-        # 获取样式
-        styles = getSampleStyleSheet()
-        title_style = ParagraphStyle(
-            'CustomTitle',
-            parent=styles['Heading1'],
-            fontName=chinese_font,
-            fontSize=24,
-            spaceAfter=30,
-            alignment=TA_CENTER,
-            textColor=colors.darkblue
-        )
-        
-        heading_style = ParagraphStyle(
-            'CustomHeading',
-            parent=styles['Heading2'],
-            fontName=chinese_font,
-            fontSize=16,
-            spaceAfter=12,
-            textColor=colors.darkblue
-        )
-        
-        normal_style = ParagraphStyle(
-            'CustomNormal',
-            parent=styles['Normal'],
-            fontName=chinese_font,
-            fontSize=10
-        )
-        
-        # 构建PDF内容
-        story = []
-        
-        # 标题
-        story.append(Paragraph('七彩果坊财务分析报告', title_style))
-        story.append(Paragraph(f'报告期间: {start_date} 至 {end_date}', normal_style))
-        story.append(Paragraph(f'生成时间: {datetime.now().strftime("%Y年%m月%d日 %H:%M")}', normal_style))
-        story.append(Spacer(1, 20))
+            trend_analysis.append(f'• 最近一个月收入{"增长" if income_change > 0 else "下降"}{abs(income_change):.1f}%')
+            trend_analysis.append(f'• 最近一个月支出{"增长" if expense_change > 0 else "下降"}{abs(expense_change):.1f}%')
+            
+            if income_change > expense_change:
+                trend_analysis.append('• 收入增长速度超过支出增长，财务状况向好')
+            elif expense_change > income_change:
+                trend_analysis.append('• 支出增长速度超过收入增长，需要关注成本控制')
         
-        # 执行摘要
-        story.append(Paragraph('执行摘要', heading_style))
-        summary_data = [
-            ['指标', '金额', '说明'],
-            ['总收入', f'¥{total_income:,.2f}', '报告期内总收入'],
-            ['总支出', f'¥{total_expense:,.2f}', '报告期内总支出'],
-            ['净利润', f'¥{net_profit:,.2f}', '收入减去支出的净额'],
-            ['利润率', f'{(net_profit/total_income*100) if total_income > 0 else 0:.2f}%', '净利润占总收入的比例']
-        ]
+        for analysis in trend_analysis:
+            story.append(Paragraph(analysis, normal_style))
         
-        summary_table = Table(summary_data, colWidths=[2*inch, 1.5*inch, 2.5*inch])
-        summary_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.darkblue),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, -1), chinese_font),
-            ('FONTSIZE', (0, 0), (-1, 0), 12),
-            ('FONTSIZE', (0, 1), (-1, -1), 10),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black)
-        ]))
-        story.append(summary_table)
         story.append(Spacer(1, 20))
+    
+    # 获取分类数据用于饼图（按金额从大到小）
+    expense_categories = report.category_totals['expense']
+    
+    # 创建支出分类饼图（如果有数据）
+    if expense_categories:
+        story.append(Paragraph('支出分类分析', heading_style))
+        
+        # 创建饼图（右侧图例）
+        drawing = engine.pie_chart(list(expense_categories.keys()), list(expense_categories.values()),
+                                   [colors.red, colors.orange, colors.yellow, colors.green, colors.blue, colors.purple])
+        story.append(drawing)
+        story.append(Spacer(1, 10))
         
-        # 添加图表分析部分
-        story.append(Paragraph('图表分析', heading_style))
+        # 分类分析文字
+        total_expense_cat = sum(expense_categories.values())
+        category_analysis = []
+        sorted_categories = report.top_categories('expense')
         
-        # 创建收入支出趋势图
-        if month_data:
-            # 准备趋势图数据
-            months = sorted(month_data.keys())
-            income_data = [month_data[month]['income'] for month in months]
-            expense_data = [month_data[month]['expense'] for month in months]
-            
-            # 创建趋势图
-            drawing = Drawing(400, 200)
-            chart = HorizontalLineChart()
-            chart.x = 50
-            chart.y = 50
-            chart.height = 125
-            chart.width = 300
-            chart.data = [income_data, expense_data]
-            chart.categoryAxis.categoryNames = [m.replace('-', '/') for m in months]
-            chart.valueAxis.valueMin = 0
-            chart.valueAxis.valueMax = max(max(income_data) if income_data else [0], max(expense_data) if expense_data else [0]) * 1.1
-            chart.lines[0].strokeColor = colors.green
-            chart.lines[1].strokeColor = colors.red
-            chart.lines[0].strokeWidth = 2
-            chart.lines[1].strokeWidth = 2
-            drawing.add(chart)
-            
-            # 添加图例
-            from reportlab.graphics.shapes import String
-            drawing.add(String(50, 30, '绿线: 收入', fontSize=10, fillColor=colors.green))
-            drawing.add(String(150, 30, '红线: 支出', fontSize=10, fillColor=colors.red))
-            
-            story.append(drawing)
-            story.append(Spacer(1, 10))
-            
-            # 趋势分析文字
-            trend_analysis = []
-            if len(months) >= 2:
-                recent_income = income_data[-1] if income_data else 0
-                previous_income = income_data[-2] if len(income_data) >= 2 else 0
-                recent_expense = expense_data[-1] if expense_data else 0
-                previous_expense = expense_data[-2] if len(expense_data) >= 2 else 0
-                
-                income_change = ((recent_income - previous_income) / previous_income * 100) if previous_income > 0 else 0
-                expense_change = ((recent_expense - previous_expense) / previous_expense * 100) if previous_expense > 0 else 0
-                
-                trend_analysis.append(f'• 最近一个月收入{"增长" if income_change > 0 else "下降"}{abs(income_change):.1f}%')
-                trend_analysis.append(f'• 最近一个月支出{"增长" if expense_change > 0 else "下降"}{abs(expense_change):.1f}%')
-                
-                if income_change > expense_change:
-                    trend_analysis.append('• 收入增长速度超过支出增长，财务状况向好')
-                elif expense_change > income_change:
-                    trend_analysis.append('• 支出增长速度超过收入增长，需要关注成本控制')
+        if sorted_categories:
+            top_category = sorted_categories[0]
+            category_analysis.append(f'• 最大支出类别：{top_category[0]}，占总支出的{(top_category[1]/total_expense_cat*100):.1f}%')
             
-            for analysis in trend_analysis:
-                story.append(Paragraph(analysis, normal_style))
+            if len(sorted_categories) >= 3:
+                top3_total = sum([cat[1] for cat in sorted_categories[:3]])
+                category_analysis.append(f'• 前三大支出类别占总支出的{(top3_total/total_expense_cat*100):.1f}%')
             
-            story.append(Spacer(1, 20))
+            category_analysis.append('• 建议重点关注主要支出类别的成本控制')
         
-        # 获取分类数据用于饼图
-        category_stats = db.session.query(
-            Category.name,
-            Transaction.type,
-            db.func.sum(Transaction.amount).label('total')
-        ).join(
-            Transaction, Category.id == Transaction.category_id
-        ).filter(
-            Transaction.date >= start_date_obj,
-            Transaction.date <= end_date_obj
-        ).group_by(
-            Category.name, Transaction.type
-        ).all()
-        
-        # 处理分类数据
-        income_categories = {}
-        expense_categories = {}
-        for stat in category_stats:
-            if stat.type == 'income':
-                income_categories[stat.name] = stat.total
-            else:
-                expense_categories[stat.name] = stat.total
+        for analysis in category_analysis:
+            story.append(Paragraph(analysis, normal_style))
         
-        # 创建支出分类饼图（如果有数据）
-        if expense_categories:
-            story.append(Paragraph('支出分类分析', heading_style))
-            
-            # 创建饼图
-            drawing = Drawing(500, 300)
-            pie = Pie()
-            pie.x = 50
-            pie.y = 50
-            pie.width = 180
-            pie.height = 180
-            
-            # 准备饼图数据
-            categories = list(expense_categories.keys())
-            values = list(expense_categories.values())
-            pie.data = values
-            
-            # 设置颜色
-            colors_list = [colors.red, colors.orange, colors.yellow, colors.green, colors.blue, colors.purple]
-            pie.slices.strokeColor = colors.white
-            for i, color in enumerate(colors_list[:len(values)]):
-                pie.slices[i].fillColor = color
-            
-            # 设置字体
-            pie.slices.fontName = chinese_font
-            pie.slices.fontSize = 10
-            pie.slices.labelRadius = 1.2
-            
-            # 创建图例
-            legend_x = 280
-            legend_y = 200
-            for i, (category, value) in enumerate(zip(categories, values)):
-                # 颜色块
-                rect = Rect(legend_x, legend_y - i * 20, 10, 10)
-                rect.fillColor = colors_list[i % len(colors_list)]
-                rect.strokeColor = colors.black
-                drawing.add(rect)
-                
-                # 标签文字
-                percentage = (value / sum(values)) * 100
-                label_text = f'{category}: {percentage:.1f}%'
-                label = String(legend_x + 15, legend_y - i * 20 + 2, label_text)
-                label.fontName = chinese_font
-                label.fontSize = 9
-                drawing.add(label)
-            
-            # 移除饼图自带的标签以避免重叠
-            pie.labels = None
-            
-            drawing.add(pie)
-            story.append(drawing)
-            story.append(Spacer(1, 10))
-            
-            # 分类分析文字
-            total_expense_cat = sum(expense_categories.values())
-            category_analysis = []
-            sorted_categories = sorted(expense_categories.items(), key=lambda x: x[1], reverse=True)
-            
-            if sorted_categories:
-                top_category = sorted_categories[0]
-                category_analysis.append(f'• 最大支出类别：{top_category[0]}，占总支出的{(top_category[1]/total_expense_cat*100):.1f}%')
-                
-                if len(sorted_categories) >= 3:
-                    top3_total = sum([cat[1] for cat in sorted_categories[:3]])
-                    category_analysis.append(f'• 前三大支出类别占总支出的{(top3_total/total_expense_cat*100):.1f}%')
-                
-                category_analysis.append('• 建议重点关注主要支出类别的成本控制')
-            
-            for analysis in category_analysis:
-                story.append(Paragraph(analysis, normal_style))
-            
-            story.append(Spacer(1, 20))
-        
-        # 月度收支明细
-        story.append(Paragraph('月度收支明细', heading_style))
-        detail_data = [['月份', '收入', '支出', '净利润', '利润率']]
-        
-        for month in sorted(month_data.keys()):
-            data = month_data[month]
-            monthly_profit = data['income'] - data['expense']
-            profit_rate = (monthly_profit / data['income'] * 100) if data['income'] > 0 else 0
-            detail_data.append([
-                month,
-                f'¥{data["income"]:,.2f}',
-                f'¥{data["expense"]:,.2f}',
-                f'¥{monthly_profit:,.2f}',
-                f'{profit_rate:.2f}%'
-            ])
-        
-        detail_table = Table(detail_data, colWidths=[1.2*inch, 1.2*inch, 1.2*inch, 1.2*inch, 1.2*inch])
-        detail_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.darkblue),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, -1), chinese_font),
-            ('FONTSIZE', (0, 0), (-1, 0), 10),
-            ('FONTSIZE', (0, 1), (-1, -1), 9),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black)
-        ]))
-        story.append(detail_table)
         story.append(Spacer(1, 20))
-        
-        # 收入支出对比分析图表
-        story.append(Paragraph('收入支出对比分析', heading_style))
+    
+    # 月度收支明细
+    story.append(Paragraph('月度收支明细', heading_style))
+    detail_data = [['月份', '收入', '支出', '净利润', '利润率']]
+    
+    for month in report.months:
+        data = month_data[month]
+        monthly_profit = data['income'] - data['expense']
+        profit_rate = (monthly_profit / data['income'] * 100) if data['income'] > 0 else 0
+        detail_data.append([
+            month,
+            f'¥{data["income"]:,.2f}',
+            f'¥{data["expense"]:,.2f}',
+            f'¥{monthly_profit:,.2f}',
+            f'{profit_rate:.2f}%'
+        ])
+    
+    story.append(engine.table(detail_data, [1.2*inch] * 5, 'detail'))
+    story.append(Spacer(1, 20))
+    
+    # 收入支出对比分析图表
+    story.append(Paragraph('收入支出对比分析', heading_style))
+    story.append(Spacer(1, 10))
+    
+    # 创建收入支出对比柱状图
+    if report.has_transactions:
+        # 准备数据
+        months = report.months[-6:]  # 最近6个月
+        income_values, expense_values, _ = report.series(months)
+        
+        drawing = engine.bar_chart(
+            [income_values, expense_values], [m.split('-')[1] + '月' for m in months],  # 只显示月份
+            [colors.green, colors.red],
+            value_min=0, value_max=max(max(income_values, default=0), max(expense_values, default=0)) * 1.1)
+        story.append(drawing)
         story.append(Spacer(1, 10))
         
-        # 创建收入支出对比柱状图
-        if month_data:
-            drawing = Drawing(500, 300)
-            chart = VerticalBarChart()
-            chart.x = 50
-            chart.y = 50
-            chart.height = 200
-            chart.width = 400
-            
-            # 准备数据
-            months = sorted(month_data.keys())[-6:]  # 最近6个月
-            income_values = [month_data[m]['income'] for m in months]
-            expense_values = [month_data[m]['expense'] for m in months]
-            
-            chart.data = [income_values, expense_values]
-            chart.categoryAxis.categoryNames = [m.split('-')[1] + '月' for m in months]  # 只显示月份
-            chart.bars[0].fillColor = colors.green
-            chart.bars[1].fillColor = colors.red
-            chart.valueAxis.valueMin = 0
-            chart.valueAxis.valueMax = max(max(income_values, default=0), max(expense_values, default=0)) * 1.1
-            
-            # 添加图例
-            chart.categoryAxis.labels.fontName = chinese_font
-            chart.valueAxis.labels.fontName = chinese_font
-            
-            drawing.add(chart)
-            story.append(drawing)
-            story.append(Spacer(1, 10))
-            
-            # 收入支出对比分析文字
-            comparison_analysis = []
-            avg_income = sum(income_values) / len(income_values) if income_values else 0
-            avg_expense = sum(expense_values) / len(expense_values) if expense_values else 0
-            
-            comparison_analysis.append(f'• 近{len(months)}个月平均收入为 {avg_income:,.2f} 元，平均支出为 {avg_expense:,.2f} 元。')
-            
-            if avg_income > avg_expense:
-                comparison_analysis.append(f'• 收入高于支出 {avg_income - avg_expense:,.2f} 元，经营状况良好。')
-            elif avg_income < avg_expense:
-                comparison_analysis.append(f'• 支出高于收入 {avg_expense - avg_income:,.2f} 元，需要控制成本或增加收入。')
-            else:
-                comparison_analysis.append('• 收支基本平衡。')
-            
-            # 分析收入趋势
-            if len(income_values) >= 3:
-                recent_income_trend = income_values[-1] - income_values[-3]
-                if recent_income_trend > 0:
-                    comparison_analysis.append(f'• 收入呈上升趋势，较前期增长 {recent_income_trend:,.2f} 元。')
-                elif recent_income_trend < 0:
-                    comparison_analysis.append(f'• 收入呈下降趋势，较前期减少 {abs(recent_income_trend):,.2f} 元。')
-                else:
-                    comparison_analysis.append('• 收入保持稳定。')
-            
-            for analysis in comparison_analysis:
-                story.append(Paragraph(analysis, normal_style))
+        # 收入支出对比分析文字
+        comparison_analysis = []
+        avg_income = sum(income_values) / len(income_values) if income_values else 0
+        avg_expense = sum(expense_values) / len(expense_values) if expense_values else 0
         
-        story.append(Spacer(1, 20))
+        comparison_analysis.append(f'• 近{len(months)}个月平均收入为 {avg_income:,.2f} 元，平均支出为 {avg_expense:,.2f} 元。')
         
-        # 月度净利润趋势分析
-        story.append(Paragraph('月度净利润趋势分析', heading_style))
-        story.append(Spacer(1, 10))
-        
-        if month_data:
-            # 创建净利润趋势线图
-            drawing = Drawing(500, 300)
-            chart = HorizontalLineChart()
-            chart.x = 50
-            chart.y = 50
-            chart.height = 200
-            chart.width = 400
-            
-            # 准备净利润数据
-            profit_values = [month_data[m]['income'] - month_data[m]['expense'] for m in months]
-            chart.data = [profit_values]
-            chart.categoryAxis.categoryNames = [m.split('-')[1] + '月' for m in months]
-            chart.lines[0].strokeColor = colors.blue
-            chart.lines[0].strokeWidth = 2
-            
-            # 设置Y轴范围
-            min_profit = min(profit_values) if profit_values else 0
-            max_profit = max(profit_values) if profit_values else 0
-            chart.valueAxis.valueMin = min_profit * 1.1 if min_profit < 0 else min_profit * 0.9
-            chart.valueAxis.valueMax = max_profit * 1.1 if max_profit > 0 else max_profit * 0.9
-            
-            # 设置字体
-            chart.categoryAxis.labels.fontName = chinese_font
-            chart.valueAxis.labels.fontName = chinese_font
-            
-            drawing.add(chart)
-            story.append(drawing)
-            story.append(Spacer(1, 10))
-            
-            # 净利润趋势分析文字
-            profit_analysis = []
-            avg_profit = sum(profit_values) / len(profit_values) if profit_values else 0
-            profit_analysis.append(f'• 近{len(months)}个月平均净利润为 {avg_profit:,.2f} 元。')
-            
-            # 分析利润波动
-            if len(profit_values) >= 2:
-                profit_volatility = max(profit_values) - min(profit_values)
-                profit_analysis.append(f'• 净利润波动范围为 {profit_volatility:,.2f} 元。')
-                
-                if profit_volatility > abs(avg_profit) * 0.5:
-                    profit_analysis.append('• 利润波动较大，建议加强经营稳定性。')
-                else:
-                    profit_analysis.append('• 利润波动相对稳定。')
-            
-            # 分析最近趋势
-            if len(profit_values) >= 3:
-                recent_trend = profit_values[-1] - profit_values[-3]
-                if recent_trend > 0:
-                    profit_analysis.append(f'• 最近净利润呈上升趋势，增长 {recent_trend:,.2f} 元。')
-                elif recent_trend < 0:
-                    profit_analysis.append(f'• 最近净利润呈下降趋势，减少 {abs(recent_trend):,.2f} 元。')
-                else:
-                    profit_analysis.append('• 最近净利润保持稳定。')
-            
-            for analysis in profit_analysis:
-                story.append(Paragraph(analysis, normal_style))
-        
-        story.append(Spacer(1, 20))
+        if avg_income > avg_expense:
+            comparison_analysis.append(f'• 收入高于支出 {avg_income - avg_expense:,.2f} 元，经营状况良好。')
+        elif avg_income < avg_expense:
+            comparison_analysis.append(f'• 支出高于收入 {avg_expense - avg_income:,.2f} 元，需要控制成本或增加收入。')
+        else:
+            comparison_analysis.append('• 收支基本平衡。')
+        
+        # 分析收入趋势
+        if len(income_values) >= 3:
+            recent_income_trend = income_values[-1] - income_values[-3]
+            if recent_income_trend > 0:
+                comparison_analysis.append(f'• 收入呈上升趋势，较前期增长 {recent_income_trend:,.2f} 元。')
+            elif recent_income_trend < 0:
+                comparison_analysis.append(f'• 收入呈下降趋势，较前期减少 {abs(recent_income_trend):,.2f} 元。')
+            else:
+                comparison_analysis.append('• 收入保持稳定。')
         
-        # 支出类别分布分析
-        story.append(Paragraph('支出类别分布分析', heading_style))
+        for analysis in comparison_analysis:
+            story.append(Paragraph(analysis, normal_style))
+    
+    story.append(Spacer(1, 20))
+    
+    # 月度净利润趋势分析
+    story.append(Paragraph('月度净利润趋势分析', heading_style))
+    story.append(Spacer(1, 10))
+    
+    if report.has_transactions:
+        # 准备净利润数据
+        profit_values = report.series(months).profit
+        
+        # 设置Y轴范围
+        min_profit = min(profit_values) if profit_values else 0
+        max_profit = max(profit_values) if profit_values else 0
+        
+        # 创建净利润趋势线图
+        drawing = engine.line_chart(
+            [profit_values], [m.split('-')[1] + '月' for m in months], [colors.blue],
+            value_min=min_profit * 1.1 if min_profit < 0 else min_profit * 0.9,
+            value_max=max_profit * 1.1 if max_profit > 0 else max_profit * 0.9)
+        story.append(drawing)
         story.append(Spacer(1, 10))
         
-        # 获取支出类别数据
-        expense_categories = {}
-        for transaction in transactions:
-            if transaction.type == 'expense':
-                category_name = transaction.category.name
-                expense_categories[category_name] = expense_categories.get(category_name, 0) + transaction.amount
-        
-        if expense_categories:
-            # 创建饼图
-            drawing = Drawing(500, 300)
-            pie = Pie()
-            pie.x = 50
-            pie.y = 50
-            pie.width = 180
-            pie.height = 180
-            
-            # 准备饼图数据
-            categories = list(expense_categories.keys())
-            amounts = list(expense_categories.values())
-            
-            pie.data = amounts
-            pie.labels = categories
-            
-            # 设置颜色
-            colors_list = [colors.red, colors.blue, colors.green, colors.orange, colors.purple, colors.brown, colors.pink, colors.gray]
-            for i in range(len(amounts)):
-                pie.slices[i].fillColor = colors_list[i % len(colors_list)]
-            
-            # 设置标签字体和位置
-            pie.slices.fontName = chinese_font
-            pie.slices.fontSize = 10
-            pie.slices.labelRadius = 1.2
-            pie.slices.popout = 0
-            
-            # 创建图例
-            legend_x = 280
-            legend_y = 200
-            for i, (category, amount) in enumerate(zip(categories, amounts)):
-                # 颜色块
-                rect = Rect(legend_x, legend_y - i * 20, 10, 10)
-                rect.fillColor = colors_list[i % len(colors_list)]
-                rect.strokeColor = colors.black
-                drawing.add(rect)
-                
-                # 标签文字
-                percentage = (amount / sum(amounts)) * 100
-                label_text = f'{category}: {percentage:.1f}%'
-                label = String(legend_x + 15, legend_y - i * 20 + 2, label_text)
-                label.fontName = chinese_font
-                label.fontSize = 9
-                drawing.add(label)
-            
-            # 移除饼图自带的标签以避免重叠
-            pie.labels = None
-            
-            drawing.add(pie)
-            story.append(drawing)
-            story.append(Spacer(1, 10))
-            
-            # 支出类别分析文字
-            category_analysis = []
-            total_expense_amount = sum(amounts)
-            
-            # 找出最大支出类别
-            max_category = max(expense_categories, key=expense_categories.get)
-            max_amount = expense_categories[max_category]
-            max_percentage = (max_amount / total_expense_amount) * 100
-            
-            category_analysis.append(f'• 最大支出类别为"{max_category}"，金额为 {max_amount:,.2f} 元，占总支出的 {max_percentage:.1f}%。')
+        # 净利润趋势分析文字
+        profit_analysis = []
+        avg_profit = sum(profit_values) / len(profit_values) if profit_values else 0
+        profit_analysis.append(f'• 近{len(months)}个月平均净利润为 {avg_profit:,.2f} 元。')
+        
+        # 分析利润波动
+        if len(profit_values) >= 2:
+            profit_volatility = max(profit_values) - min(profit_values)
+            profit_analysis.append(f'• 净利润波动范围为 {profit_volatility:,.2f} 元。')
             
-            # 分析支出集中度
-            if max_percentage > 50:
-                category_analysis.append('• 支出过于集中在单一类别，建议分散支出风险。')
-            elif max_percentage > 30:
-                category_analysis.append('• 支出相对集中，建议关注主要支出类别的成本控制。')
+            if profit_volatility > abs(avg_profit) * 0.5:
+                profit_analysis.append('• 利润波动较大，建议加强经营稳定性。')
             else:
-                category_analysis.append('• 支出分布相对均衡。')
-            
-            # 列出前三大支出类别
-            sorted_categories = sorted(expense_categories.items(), key=lambda x: x[1], reverse=True)
-            top_3_categories = sorted_categories[:3]
-            
-            category_analysis.append('• 前三大支出类别分别为：')
-            for i, (cat, amount) in enumerate(top_3_categories, 1):
-                percentage = (amount / total_expense_amount) * 100
-                category_analysis.append(f'  {i}. {cat}：{amount:,.2f} 元 ({percentage:.1f}%)')
-            
-            # 成本控制建议
-            if max_percentage > 40:
-                category_analysis.append(f'• 建议重点关注"{max_category}"类别的成本控制，寻找节约空间。')
-            
-            for analysis in category_analysis:
-                story.append(Paragraph(analysis, normal_style))
-        
-        story.append(Spacer(1, 20))
-        
-        # 财务分析
-        story.append(Paragraph('综合财务分析与建议', heading_style))
-        
-        # 分析内容
-        analysis_points = []
-        if net_profit > 0:
-            analysis_points.append('• 报告期内实现盈利，经营状况良好。')
-        else:
-            analysis_points.append('• 报告期内出现亏损，需要关注成本控制和收入增长。')
-        
-        if total_income > 0:
-            profit_margin = net_profit / total_income * 100
-            if profit_margin > 20:
-                analysis_points.append('• 利润率超过20%，盈利能力优秀。')
-            elif profit_margin > 10:
-                analysis_points.append('• 利润率在10%-20%之间，盈利能力良好。')
-            elif profit_margin > 0:
-                analysis_points.append('• 利润率较低，建议优化成本结构。')
+                profit_analysis.append('• 利润波动相对稳定。')
+        
+        # 分析最近趋势
+        if len(profit_values) >= 3:
+            recent_trend = profit_values[-1] - profit_values[-3]
+            if recent_trend > 0:
+                profit_analysis.append(f'• 最近净利润呈上升趋势，增长 {recent_trend:,.2f} 元。')
+            elif recent_trend < 0:
+                profit_analysis.append(f'• 最近净利润呈下降趋势，减少 {abs(recent_trend):,.2f} 元。')
             else:
-                analysis_points.append('• 出现亏损，建议重新评估业务模式。')
-        
-        # 月度趋势分析
-        if len(month_data) >= 2:
-            months = sorted(month_data.keys())
-            recent_months = months[-3:] if len(months) >= 3 else months
-            recent_profits = [month_data[m]['income'] - month_data[m]['expense'] for m in recent_months]
-            
-            if len(recent_profits) >= 2:
-                if recent_profits[-1] > recent_profits[0]:
-                    analysis_points.append('• 近期利润呈上升趋势，经营改善明显。')
-                elif recent_profits[-1] < recent_profits[0]:
-                    analysis_points.append('• 近期利润呈下降趋势，需要关注经营风险。')
-                else:
-                    analysis_points.append('• 近期利润保持稳定。')
+                profit_analysis.append('• 最近净利润保持稳定。')
         
-        for point in analysis_points:
-            story.append(Paragraph(point, normal_style))
+        for analysis in profit_analysis:
+            story.append(Paragraph(analysis, normal_style))
+    
+    story.append(Spacer(1, 20))
+    
+    # 支出类别分布分析
+    story.append(Paragraph('支出类别分布分析', heading_style))
+    story.append(Spacer(1, 10))
+    
+    # 获取支出类别数据（与上面的分类分析同一份汇总）
+    expense_categories = report.category_totals['expense']
+    
+    if expense_categories:
+        # 准备饼图数据
+        categories = list(expense_categories.keys())
+        amounts = list(expense_categories.values())
+        
+        # 创建饼图（右侧图例）
+        drawing = engine.pie_chart(categories, amounts, [colors.red, colors.blue, colors.green, colors.orange,
+                                                         colors.purple, colors.brown, colors.pink, colors.gray])
+        story.append(drawing)
+        story.append(Spacer(1, 10))
         
-        story.append(Spacer(1, 20))
+        # 支出类别分析文字
+        category_analysis = []
+        total_expense_amount = sum(amounts)
         
-        # 建议
-        story.append(Paragraph('经营建议', heading_style))
-        recommendations = [
-            '• 定期监控关键财务指标，及时发现经营问题。',
-            '• 加强成本控制，提高运营效率。',
-            '• 多元化收入来源，降低经营风险。',
-            '• 建立完善的财务预算和控制体系。',
-            '• 关注现金流管理，确保资金链安全。'
-        ]
+        # 找出最大支出类别
+        max_category = max(expense_categories, key=expense_categories.get)
+        max_amount = expense_categories[max_category]
+        max_percentage = (max_amount / total_expense_amount) * 100
         
-        for rec in recommendations:
-            story.append(Paragraph(rec, normal_style))
+        category_analysis.append(f'• 最大支出类别为"{max_category}"，金额为 {max_amount:,.2f} 元，占总支出的 {max_percentage:.1f}%。')
         
-        # 生成PDF
-        doc.build(story)
-        output.seek(0)
+        # 分析支出集中度
+        if max_percentage > 50:
+            category_analysis.append('• 支出过于集中在单一类别，建议分散支出风险。')
+        elif max_percentage > 30:
+            category_analysis.append('• 支出相对集中，建议关注主要支出类别的成本控制。')
+        else:
+            category_analysis.append('• 支出分布相对均衡。')
         
-        # 创建响应
-        response = make_response(output.getvalue())
-        response.headers['Content-Type'] = 'application/pdf'
-        response.headers['X-Content-Type-Options'] = 'nosniff'
-        response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
-        response.headers['Pragma'] = 'no-cache'
-        response.headers['Expires'] = '0'
+        # 列出前三大支出类别
+        top_3_categories = report.top_categories('expense', 3)
         
-        # 生成文件名
-        filename = f'financial_report_{datetime.now().strftime("%Y%m%d_%H%M%S")}.pdf'
-        filename_utf8 = f'财务分析报告_{datetime.now().strftime("%Y%m%d_%H%M%S")}.pdf'
-        response.headers['Content-Disposition'] = f'attachment; filename="{filename}"; filename*=UTF-8\'\'\'{filename_utf8.encode("utf-8").decode("latin1")}"'
+        category_analysis.append('• 前三大支出类别分别为：')
+        for i, (cat, amount) in enumerate(top_3_categories, 1):
+            percentage = (amount / total_expense_amount) * 100
+            category_analysis.append(f'  {i}. {cat}：{amount:,.2f} 元 ({percentage:.1f}%)')
         
-        return response
+        # 成本控制建议
+        if max_percentage > 40:
+            category_analysis.append(f'• 建议重点关注"{max_category}"类别的成本控制，寻找节约空间。')
         
-    except Exception as e:
-        flash(f'PDF报告生成失败: {str(e)}', 'error')
+        for analysis in category_analysis:
+            story.append(Paragraph(analysis, normal_style))
+    
+    story.append(Spacer(1, 20))
+    
+    # 财务分析
+    story.append(Paragraph('综合财务分析与建议', heading_style))
+    
+    # 分析内容
+    analysis_points = []
+    if net_profit > 0:
+        analysis_points.append('• 报告期内实现盈利，经营状况良好。')
+    else:
+        analysis_points.append('• 报告期内出现亏损，需要关注成本控制和收入增长。')
+    
+    if total_income > 0:
+        profit_margin = net_profit / total_income * 100
+        if profit_margin > 20:
+            analysis_points.append('• 利润率超过20%，盈利能力优秀。')
+        elif profit_margin > 10:
+            analysis_points.append('• 利润率在10%-20%之间，盈利能力良好。')
+        elif profit_margin > 0:
+            analysis_points.append('• 利润率较低，建议优化成本结构。')
+        else:
+            analysis_points.append('• 出现亏损，建议重新评估业务模式。')
+    
+    # 月度趋势分析
+    if len(month_data) >= 2:
+        recent_profits = report.series(report.months[-3:]).profit
+        
+        if len(recent_profits) >= 2:
+            if recent_profits[-1] > recent_profits[0]:
+                analysis_points.append('• 近期利润呈上升趋势，经营改善明显。')
+            elif recent_profits[-1] < recent_profits[0]:
+                analysis_points.append('• 近期利润呈下降趋势，需要关注经营风险。')
+            else:
+                analysis_points.append('• 近期利润保持稳定。')
+    
+    for point in analysis_points:
+        story.append(Paragraph(point, normal_style))
+    
+    story.append(Spacer(1, 20))
+    
+    # 建议
+    story.append(Paragraph('经营建议', heading_style))
+    recommendations = [
+        '• 定期监控关键财务指标，及时发现经营问题。',
+        '• 加强成本控制，提高运营效率。',
+        '• 多元化收入来源，降低经营风险。',
+        '• 建立完善的财务预算和控制体系。',
+        '• 关注现金流管理，确保资金链安全。'
+    ]
+    
+    for rec in recommendations:
+        story.append(Paragraph(rec, normal_style))
+    
+    # 生成PDF
+    progress(60, '排版报告')
+    doc.build(story)
+
+# PDF 报告缓存：报告内容只取决于报告期、期间内各月的交易数据和分类名称，
+# 缓存文件名包含它们的摘要，数据有变化时自然换用新文件
+PDF_REPORT_LAYOUT_VERSION = 4  # 报告版式修改后加一，使旧缓存失效
+
+def pdf_report_cache_path(start_date_obj, end_date_obj):
+    """当前数据版本下该报告期的缓存文件路径（文件不一定存在）"""
+    signature = repr((PDF_REPORT_LAYOUT_VERSION, period_data_version(start_date_obj, end_date_obj)))
+    digest = hashlib.sha256(signature.encode('utf-8')).hexdigest()[:24]
+    return os.path.join(app.config['PDF_CACHE_FOLDER'],
+                        f'{start_date_obj.strftime("%Y%m%d")}_{end_date_obj.strftime("%Y%m%d")}_{digest}.pdf')
+
+def store_pdf_report(cache_path, source_path):
+    """把生成好的报告放入缓存，并删除同一报告期的旧版本"""
+    folder = os.path.dirname(cache_path)
+    os.makedirs(folder, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=folder, suffix='.tmp')
+    os.close(fd)
+    shutil.copyfile(source_path, temp_path)
+    os.replace(temp_path, cache_path)
+
+    period_prefix = os.path.basename(cache_path).rsplit('_', 1)[0] + '_'
+    for entry in os.scandir(folder):
+        if entry.name.startswith(period_prefix) and entry.name.endswith('.pdf') and entry.path != cache_path:
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
+
+def send_cached_pdf_report(cache_path, start_date_obj, end_date_obj):
+    """返回缓存的报告；ETag 即数据版本摘要，浏览器重复下载时可得到 304"""
+    digest = os.path.basename(cache_path)[:-len('.pdf')].rsplit('_', 1)[1]
+    response = send_file(cache_path, mimetype='application/pdf', etag=digest, conditional=True, max_age=0)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    
+    # 生成文件名（以报告期命名）
+    period = f'{start_date_obj.strftime("%Y%m%d")}_{end_date_obj.strftime("%Y%m%d")}'
+    filename = f'financial_report_{period}.pdf'
+    filename_utf8 = f'财务分析报告_{period}.pdf'
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"; filename*=UTF-8\'\'{quote(filename_utf8)}'
+    
+    return response
+
+PREGENERATE_CLAIM_TIMEOUT = 60  # 标记文件已创建但还没写入任务 ID 的最长秒数，超过视为提交进程中途退出
+
+def _pregenerate_marker_stale(marker):
+    """预生成标记对应的任务已不在排队或执行中（失败、过期清理或进程中途退出），可以重新提交"""
+    try:
+        with open(marker, encoding='utf-8') as f:
+            job_id = f.read().strip()
+        claimed_at = os.path.getmtime(marker)
+    except OSError:
+        return False
+    if not job_id:
+        return time.time() - claimed_at > PREGENERATE_CLAIM_TIMEOUT
+    job = read_job(job_id)
+    return job is None or job['state'] not in ('queued', 'running')
+
+def warm_previous_month_report():
+    """上月结束后在后台预生成上月报告；多个进程通过标记文件保证每月只提交一次。
+    标记文件记录任务 ID：提交失败时删除标记，任务失败后报告仍未生成的，下次检查时重新提交"""
+    if not PDF_AVAILABLE or not app.config['PDF_REPORT_PREGENERATE']:
+        return
+    today = datetime.now().date()
+    start_date_obj = month_floor(today, 1).date()
+    end_date_obj = month_floor(today).date() - timedelta(days=1)
+    if os.path.exists(pdf_report_cache_path(start_date_obj, end_date_obj)):
+        return
+    marker = os.path.join(app.config['PDF_CACHE_FOLDER'], f'pregenerated_{start_date_obj.strftime("%Y%m")}')
+    if os.path.exists(marker):
+        if not _pregenerate_marker_stale(marker):
+            return
+        try:
+            os.remove(marker)
+        except FileNotFoundError:
+            pass
+    os.makedirs(app.config['PDF_CACHE_FOLDER'], exist_ok=True)
+    try:
+        fd = os.open(marker, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        return
+    try:
+        job_id = submit_job('pdf_report', {
+            'start_date': start_date_obj.strftime('%Y-%m-%d'),
+            'end_date': end_date_obj.strftime('%Y-%m-%d'),
+        }, None)
+    except Exception:
+        os.close(fd)
+        os.remove(marker)
+        raise
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        f.write(job_id)
+
+PREGENERATE_CHECK_INTERVAL = 3600  # 预生成检查间隔（秒），提交失败或任务失败后最迟在这段时间后重试
+
+def _pregeneration_delay(now):
+    """距下次检查的秒数：每隔 PREGENERATE_CHECK_INTERVAL 检查一次，月初准时检查"""
+    return max(1, min(PREGENERATE_CHECK_INTERVAL, (month_floor(now, -1) - now).total_seconds()))
+
+def start_report_pregeneration():
+    """在后台线程中定期检查上月报告，尚未生成时提交预生成任务：服务启动时检查一次，之后按
+    _pregeneration_delay 检查，不依赖有人打开页面。各 Web 进程都会检查，由标记文件保证只提交一次"""
+    if not PDF_AVAILABLE or not app.config['PDF_REPORT_PREGENERATE']:
+        return None
+    def run():
+        while True:
+            with app.app_context():
+                try:
+                    warm_previous_month_report()
+                except Exception as e:
+                    app.logger.warning(f'上月报告预生成提交失败: {e}')
+            time.sleep(_pregeneration_delay(datetime.now()))
+    thread = threading.Thread(target=run, name='report-pregenerate', daemon=True)
+    thread.start()
+    return thread
+
+@app.route('/export_pdf_report')
+@login_required
+def export_pdf_report():
+    """导出PDF财务分析报告：已缓存的直接返回，否则提交生成任务"""
+    if not PDF_AVAILABLE:
+        flash('PDF生成功能不可用，请安装reportlab库', 'error')
         return redirect(url_for('statistics'))
+    
+    start_date_obj, end_date_obj = parse_report_period(request.args)
+    cache_path = pdf_report_cache_path(start_date_obj, end_date_obj)
+    if os.path.exists(cache_path):
+        return send_cached_pdf_report(cache_path, start_date_obj, end_date_obj)
+    
+    job_id = submit_job('pdf_report', {
+        'start_date': start_date_obj.strftime('%Y-%m-%d'),
+        'end_date': end_date_obj.strftime('%Y-%m-%d'),
+    }, current_user.id)
+    return redirect(url_for('job_status', job_id=job_id))
+
+
+# 后台任务：提交后立即返回任务 ID，生成工作在进程池中进行；任务状态与结果都保存在磁盘上，
+# 任何线程（及重启后的进程）都能查询，请求线程不等待 reportlab/openpyxl
+JobKind = namedtuple('JobKind', ['run', 'title', 'filename', 'filename_utf8', 'extension', 'mimetype', 'return_endpoint'])
+JOB_PROGRESS_INTERVAL = 0.5  # 进度写入磁盘的最短间隔（秒）
+
+def _run_transactions_excel_job(params, path, progress):
+    conditions, _ = parse_transaction_filters(params)
+    total = db.session.query(db.func.count(Transaction.id)).filter(*conditions).scalar() or 1
+    write_transactions_xlsx(conditions, path, lambda written: progress(100 * written // total, f'已写入 {written} / {total} 条'))
+
+def _run_statistics_excel_job(params, path, progress):
+    write_statistics_xlsx(*parse_report_period(params), path)
+
+def _run_pdf_report_job(params, path, progress):
+    start_date_obj, end_date_obj = parse_report_period(params)
+    # 先取缓存键：生成期间数据若有变化，缓存的是旧版本，下次请求会重新生成
+    cache_path = pdf_report_cache_path(start_date_obj, end_date_obj)
+    write_pdf_report(start_date_obj, end_date_obj, path, progress)
+    store_pdf_report(cache_path, path)
+
+JOB_KINDS = {
+    'transactions_excel': JobKind(_run_transactions_excel_job, '收支记录 Excel 导出', 'transactions', '收支记录', 'xlsx',
+                                  'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', 'transactions'),
+    'statistics_excel': JobKind(_run_statistics_excel_job, '财务分析数据 Excel 导出', 'financial_analysis', '财务分析', 'xlsx',
+                                'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', 'statistics'),
+    'pdf_report': JobKind(_run_pdf_report_job, 'PDF 财务分析报告', 'financial_report', '财务分析报告', 'pdf',
+                          'application/pdf', 'statistics'),
+}
+JOB_ID_PATTERN = re.compile(r'[0-9a-f]{32}')
+
+# max_tasks_per_child 需要 Python 3.11；更早的版本改为整个进程池累计执行 JOB_WORKERS × JOB_MAX_TASKS_PER_CHILD
+# 个任务后换新池，旧池执行完已提交的任务后退出，效果相同
+POOL_MAX_TASKS_PER_CHILD = sys.version_info >= (3, 11)
+_job_executor = None
+_job_executor_tasks = 0
+_job_executor_lock = threading.Lock()
+
+def _shutdown_job_executor(executor, cancel_pending):
+    if cancel_pending and sys.version_info >= (3, 9):
+        executor.shutdown(wait=False, cancel_futures=True)
+    else:
+        executor.shutdown(wait=False)
+
+def job_executor(reset=False):
+    """本进程的任务进程池，首次使用时创建；spawn 方式启动，任务进程不继承 Web 进程的连接和线程。
+    每次调用计为提交一个任务"""
+    global _job_executor, _job_executor_tasks
+    max_tasks = app.config['JOB_MAX_TASKS_PER_CHILD']
+    with _job_executor_lock:
+        if reset and _job_executor is not None:
+            _shutdown_job_executor(_job_executor, cancel_pending=True)
+            _job_executor = None
+        if (_job_executor is not None and not POOL_MAX_TASKS_PER_CHILD
+                and _job_executor_tasks >= app.config['JOB_WORKERS'] * max_tasks):
+            _shutdown_job_executor(_job_executor, cancel_pending=False)
+            _job_executor = None
+        if _job_executor is None:
+            options = {'max_tasks_per_child': max_tasks} if POOL_MAX_TASKS_PER_CHILD else {}
+            _job_executor = ProcessPoolExecutor(
+                max_workers=app.config['JOB_WORKERS'],
+                mp_context=multiprocessing.get_context('spawn'),
+                **options)
+            _job_executor_tasks = 0
+        _job_executor_tasks += 1
+        return _job_executor
+
+def _job_file(job_id, suffix):
+    return os.path.join(app.config['JOB_FOLDER'], job_id + suffix)
+
+def read_job(job_id):
+    """读取任务状态，任务不存在或已过期清理时返回 None"""
+    if not JOB_ID_PATTERN.fullmatch(job_id):
+        return None
+    try:
+        with open(_job_file(job_id, '.json'), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _write_job(job):
+    # 先写临时文件再替换，查询方不会读到写了一半的状态
+    fd, temp_path = tempfile.mkstemp(dir=app.config['JOB_FOLDER'], suffix='.tmp')
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        json.dump(job, f, ensure_ascii=False)
+    os.replace(temp_path, _job_file(job['id'], '.json'))
+
+def update_job(job_id, **fields):
+    job = read_job(job_id)
+    if job is None:
+        return None
+    job.update(fields)
+    _write_job(job)
+    return job
+
+# 排队或执行中的任务状态超过这么多秒未更新，视为所在进程已退出（例如服务重启），可以清理
+JOB_ABANDONED_AFTER = 86400
+
+def cleanup_expired_jobs():
+    """删除结束超过 JOB_RESULT_TTL 的任务状态与结果文件；排队或执行中的任务不删，无论已运行多久，
+    除非超过 JOB_ABANDONED_AFTER 未更新。任务的状态文件在结束时最后写入一次，其修改时间即结束时间"""
+    now = time.time()
+    cutoff = now - app.config['JOB_RESULT_TTL']
+    expired = {}  # 任务 ID -> 是否可以删除
+
+    def job_expired(job_id):
+        if job_id not in expired:
+            status_path = _job_file(job_id, '.json')
+            job = read_job(job_id)
+            try:
+                updated_at = os.path.getmtime(status_path)
+            except OSError:
+                updated_at = 0.0
+            if job is not None and job.get('state') in ('queued', 'running'):
+                expired[job_id] = updated_at < now - JOB_ABANDONED_AFTER
+            else:
+                expired[job_id] = updated_at < cutoff
+        return expired[job_id]
+
+    for entry in os.scandir(app.config['JOB_FOLDER']):
+        try:
+            if entry.stat().st_mtime >= cutoff:
+                continue
+            job_id = entry.name.split('.', 1)[0]
+            if JOB_ID_PATTERN.fullmatch(job_id) and not job_expired(job_id):
+                continue
+            os.remove(entry.path)
+        except OSError:
+            pass
+
+def submit_job(kind, params, user_id):
+    """登记任务并交给进程池，返回任务 ID；params 须可序列化（字符串字典）"""
+    os.makedirs(app.config['JOB_FOLDER'], exist_ok=True)
+    cleanup_expired_jobs()
+    job_id = uuid.uuid4().hex
+    _write_job({
+        'id': job_id,
+        'kind': kind,
+        'user_id': user_id,
+        'state': 'queued',
+        'progress': 0,
+        'message': '排队中',
+        'created_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+    })
+    try:
+        future = job_executor().submit(run_job, job_id, kind, params)
+    except BrokenProcessPool:
+        # 任务进程被系统杀死等情况会使进程池失效，重建后重试一次
+        future = job_executor(reset=True).submit(run_job, job_id, kind, params)
+    future.add_done_callback(partial(_job_future_done, job_id))
+    return job_id
+
+def _job_future_done(job_id, future):
+    # run_job 自己会记录失败；这里只处理任务进程异常退出、来不及写状态的情况
+    if future.cancelled() or future.exception() is not None:
+        job = read_job(job_id)
+        if job and job['state'] not in ('done', 'failed'):
+            update_job(job_id, state='failed', message='任务进程异常退出，请重试',
+                       finished_at=datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+
+def run_job(job_id, kind, params):
+    """在任务进程中执行：生成结果文件并更新任务状态"""
+    job_kind = JOB_KINDS[kind]
+    result_path = _job_file(job_id, '.' + job_kind.extension)
+    partial_path = result_path + '.part'
+    last_update = [0.0]
+
+    def progress(percent, message=''):
+        now = time.monotonic()
+        if now - last_update[0] >= JOB_PROGRESS_INTERVAL:
+            last_update[0] = now
+            update_job(job_id, progress=min(int(percent), 99), message=message)
+
+    # 任务进程只生成一份文件，不值得载入整份交易明细，汇总直接查询数据库
+    app.config['LEDGER_ENGINE'] = False
+    with app.app_context():
+        update_job(job_id, state='running', message='正在生成')
+        try:
+            job_kind.run(params, partial_path, progress)
+            os.replace(partial_path, result_path)
+        except Exception as e:
+            app.logger.exception('后台任务 %s（%s）失败', job_id, kind)
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+            update_job(job_id, state='failed', message=f'生成失败: {e}',
+                       finished_at=datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+            return
+        update_job(job_id, state='done', progress=100, message='已完成', size=os.path.getsize(result_path),
+                   finished_at=datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+
+def get_user_job(job_id):
+    """当前用户可访问的任务（本人提交的，管理员可访问全部），否则 404"""
+    job = read_job(job_id)
+    if job is None or (job['user_id'] != current_user.id and current_user.role != 'admin'):
+        abort(404)
+    return job
+
+def job_payload(job):
+    payload = {key: job.get(key) for key in ('id', 'state', 'progress', 'message', 'created_at', 'finished_at', 'size')}
+    payload['download_url'] = url_for('download_job', job_id=job['id']) if job['state'] == 'done' else None
+    return payload
+
+@app.route('/jobs/<job_id>')
+@login_required
+def job_status(job_id):
+    """任务进度页面，轮询任务状态，完成后自动下载"""
+    job = get_user_job(job_id)
+    job_kind = JOB_KINDS[job['kind']]
+    return render_template('job_status.html', job=job_payload(job), title=job_kind.title,
+                           return_url=url_for(job_kind.return_endpoint))
+
+@app.route('/api/jobs/<job_id>')
+@login_required
+def api_job_status(job_id):
+    return jsonify(job_payload(get_user_job(job_id)))
+
+@app.route('/jobs/<job_id>/download')
+@login_required
+def download_job(job_id):
+    job = get_user_job(job_id)
+    if job['state'] != 'done':
+        abort(404)
+    job_kind = JOB_KINDS[job['kind']]
+    path = _job_file(job_id, '.' + job_kind.extension)
+    if not os.path.exists(path):
+        abort(404)
+    response = send_file(path, mimetype=job_kind.mimetype)
+    
+    # 生成文件名（以提交时间命名）
+    timestamp = datetime.strptime(job['created_at'], '%Y-%m-%d %H:%M:%S').strftime('%Y%m%d_%H%M%S')
+    filename = f'{job_kind.filename}_{timestamp}.{job_kind.extension}'
+    filename_utf8 = f'{job_kind.filename_utf8}_{timestamp}.{job_kind.extension}'
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"; filename*=UTF-8\'\'{quote(filename_utf8)}'
+    
+    return response
 
 @app.route('/receivables')
 @login_required
@@ -2669,6 +4306,7 @@ if __name__ == '__main__':
             print("请检查MySQL连接配置和数据库是否存在")
             exit(1)
     
+    start_report_pregeneration()
     print("\n注意: 当前使用Flask开发服务器")
     print("生产环境请使用: python wsgi.py 或 start_wsgi.bat")
     print("="*50)
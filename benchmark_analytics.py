@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+财务分析服务基准：分析页面、财务数据导出、PDF 报告共用同一份按报告期缓存的分析结果
+
+用法:
+    python benchmark_analytics.py                                   # 最近12个月
+    python benchmark_analytics.py --start 2024-01-01 --end 2024-12-31
+
+依次访问财务分析页面、导出 CSV、生成 PDF 报告（PDF 写到内存，不进入报告缓存），
+每一步先在清空分析缓存的情况下单独执行，再按页面 → 导出 → 报告的顺序连续执行，
+对比耗时和 SQL 查询次数。只读取数据，不修改数据库。
+"""
+
+import io
+import sys
+import time
+from sqlalchemy import event
+from app import app, db, User, PDF_AVAILABLE, analytics_cache, parse_report_period, write_pdf_report
+
+def option(args, name):
+    return args[args.index(name) + 1] if name in args and args.index(name) + 1 < len(args) else None
+
+def main():
+    args = sys.argv[1:]
+    start_date_obj, end_date_obj = parse_report_period({'start_date': option(args, '--start'),
+                                                        'end_date': option(args, '--end')})
+    period = f'start_date={start_date_obj.strftime("%Y-%m-%d")}&end_date={end_date_obj.strftime("%Y-%m-%d")}'
+
+    # 基准过程不提交后台任务
+    app.config['PDF_REPORT_PREGENERATE'] = False
+
+    with app.app_context():
+        admin = User.query.filter_by(role='admin').first()
+        if admin is None:
+            print("❌ 没有管理员账户，无法登录访问页面")
+            return 1
+        engine = db.engine
+        admin_id = admin.id
+
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(admin_id)
+        session['_fresh'] = True
+
+    def get(url):
+        response = client.get(url)
+        if response.status_code >= 400:
+            raise RuntimeError(f'{url}: HTTP {response.status_code}')
+
+    def pdf_report():
+        with app.app_context():
+            write_pdf_report(start_date_obj, end_date_obj, io.BytesIO())
+
+    steps = [
+        ('财务分析页面', lambda: get(f'/statistics?{period}')),
+        ('导出 CSV', lambda: get(f'/export_statistics?format=csv&{period}')),
+    ]
+    if PDF_AVAILABLE:
+        steps.append(('PDF 报告', pdf_report))
+    else:
+        print("- PDF 报告: reportlab 未安装，跳过")
+
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    def run(step):
+        statements.clear()
+        started = time.perf_counter()
+        step()
+        return (time.perf_counter() - started) * 1000, len(statements)
+
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        # 预热：模板编译、字体注册、连接池等一次性开销不计入
+        for _, step in steps:
+            step()
+
+        alone = {}
+        for name, step in steps:
+            analytics_cache.clear()
+            alone[name] = run(step)
+
+        analytics_cache.clear()
+        before = analytics_cache.stats()
+        shared = {name: run(step) for name, step in steps}
+        after = analytics_cache.stats()
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+
+    print(f"报告期 {start_date_obj} ~ {end_date_obj}")
+    print(f"{'':<14}{'单独执行':>20}{'共用缓存':>20}")
+    for name, _ in steps:
+        (alone_ms, alone_queries), (shared_ms, shared_queries) = alone[name], shared[name]
+        print(f"{name:<14}{alone_ms:>10.1f} ms {alone_queries:>3} 次查询{shared_ms:>10.1f} ms {shared_queries:>3} 次查询")
+    print(f"连续执行时分析缓存命中 {after['hits'] - before['hits']} 次，未命中 {after['misses'] - before['misses']} 次")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+交易列存引擎基准：载入耗时、内存占用，以及各维度分组汇总与数据库查询的耗时对比
+
+用法:
+    python benchmark_ledger_engine.py                                   # 最近12个月
+    python benchmark_ledger_engine.py --start 2024-01-01 --end 2024-12-31
+    python benchmark_ledger_engine.py --repeat 50                       # 每项重复次数（默认 20，取中位数）
+
+需要安装 numpy。只读取数据，不修改数据库。
+"""
+
+import statistics
+import sys
+import time
+from datetime import timedelta
+from app import (app, db, Transaction, LEDGER_ENGINE_AVAILABLE, ledger_engine, parse_report_period,
+                 period_monthly_totals, period_category_totals)
+
+def option(args, name, default=None):
+    return args[args.index(name) + 1] if name in args and args.index(name) + 1 < len(args) else default
+
+def median_ms(func, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+def orm_category_totals(start_date_obj, end_date_obj):
+    """对照：通过 ORM 载入明细后在 Python 中分组"""
+    totals = {}
+    for transaction in Transaction.query.filter(
+        Transaction.date >= start_date_obj,
+        Transaction.date < end_date_obj + timedelta(days=1)
+    ):
+        key = (transaction.type, transaction.category_id)
+        totals[key] = totals.get(key, 0) + transaction.amount
+    return totals
+
+def main():
+    if not LEDGER_ENGINE_AVAILABLE:
+        print("❌ 未安装 numpy，列存引擎不可用")
+        return 1
+    args = sys.argv[1:]
+    start_date_obj, end_date_obj = parse_report_period({'start_date': option(args, '--start'),
+                                                        'end_date': option(args, '--end')})
+    repeat = int(option(args, '--repeat', 20))
+
+    with app.app_context():
+        app.config['LEDGER_ENGINE'] = True
+        engine = ledger_engine()
+        stats = engine.stats()
+        print(f"载入 {stats['rows']} 条，用时 {stats['load_seconds']:.2f} 秒，"
+              f"列数组占用 {stats['memory_bytes'] / 1048576:.2f} MB（每条 {stats['bytes_per_row']} 字节）")
+        print(f"报告期 {start_date_obj} ~ {end_date_obj}，各项取 {repeat} 次的中位数")
+
+        print("\n列存引擎分组汇总（不含同步检查）")
+        for by in ('type', 'month', 'weekday', 'category', 'supplier', 'product'):
+            elapsed = median_ms(lambda: engine.aggregate(by, start_date_obj, end_date_obj), repeat)
+            groups = len(engine.aggregate(by, start_date_obj, end_date_obj))
+            print(f"  {by:<10}{elapsed * 1000:>10.0f} µs  {groups} 组")
+
+        print("\n报告期汇总：列存引擎（含版本号同步检查） / 数据库查询")
+        def in_new_context(func):
+            # 引擎每个请求（应用上下文）同步一次，每次调用用新的上下文以计入同步检查
+            with app.app_context():
+                func(start_date_obj, end_date_obj)
+
+        for name, func in (('按月', period_monthly_totals), ('按分类', period_category_totals)):
+            app.config['LEDGER_ENGINE'] = True
+            with_engine = median_ms(lambda: in_new_context(func), repeat)
+            app.config['LEDGER_ENGINE'] = False
+            with_sql = median_ms(lambda: in_new_context(func), repeat)
+            print(f"  {name:<8}{with_engine:>10.2f} ms {with_sql:>10.2f} ms")
+
+        orm = median_ms(lambda: orm_category_totals(start_date_obj, end_date_obj), max(1, repeat // 5))
+        db.session.expunge_all()
+        print(f"  对照：ORM 载入明细后按分类分组 {orm:.2f} ms")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
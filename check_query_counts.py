@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+检查列表页与导出的 SQL 查询次数，发现 N+1 查询
+
+用法:
+    python check_query_counts.py                 # 使用第一个管理员账户访问各页面
+    python check_query_counts.py --max-repeat 3  # 同一条 SQL 在一次请求内允许重复的次数
+
+只发送 GET 请求，不修改数据。对当前数据库逐页统计查询次数，并列出一次请求内反复执行的同一条 SQL
+（参数不同）——这通常说明模板或循环里逐行触发了懒加载。语句文本各不相同的逐行查询这里发现不了；
+查询次数是否与数据行数无关由 tests/test_query_counts.py 在两份行数不同的数据上对比验证。
+Excel 导出和 PDF 报告由后台任务生成，这里在本进程内直接执行任务函数，结果写到临时目录。
+"""
+
+import os
+import sys
+import tempfile
+from collections import Counter
+from sqlalchemy import event
+from app import app, db, User, Supplier, DASHBOARD_WIDGETS, JOB_KINDS, EXCEL_AVAILABLE, PDF_AVAILABLE
+
+ROUTES = [
+    '/transactions',
+    '/transactions?type=expense',
+    '/export_transactions',
+    '/statistics',
+    '/categories',
+    '/products',
+    '/suppliers',
+    '/receivables',
+    '/add_transaction',
+] + [f'/api/dashboard/{name}' for name in DASHBOARD_WIDGETS]
+
+# 后台任务：(任务类型, 参数, 是否可用)
+JOBS = [
+    ('transactions_excel', {}, True),
+    ('statistics_excel', {}, EXCEL_AVAILABLE),
+    ('pdf_report', {}, PDF_AVAILABLE),
+]
+
+def main():
+    args = sys.argv[1:]
+    max_repeat = int(args[args.index('--max-repeat') + 1]) if '--max-repeat' in args else 3
+
+    # 检查过程不提交后台任务；PDF 报告缓存写到临时目录
+    app.config['PDF_REPORT_PREGENERATE'] = False
+
+    with app.app_context():
+        admin = User.query.filter_by(role='admin').first()
+        if admin is None:
+            print("❌ 没有管理员账户，无法登录检查")
+            return 1
+        supplier = Supplier.query.first()
+        routes = ROUTES + ([f'/supplier/{supplier.id}'] if supplier else [])
+        engine = db.engine
+        admin_id = admin.id
+
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, 'before_cursor_execute', record)
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(admin_id)
+        session['_fresh'] = True
+
+    def report(name, ok):
+        repeated = [(sql, n) for sql, n in Counter(statements).items() if n > max_repeat]
+        mark = '✓' if ok and not repeated else '❌'
+        print(f"{mark} {name}, {len(statements)} 次查询")
+        for sql, n in repeated:
+            print(f"    重复 {n} 次: {' '.join(sql.split())[:160]}")
+        return mark == '✓'
+
+    problems = 0
+    try:
+        for url in routes:
+            statements.clear()
+            response = client.get(url)
+            if not report(f"{url}: HTTP {response.status_code}", response.status_code < 500):
+                problems += 1
+
+        with tempfile.TemporaryDirectory() as folder, app.app_context():
+            app.config['PDF_CACHE_FOLDER'] = os.path.join(folder, 'report_cache')
+            for kind, params, available in JOBS:
+                if not available:
+                    print(f"- 任务 {kind}: 依赖库未安装，跳过")
+                    continue
+                statements.clear()
+                try:
+                    JOB_KINDS[kind].run(params, os.path.join(folder, kind), lambda *args: None)
+                    ok = True
+                except Exception as e:
+                    print(f"    执行失败: {e}")
+                    ok = False
+                if not report(f"任务 {kind}", ok):
+                    problems += 1
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+
+    if problems:
+        print(f"发现 {problems} 个页面存在问题")
+        return 1
+    print("✓ 各页面没有反复执行的查询")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
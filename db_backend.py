@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+"""
+数据库后端：连接地址、连接池参数，以及 MySQL 与 SQLite 之间的方言差异
+
+DB_BACKEND=mysql（默认）连接 DB_HOST / DB_USER / DB_PASSWORD / DB_NAME 配置的 MySQL；
+DB_BACKEND=sqlite 使用本地 SQLite 文件 SQLITE_PATH（相对路径位于 instance 目录），适合单店、门店边缘设备等
+单机部署，省去数据库的网络往返。设置了 DATABASE_URL 时优先使用，按地址前缀判断后端。
+
+SQLite 连接打开时设置 WAL 日志模式（读不阻塞写、写不阻塞读）、synchronous=NORMAL、外键检查、页缓存等参数，
+写入遇到锁时最多等待 SQLITE_BUSY_TIMEOUT 毫秒。每个线程从连接池取用自己的连接，连接不在线程间同时使用。
+
+按月、按日分组使用交易表上持久化的年月、天序号列，不依赖各数据库的日期函数；
+其余差异（窗口函数、插入或累加、关键词检索）集中在本模块。关键词检索在 MySQL 上使用 ngram 全文索引，
+在 SQLite 上使用 FTS5 trigram 全文索引表（由触发器与交易表同步，见 sqlite_fts_ddl）。
+"""
+
+import os
+import re
+import sqlite3
+from sqlalchemy import and_, or_, event, select, literal_column, table as table_clause
+from sqlalchemy.engine import Engine
+from sqlalchemy.dialects.mysql import match, insert as mysql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+# 全文索引能检索的最短词长，默认与 MySQL ngram_token_size 默认值一致
+FULLTEXT_MIN_TERM = 2
+# SQLite FTS5 trigram 分词按连续 3 个字符建索引，更短的词无法用索引检索
+TRIGRAM_MIN_TERM = 3
+
+def database_url():
+    """按环境变量确定数据库地址"""
+    url = os.getenv('DATABASE_URL')
+    if url:
+        return url
+    if os.getenv('DB_BACKEND', 'mysql').lower() == 'sqlite':
+        return 'sqlite:///' + os.getenv('SQLITE_PATH', 'moneymind.db')
+    return (f"mysql://{os.getenv('DB_USER', '')}:{os.getenv('DB_PASSWORD', '')}@{os.getenv('DB_HOST', '')}/"
+            f"{os.getenv('DB_NAME', '')}?charset=utf8mb4&connect_timeout=60&read_timeout=60&write_timeout=60")
+
+def is_sqlite(url):
+    return url.startswith('sqlite')
+
+def sqlite_busy_timeout():
+    """写入遇到锁时的等待毫秒数"""
+    return int(os.getenv('SQLITE_BUSY_TIMEOUT', 5000))
+
+def engine_options(url):
+    """SQLAlchemy 引擎参数"""
+    if not is_sqlite(url):
+        return {
+            'pool_size': 10,
+            'pool_timeout': 20,
+            'pool_recycle': 3600,
+            'max_overflow': 20,
+            'pool_pre_ping': True
+        }
+    if url in ('sqlite://', 'sqlite:///') or ':memory:' in url:
+        # 内存数据库由 Flask-SQLAlchemy 使用单连接池
+        return {}
+    return {
+        # 本地文件没有断线问题，不需要 pre_ping / recycle；连接由取用它的线程独占，
+        # 归还后可被其他线程复用，因此关闭 sqlite3 的同线程检查
+        'pool_size': int(os.getenv('SQLITE_POOL_SIZE', 10)),
+        'max_overflow': 10,
+        'pool_timeout': 20,
+        'connect_args': {'timeout': sqlite_busy_timeout() / 1000, 'check_same_thread': False},
+    }
+
+def sqlite_pragmas():
+    """每个 SQLite 连接打开时执行的 PRAGMA"""
+    return {
+        'journal_mode': 'WAL',
+        # WAL 模式下 NORMAL 不会损坏数据库，断电时最多丢失最近提交的几个事务，换来提交时不再每次刷盘
+        'synchronous': 'NORMAL',
+        'busy_timeout': sqlite_busy_timeout(),
+        # 与 MySQL InnoDB 一致地检查外键
+        'foreign_keys': 'ON',
+        'cache_size': -1024 * int(os.getenv('SQLITE_CACHE_MB', 64)),
+        'temp_store': 'MEMORY',
+        'mmap_size': 1048576 * int(os.getenv('SQLITE_MMAP_MB', 256)),
+    }
+
+_pragmas = {}
+
+@event.listens_for(Engine, 'connect')
+def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+    if not _pragmas or not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in _pragmas.items():
+            cursor.execute(f'PRAGMA {name}={value}')
+    finally:
+        cursor.close()
+
+def configure_sqlite(pragmas):
+    """设置之后新建的 SQLite 连接执行的 PRAGMA（对已打开的连接不生效）"""
+    _pragmas.clear()
+    _pragmas.update(pragmas)
+
+def sqlite_status(connection):
+    """SQLite 连接当前生效的主要参数，用于核对配置"""
+    return {name: connection.exec_driver_sql(f'PRAGMA {name}').scalar() for name in _pragmas or sqlite_pragmas()}
+
+def fulltext_min_term():
+    """MySQL 全文索引能检索的最短词长：NGRAM_TOKEN_SIZE，应与服务器的 ngram_token_size 一致"""
+    return int(os.getenv('NGRAM_TOKEN_SIZE', FULLTEXT_MIN_TERM))
+
+def supports_window_functions(dialect):
+    """数据库是否支持窗口函数（MySQL 8.0+、MariaDB 10.2+、SQLite 3.25+）"""
+    version = dialect.server_version_info or ()
+    if dialect.name == 'mysql':
+        return version >= ((10, 2) if getattr(dialect, 'is_mariadb', False) else (8, 0))
+    if dialect.name == 'sqlite':
+        return version >= (3, 25)
+    return True
+
+def supports_upsert(dialect):
+    """是否支持单条语句的插入或更新（MySQL ON DUPLICATE KEY UPDATE、SQLite 3.24+ ON CONFLICT DO UPDATE）"""
+    if dialect.name == 'mysql':
+        return True
+    if dialect.name == 'sqlite':
+        return (dialect.server_version_info or ()) >= (3, 24)
+    return False
+
+def increment_upsert(dialect, table, keys, increments):
+    """插入 keys 与 increments 组成的一行；keys 对应的行已存在时改为把 increments 各列累加到现有值上。
+    keys 须对应表上的主键或唯一约束，调用前用 supports_upsert 判断是否可用"""
+    values = {**keys, **increments}
+    if dialect.name == 'mysql':
+        statement = mysql_insert(table).values(values)
+        return statement.on_duplicate_key_update(
+            {name: table.c[name] + statement.inserted[name] for name in increments})
+    statement = sqlite_insert(table).values(values)
+    return statement.on_conflict_do_update(
+        index_elements=[table.c[name] for name in keys],
+        set_={name: table.c[name] + statement.excluded[name] for name in increments})
+
+def supports_trigram_fts(dialect):
+    """是否为支持 FTS5 trigram 分词的 SQLite（3.34+）"""
+    return dialect.name == 'sqlite' and (dialect.server_version_info or ()) >= (3, 34)
+
+def sqlite_fts_ddl(table_name, fts_table, columns):
+    """为 table_name 的文本列 columns 建 FTS5 trigram 全文索引表的语句：外部内容表（不重复保存文本），
+    插入、删除、修改这些列时由触发器同步，最后按现有数据重建索引。已存在的索引表和触发器先删除"""
+    names = ', '.join(columns)
+    new_values = ', '.join(f'new.{name}' for name in columns)
+    old_values = ', '.join(f'old.{name}' for name in columns)
+    insert_new = f'INSERT INTO {fts_table}(rowid, {names}) VALUES (new.id, {new_values});'
+    delete_old = f"INSERT INTO {fts_table}({fts_table}, rowid, {names}) VALUES ('delete', old.id, {old_values});"
+    return [
+        f'DROP TRIGGER IF EXISTS {fts_table}_ai',
+        f'DROP TRIGGER IF EXISTS {fts_table}_ad',
+        f'DROP TRIGGER IF EXISTS {fts_table}_au',
+        f'DROP TABLE IF EXISTS {fts_table}',
+        f"CREATE VIRTUAL TABLE {fts_table} USING fts5({names}, content='{table_name}', content_rowid='id', "
+        f"tokenize='trigram')",
+        f'CREATE TRIGGER {fts_table}_ai AFTER INSERT ON "{table_name}" BEGIN {insert_new} END',
+        f'CREATE TRIGGER {fts_table}_ad AFTER DELETE ON "{table_name}" BEGIN {delete_old} END',
+        f'CREATE TRIGGER {fts_table}_au AFTER UPDATE OF {names} ON "{table_name}" BEGIN {delete_old} {insert_new} END',
+        f"INSERT INTO {fts_table}({fts_table}) VALUES ('rebuild')",
+    ]
+
+def _like_condition(columns, term):
+    pattern = '%' + term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+    return or_(*(column.like(pattern, escape='\\') for column in columns))
+
+def keyword_condition(dialect, columns, keyword, fts_table=None, id_column=None):
+    """多个文本列的关键词条件，多个词以空格分隔且需同时命中（任一列包含即可）
+
+    MySQL 使用 columns 上的 ngram 全文索引（布尔模式）：不短于 ngram_token_size（见 fulltext_min_term）的词
+    走索引，更短的词索引查不到，用 LIKE 在索引命中的行中筛选。ngram_token_size 为默认的 2 时单个汉字属于短词，
+    只输入短词时为全表扫描；需要索引单字检索时把服务器的 ngram_token_size 设为 1 并重建索引（见 DEPLOYMENT.md）。
+    SQLite 传入 fts_table 时同理，不短于 3 个字符的词通过该 FTS5 trigram 索引表按 id_column 检索。
+    其他数据库使用 LIKE。
+    """
+    if fts_table is not None and supports_trigram_fts(dialect):
+        terms = keyword.split()
+        indexed = [term for term in terms if len(term) >= TRIGRAM_MIN_TERM]
+        conditions = [_like_condition(columns, term) for term in terms if len(term) < TRIGRAM_MIN_TERM]
+        if indexed:
+            query = ' AND '.join('"' + term.replace('"', '""') + '"' for term in indexed)
+            conditions.insert(0, id_column.in_(
+                select(literal_column('rowid')).select_from(table_clause(fts_table))
+                .where(literal_column(fts_table).op('MATCH')(query))))
+        return and_(*conditions)
+    if dialect.name == 'mysql':
+        min_term = fulltext_min_term()
+        indexed = []
+        conditions = []
+        for term in keyword.split():
+            # 去掉布尔模式的运算符，避免用户输入改变检索语义
+            pieces = re.sub(r'[+\-<>()~*"@]', ' ', term).split()
+            indexed += [piece for piece in pieces if len(piece) >= min_term]
+            if not pieces or any(len(piece) < min_term for piece in pieces):
+                conditions.append(_like_condition(columns, term))
+        if indexed:
+            against = ' '.join(f'+"{term}"' for term in indexed)
+            conditions.insert(0, match(*columns, against=against).in_boolean_mode())
+        return and_(*conditions)
+    return and_(*(_like_condition(columns, term) for term in keyword.split()))
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+收支记录批量导入脚本
+
+用法:
+    python import_transactions.py 文件.csv                   # 以第一个管理员身份导入
+    python import_transactions.py 文件.xlsx --user 用户名    # 指定记录所属用户
+    python import_transactions.py 文件.csv --encoding gbk    # 指定 CSV 编码（默认 UTF-8）
+    python import_transactions.py 文件.csv --dry-run         # 只校验，不写入
+
+表头与收支记录导出文件一致（交易日期、交易类型、分类、金额、备注信息），
+另可包含：供应商描述、供应商、商品、数量、单价。有问题的行会跳过并逐行列出。
+"""
+
+import os
+import sys
+import time
+from app import app, User, import_transactions_file, TransactionImportError
+
+def option(args, name, default=None):
+    return args[args.index(name) + 1] if name in args and args.index(name) + 1 < len(args) else default
+
+def main():
+    args = sys.argv[1:]
+    paths = [arg for i, arg in enumerate(args)
+             if not arg.startswith('--') and (i == 0 or args[i - 1] not in ('--user', '--encoding'))]
+    if len(paths) != 1:
+        print(__doc__)
+        return 2
+    path = paths[0]
+    if not os.path.exists(path):
+        print(f"❌ 文件不存在: {path}")
+        return 2
+
+    with app.app_context():
+        username = option(args, '--user')
+        user = User.query.filter_by(username=username).first() if username else \
+            User.query.filter_by(role='admin').first()
+        if user is None:
+            print(f"❌ 用户不存在: {username}" if username else "❌ 没有管理员账户，请用 --user 指定用户")
+            return 2
+
+        dry_run = '--dry-run' in args
+        started = time.perf_counter()
+        print(f"开始{'校验' if dry_run else '导入'} {path} ...")
+        try:
+            with open(path, 'rb') as stream:
+                result = import_transactions_file(stream, os.path.basename(path), user.id,
+                                                  encoding=option(args, '--encoding', 'utf-8-sig'),
+                                                  dry_run=dry_run)
+        except TransactionImportError as e:
+            print(f"❌ {e}")
+            return 1
+        elapsed = time.perf_counter() - started
+
+        for line_number, message in result.errors:
+            print(f"  第 {line_number} 行: {message}")
+        if result.error_count > len(result.errors):
+            print(f"  ……另有 {result.error_count - len(result.errors)} 行问题未列出")
+        action = '可导入' if dry_run else '已导入'
+        print(f"✓ {action} {result.inserted} 条，跳过 {result.skipped} 行，用时 {elapsed:.1f} 秒")
+        return 1 if result.skipped else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
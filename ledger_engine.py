@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+"""
+交易列存分析引擎（需要 numpy）
+
+每个进程在内存中保存一份精简的交易明细，每列一个 numpy 数组：日期为 int32 天数（自 1970-01-01 起）
+及 int16 月序号，金额为 float64，类型、分类、供应商、商品为小整数编码（0 表示空值）。明细按日期排序，
+日期范围用二分查找截取，筛选用布尔掩码，分组求和用 bincount，全部是向量运算。
+
+本模块不访问数据库：调用方把查询到的明细行 (日期, 金额, 类型, 分类ID, 供应商ID, 商品ID)
+分批交给 load / replace_months。数据按月整体替换，由调用方根据每月数据版本号决定哪些月份需要重新读取。
+"""
+
+import threading
+import time
+from collections import namedtuple
+from datetime import date
+import numpy as np
+
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+WEEKDAY_OFFSET = 3  # 1970-01-01 是星期四（星期一为 0）
+
+# 编码列及其存储类型
+CODE_COLUMNS = (('type', np.uint8), ('category', np.uint16), ('supplier', np.uint16), ('product', np.uint32))
+GROUP_KEYS = ('type', 'month', 'weekday', 'category', 'supplier', 'product')
+
+LedgerColumns = namedtuple('LedgerColumns', ['day', 'month', 'amount'] + [name for name, _ in CODE_COLUMNS])
+
+def day_number(day):
+    """日期（date 或 datetime）对应的天数"""
+    return day.toordinal() - EPOCH_ORDINAL
+
+def month_number(month):
+    """'YYYY-MM' 对应的月序号（1970-01 为 0）"""
+    return (int(month[:4]) - 1970) * 12 + int(month[5:]) - 1
+
+def month_label(number):
+    return f'{1970 + number // 12:04d}-{number % 12 + 1:02d}'
+
+def _month_numbers(days):
+    return days.astype('datetime64[D]').astype('datetime64[M]').astype(np.int16)
+
+class CodeBook:
+    """取值与小整数编码的对照，编码 0 固定表示空值；只增不减，已有编码保持不变"""
+
+    def __init__(self, dtype):
+        self.dtype = dtype
+        self.values = [None]
+        self.codes = {None: 0}
+
+    def encode(self, values):
+        codes = self.codes
+        for value in set(values).difference(codes):
+            if len(self.values) > np.iinfo(self.dtype).max:
+                raise OverflowError(f'编码数超出 {np.dtype(self.dtype).name} 的范围')
+            codes[value] = len(self.values)
+            self.values.append(value)
+        return np.fromiter((codes[value] for value in values), dtype=self.dtype, count=len(values))
+
+def _empty_columns():
+    return LedgerColumns(np.empty(0, np.int32), np.empty(0, np.int16), np.empty(0, np.float64),
+                         *(np.empty(0, dtype) for _, dtype in CODE_COLUMNS))
+
+class LedgerEngine:
+    """交易明细的列存副本。写入（load / replace_months）整体替换列数组，查询读取替换前后任一完整版本，无需加锁"""
+
+    def __init__(self):
+        self.codebooks = {name: CodeBook(dtype) for name, dtype in CODE_COLUMNS}
+        self.columns = _empty_columns()
+        self.versions = {}  # 已载入的各月数据版本号，由调用方维护
+        self.loaded_at = None
+        self.load_seconds = 0.0
+        self.refreshes = 0
+        self.refreshed_months = 0
+        self._write_lock = threading.Lock()
+
+    def _build(self, batches):
+        """把若干批明细行转换为列数组"""
+        parts = []
+        for rows in batches:
+            if not rows:
+                continue
+            dates, amounts, *codes = zip(*rows)
+            days = np.array(dates, dtype='datetime64[D]').astype(np.int32)
+            parts.append(LedgerColumns(
+                days,
+                _month_numbers(days),
+                np.array(amounts, dtype=np.float64),
+                *(self.codebooks[name].encode(values) for (name, _), values in zip(CODE_COLUMNS, codes))
+            ))
+        return parts
+
+    def _install(self, parts):
+        columns = LedgerColumns(*(np.concatenate(arrays) for arrays in zip(*parts)))
+        order = np.argsort(columns.day, kind='stable')
+        self.columns = LedgerColumns(*(array[order] for array in columns))
+
+    def load(self, batches):
+        """全量载入明细，batches 为明细行列表的迭代器"""
+        started = time.perf_counter()
+        with self._write_lock:
+            self._install([_empty_columns()] + self._build(batches))
+            self.loaded_at = time.time()
+            self.load_seconds = time.perf_counter() - started
+
+    def replace_months(self, months, batches):
+        """用 batches 中的明细替换 months（'YYYY-MM' 列表）各月的全部明细"""
+        with self._write_lock:
+            parts = self._build(batches)
+            current = self.columns
+            keep = ~np.isin(current.month, [month_number(month) for month in months])
+            self._install([LedgerColumns(*(array[keep] for array in current))] + parts)
+            self.refreshes += 1
+            self.refreshed_months += len(months)
+
+    def aggregate(self, by, start=None, end=None, **filters):
+        """[start, end]（含两端，缺省为不限）内按类型和 by 分组的金额合计与笔数
+
+        by 为 GROUP_KEYS 之一；filters 为 type/category/supplier/product 等于给定值（分类等传 ID）。
+        返回 {(类型, 分组值): (合计, 笔数)}，分组值为年月字符串、星期（0 为星期一）或分类/供应商/商品 ID。
+        """
+        if by not in GROUP_KEYS:
+            raise ValueError(f'不支持的分组: {by}')
+        columns = self.columns
+        lo = 0 if start is None else np.searchsorted(columns.day, day_number(start), 'left')
+        hi = len(columns.day) if end is None else np.searchsorted(columns.day, day_number(end), 'right')
+        window = LedgerColumns(*(array[lo:hi] for array in columns))
+
+        mask = None
+        for name, value in filters.items():
+            code = self.codebooks[name].codes.get(value)
+            if code is None:
+                return {}
+            matched = getattr(window, name) == code
+            mask = matched if mask is None else mask & matched
+        if mask is not None:
+            window = LedgerColumns(*(array[mask] for array in window))
+        if not len(window.day):
+            return {}
+
+        if by == 'month':
+            # 明细按日期排序，首行即最早的月份
+            base = int(window.month[0])
+            keys = window.month.astype(np.intp) - base
+            label = lambda key: month_label(base + key)
+        elif by == 'weekday':
+            keys = (window.day + WEEKDAY_OFFSET) % 7
+            label = int
+        else:
+            keys = getattr(window, by)
+            label = self.codebooks[by].values.__getitem__
+
+        width = int(keys.max()) + 1
+        combined = window.type.astype(np.intp) * width + keys
+        size = len(self.codebooks['type'].values) * width
+        totals = np.bincount(combined, weights=window.amount, minlength=size)
+        counts = np.bincount(combined, minlength=size)
+        type_values = self.codebooks['type'].values
+        result = {}
+        for index in np.flatnonzero(counts):
+            type_code, key = divmod(int(index), width)
+            result[(type_values[type_code], label(key))] = (float(totals[index]), int(counts[index]))
+        return result
+
+    def memory_bytes(self):
+        """列数组占用的字节数（不含编码对照表）"""
+        return sum(array.nbytes for array in self.columns)
+
+    def stats(self):
+        return {
+            'rows': len(self.columns.day),
+            'memory_bytes': self.memory_bytes(),
+            'bytes_per_row': round(self.memory_bytes() / len(self.columns.day), 1) if len(self.columns.day) else 0,
+            'codes': {name: len(book.values) - 1 for name, book in self.codebooks.items()},
+            'loaded_at': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self.loaded_at)) if self.loaded_at else None,
+            'load_seconds': round(self.load_seconds, 3),
+            'refreshes': self.refreshes,
+            'refreshed_months': self.refreshed_months,
+        }
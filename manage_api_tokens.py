@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+API 令牌管理脚本（收银机、移动端调用 /api/transactions/batch 使用）
+
+用法:
+    python manage_api_tokens.py create 名称 --user 用户名   # 生成令牌，明文只显示这一次
+    python manage_api_tokens.py list                        # 列出全部令牌
+    python manage_api_tokens.py revoke 令牌ID               # 停用令牌
+
+客户端调用时在请求头中携带: Authorization: Bearer <令牌>
+各工作进程会缓存令牌校验结果，停用后最多 API_TOKEN_CACHE_TTL 秒内全部生效。
+"""
+
+import sys
+from app import app, db, User, ApiToken, create_api_token
+
+def main():
+    args = sys.argv[1:]
+    command = args[0] if args else None
+
+    with app.app_context():
+        db.create_all()
+
+        if command == 'create' and len(args) >= 2:
+            username = args[args.index('--user') + 1] if '--user' in args[:-1] else None
+            user = User.query.filter_by(username=username).first() if username else None
+            if user is None:
+                print(f"❌ 请用 --user 指定有效的用户名{f'（找不到 {username}）' if username else ''}")
+                return 1
+            if user.role == 'employee':
+                print("❌ 员工账户没有写入权限，不能用于 API 令牌")
+                return 1
+            token = create_api_token(args[1], user.id)
+            print(f"✓ 已为 {user.username} 创建令牌「{args[1]}」:")
+            print(f"  {token}")
+            print("请妥善保存，令牌明文不会再次显示")
+            return 0
+
+        if command == 'list':
+            tokens = ApiToken.query.order_by(ApiToken.id).all()
+            if not tokens:
+                print("暂无 API 令牌")
+            for token in tokens:
+                status = '启用' if token.is_active else '已停用'
+                print(f"  [{token.id}] {token.name}  用户: {token.user.username}  "
+                      f"创建于 {token.created_at.strftime('%Y-%m-%d %H:%M')}  {status}")
+            return 0
+
+        if command == 'revoke' and len(args) == 2 and args[1].isdigit():
+            token = db.session.get(ApiToken, int(args[1]))
+            if token is None:
+                print(f"❌ 令牌不存在: {args[1]}")
+                return 1
+            token.is_active = False
+            db.session.commit()
+            print(f"✓ 已停用令牌「{token.name}」")
+            return 0
+
+        print(__doc__)
+        return 2
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+数据库版本化迁移脚本
+
+用法:
+    python migrate.py           # 依次执行尚未执行的迁移
+    python migrate.py --status  # 只列出各迁移的执行状态
+
+已执行的迁移记录在 schema_migrations 表中，重复运行是安全的。
+新增迁移时在 MIGRATIONS 末尾追加 (版本号, 说明, 函数)，版本号只增不改。
+"""
+
+import sys
+from datetime import datetime
+from sqlalchemy import inspect, bindparam
+from sqlalchemy.schema import CreateColumn
+import db_backend
+from app import app, db, Transaction, date_buckets, create_transaction_fts, TRANSACTION_FTS_TABLE
+
+schema_migrations = db.Table(
+    'schema_migrations',
+    db.Column('version', db.String(20), primary_key=True),
+    db.Column('description', db.String(200)),
+    db.Column('applied_at', db.DateTime, nullable=False),
+)
+
+def _create_missing_indexes(model, names):
+    """按模型上声明的索引补建缺失的索引，返回实际创建的索引名"""
+    existing = {index['name'] for index in inspect(db.engine).get_indexes(model.__tablename__)}
+    created = []
+    for index in model.__table__.indexes:
+        if index.name in names and index.name not in existing:
+            index.create(db.engine)
+            created.append(index.name)
+    return created
+
+def migration_001_transaction_indexes():
+    """交易表热点查询的复合索引"""
+    return _create_missing_indexes(Transaction, {
+        'ix_transaction_date_id',
+        'ix_transaction_type_date_amount',
+        'ix_transaction_category_date',
+        'ix_transaction_supplier_date',
+        'ix_transaction_product_date',
+    })
+
+def migration_002_transaction_fulltext():
+    """交易描述的 ngram 全文索引，仅 MySQL"""
+    if db.engine.dialect.name != 'mysql':
+        return []
+    return _create_missing_indexes(Transaction, {'ft_transaction_text'})
+
+def _add_missing_columns(model, names):
+    """按模型上声明的列补加缺失的列，返回实际添加的列名"""
+    table = model.__table__
+    existing = {column['name'] for column in inspect(db.engine).get_columns(table.name)}
+    added = []
+    with db.engine.begin() as conn:
+        for name in names:
+            if name not in existing:
+                column_ddl = CreateColumn(table.c[name]).compile(dialect=conn.dialect)
+                conn.exec_driver_sql(f'ALTER TABLE {conn.dialect.identifier_preparer.format_table(table)} '
+                                     f'ADD COLUMN {column_ddl}')
+                added.append(name)
+    return added
+
+def _backfill_date_buckets(batch_size=5000):
+    """分批回填分桶列为空的交易，每批一个事务，返回回填的条数"""
+    table = Transaction.__table__
+    update = table.update().where(table.c.id == bindparam('row_id')).values(
+        month=bindparam('bucket_month'), day_number=bindparam('bucket_day'))
+    filled = 0
+    while True:
+        with db.engine.begin() as conn:
+            rows = conn.execute(db.select(table.c.id, table.c.date).where(
+                db.or_(table.c.month.is_(None), table.c.day_number.is_(None))
+            ).order_by(table.c.id).limit(batch_size)).all()
+            if not rows:
+                return filled
+            params = []
+            for row in rows:
+                month, day = date_buckets(row.date)
+                params.append({'row_id': row.id, 'bucket_month': month, 'bucket_day': day})
+            conn.execute(update, params)
+        filled += len(rows)
+        print(f"  已回填 {filled} 条")
+
+def migration_003_transaction_date_buckets():
+    """交易表年月、天序号分桶列：补加列、回填已有交易、建分组索引"""
+    added = _add_missing_columns(Transaction, ('month', 'day_number'))
+    _backfill_date_buckets()
+    return added + _create_missing_indexes(Transaction, {
+        'ix_transaction_month_bucket',
+        'ix_transaction_day_bucket',
+    })
+
+def migration_004_transaction_fts():
+    """交易描述的 FTS5 trigram 全文索引表及同步触发器，仅 SQLite（3.34+）；按现有交易建立索引"""
+    with db.engine.begin() as conn:
+        if not db_backend.supports_trigram_fts(conn.dialect):
+            return []
+        create_transaction_fts(conn)
+    return [TRANSACTION_FTS_TABLE]
+
+MIGRATIONS = [
+    ('001', '交易表复合索引', migration_001_transaction_indexes),
+    ('002', '交易描述全文索引', migration_002_transaction_fulltext),
+    ('003', '交易日期分桶列', migration_003_transaction_date_buckets),
+    ('004', '交易描述全文索引（SQLite）', migration_004_transaction_fts),
+]
+
+def applied_versions():
+    schema_migrations.create(db.engine, checkfirst=True)
+    with db.engine.connect() as conn:
+        return {row.version for row in conn.execute(db.select(schema_migrations.c.version))}
+
+def main():
+    status_only = '--status' in sys.argv[1:]
+    with app.app_context():
+        db.create_all()
+        applied = applied_versions()
+
+        if status_only:
+            for version, description, _ in MIGRATIONS:
+                mark = '✓' if version in applied else ' '
+                print(f"[{mark}] {version} {description}")
+            return 0
+
+        pending = [m for m in MIGRATIONS if m[0] not in applied]
+        if not pending:
+            print("✓ 数据库已是最新版本")
+            return 0
+
+        for version, description, migration in pending:
+            print(f"执行迁移 {version}: {description}...")
+            try:
+                result = migration()
+            except Exception as e:
+                print(f"❌ 迁移 {version} 失败: {e}")
+                return 1
+            with db.engine.begin() as conn:
+                conn.execute(db.insert(schema_migrations).values(
+                    version=version, description=description, applied_at=datetime.now()))
+            if result:
+                print(f"✓ 已创建: {', '.join(result)}")
+            else:
+                print("✓ 无需变更")
+        return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
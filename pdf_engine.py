@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+"""
+PDF 报告渲染引擎
+
+字体注册、段落样式、表格样式在每个进程内只初始化一次（get_pdf_engine），
+图表按统一的模板生成，生成报告时只剩排版工作。
+
+中文字体按顺序查找：PDF_FONT_PATHS 环境变量中的路径（用系统路径分隔符分隔）、
+Linux 常见的文泉驿 / Noto Sans SC（TrueType 版本）/ Droid Sans Fallback、Windows 系统字体。
+都找不到时使用 reportlab 自带的 STSong-Light CID 字体（不嵌入，由阅读器提供字形）。
+TrueType 字体在生成每份文档时只嵌入用到的字形子集。
+"""
+
+import os
+import threading
+from reportlab.lib import colors
+from reportlab.lib.enums import TA_CENTER
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.cidfonts import UnicodeCIDFont
+from reportlab.pdfbase.ttfonts import TTFont, TTFError
+from reportlab.platypus import Table, TableStyle, Paragraph
+from reportlab.graphics.shapes import Drawing, Rect, String
+from reportlab.graphics.charts.linecharts import HorizontalLineChart
+from reportlab.graphics.charts.barcharts import VerticalBarChart
+from reportlab.graphics.charts.piecharts import Pie
+
+DEFAULT_FONT_PATHS = (
+    # Linux
+    '/usr/share/fonts/truetype/wqy/wqy-zenhei.ttc',
+    '/usr/share/fonts/wqy-zenhei/wqy-zenhei.ttc',
+    '/usr/share/fonts/truetype/wqy/wqy-microhei.ttc',
+    '/usr/share/fonts/wqy-microhei/wqy-microhei.ttc',
+    '/usr/share/fonts/truetype/noto/NotoSansSC-Regular.ttf',
+    '/usr/share/fonts/google-noto/NotoSansSC-Regular.ttf',
+    '/usr/share/fonts/truetype/droid/DroidSansFallbackFull.ttf',
+    # Windows
+    'C:/Windows/Fonts/simsun.ttc',  # 宋体
+    'C:/Windows/Fonts/simhei.ttf',  # 黑体
+    'C:/Windows/Fonts/msyh.ttc',    # 微软雅黑
+    'C:/Windows/Fonts/simkai.ttf',  # 楷体
+)
+CJK_FONT_NAME = 'ChineseFont'
+CID_FALLBACK_FONT = 'STSong-Light'
+
+def font_paths_from_env():
+    """PDF_FONT_PATHS 环境变量中配置的字体路径"""
+    return [path for path in os.getenv('PDF_FONT_PATHS', '').split(os.pathsep) if path]
+
+def register_cjk_font(font_paths):
+    """注册第一个可用的中文字体，返回 (字体名, 字体文件路径或 None)"""
+    for path in font_paths:
+        if not os.path.exists(path):
+            continue
+        try:
+            # .ttc 取第一个子字体；PostScript 轮廓（CFF）的 OpenType 字体 reportlab 不支持，跳过
+            pdfmetrics.registerFont(TTFont(CJK_FONT_NAME, path, subfontIndex=0))
+            return CJK_FONT_NAME, path
+        except (TTFError, OSError) as e:
+            print(f"字体注册失败 {path}: {e}")
+    pdfmetrics.registerFont(UnicodeCIDFont(CID_FALLBACK_FONT))
+    return CID_FALLBACK_FONT, None
+
+def _grid_table_style(font_name, header_size, body_size):
+    return TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.darkblue),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('FONTNAME', (0, 0), (-1, -1), font_name),
+        ('FONTSIZE', (0, 0), (-1, 0), header_size),
+        ('FONTSIZE', (0, 1), (-1, -1), body_size),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black)
+    ])
+
+class PdfEngine:
+    """已注册字体和预建样式的集合，供各报告共用（只读）"""
+
+    def __init__(self, font_paths=()):
+        self.font_name, self.font_path = register_cjk_font(list(font_paths) + list(DEFAULT_FONT_PATHS))
+
+        base = getSampleStyleSheet()
+        self.styles = {
+            'title': ParagraphStyle('CustomTitle', parent=base['Heading1'], fontName=self.font_name,
+                                    fontSize=24, spaceAfter=30, alignment=TA_CENTER, textColor=colors.darkblue),
+            'heading': ParagraphStyle('CustomHeading', parent=base['Heading2'], fontName=self.font_name,
+                                      fontSize=16, spaceAfter=12, textColor=colors.darkblue),
+            'normal': ParagraphStyle('CustomNormal', parent=base['Normal'], fontName=self.font_name, fontSize=10),
+        }
+        self.table_styles = {
+            'summary': _grid_table_style(self.font_name, 12, 10),
+            'detail': _grid_table_style(self.font_name, 10, 9),
+        }
+
+    def paragraph(self, text, style='normal'):
+        return Paragraph(text, self.styles[style])
+
+    def table(self, data, col_widths, style='summary'):
+        table = Table(data, colWidths=col_widths)
+        table.setStyle(self.table_styles[style])
+        return table
+
+    def text(self, x, y, text, font_size=10, fill_color=colors.black):
+        return String(x, y, text, fontName=self.font_name, fontSize=font_size, fillColor=fill_color)
+
+    def line_chart(self, series, category_names, line_colors, size=(500, 300), plot=(50, 50, 400, 200),
+                   value_min=None, value_max=None):
+        """折线图：series 为若干条数据序列，line_colors 与之一一对应"""
+        drawing = Drawing(*size)
+        chart = HorizontalLineChart()
+        chart.x, chart.y, chart.width, chart.height = plot
+        chart.data = series
+        chart.categoryAxis.categoryNames = category_names
+        chart.categoryAxis.labels.fontName = self.font_name
+        chart.valueAxis.labels.fontName = self.font_name
+        if value_min is not None:
+            chart.valueAxis.valueMin = value_min
+        if value_max is not None:
+            chart.valueAxis.valueMax = value_max
+        for i, color in enumerate(line_colors):
+            chart.lines[i].strokeColor = color
+            chart.lines[i].strokeWidth = 2
+        drawing.add(chart)
+        return drawing
+
+    def bar_chart(self, series, category_names, bar_colors, size=(500, 300), plot=(50, 50, 400, 200),
+                  value_min=None, value_max=None):
+        """分组柱状图：series 为若干组数据，bar_colors 与之一一对应"""
+        drawing = Drawing(*size)
+        chart = VerticalBarChart()
+        chart.x, chart.y, chart.width, chart.height = plot
+        chart.data = series
+        chart.categoryAxis.categoryNames = category_names
+        chart.categoryAxis.labels.fontName = self.font_name
+        chart.valueAxis.labels.fontName = self.font_name
+        if value_min is not None:
+            chart.valueAxis.valueMin = value_min
+        if value_max is not None:
+            chart.valueAxis.valueMax = value_max
+        for i, color in enumerate(bar_colors):
+            chart.bars[i].fillColor = color
+        drawing.add(chart)
+        return drawing
+
+    def pie_chart(self, labels, values, palette, size=(500, 300)):
+        """饼图，右侧图例列出各项名称和占比；颜色按 palette 循环使用"""
+        drawing = Drawing(*size)
+        pie = Pie()
+        pie.x = 50
+        pie.y = 50
+        pie.width = 180
+        pie.height = 180
+        pie.data = values
+        pie.labels = None  # 名称放在图例里，避免与扇区重叠
+        pie.slices.strokeColor = colors.white
+        for i in range(len(values)):
+            pie.slices[i].fillColor = palette[i % len(palette)]
+
+        legend_x = 280
+        legend_y = 200
+        total = sum(values)
+        for i, (label, value) in enumerate(zip(labels, values)):
+            # 颜色块
+            rect = Rect(legend_x, legend_y - i * 20, 10, 10)
+            rect.fillColor = palette[i % len(palette)]
+            rect.strokeColor = colors.black
+            drawing.add(rect)
+
+            # 标签文字
+            percentage = (value / total) * 100 if total else 0
+            drawing.add(self.text(legend_x + 15, legend_y - i * 20 + 2, f'{label}: {percentage:.1f}%', font_size=9))
+
+        drawing.add(pie)
+        return drawing
+
+_engine = None
+_engine_lock = threading.Lock()
+
+def get_pdf_engine(font_paths=None):
+    """本进程的渲染引擎，首次调用时注册字体、构建样式"""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = PdfEngine(font_paths_from_env() if font_paths is None else font_paths)
+        return _engine
@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+每日余额账回填/校验脚本
+
+用法:
+    python rebuild_daily_balance.py           # 根据交易明细回填每日净额与累计余额
+    python rebuild_daily_balance.py --verify  # 只核对余额账与交易明细是否一致
+
+首次部署余额账功能时需要执行一次回填，之后余额账随交易的增删改自动维护。
+"""
+
+import sys
+from app import app, db, rebuild_daily_balance, verify_daily_balance
+
+def main():
+    verify_only = '--verify' in sys.argv[1:]
+    with app.app_context():
+        db.create_all()
+
+        if not verify_only:
+            print("开始回填每日余额账...")
+            count = rebuild_daily_balance()
+            print(f"✓ 已写入 {count} 天的余额记录")
+
+        print("开始核对余额账与交易明细...")
+        mismatches = verify_daily_balance()
+        if not mismatches:
+            print("✓ 余额账与交易明细一致")
+            return 0
+
+        print(f"发现 {len(mismatches)} 处不一致:")
+        for day, expected, actual in mismatches:
+            print(f"  {day}: 明细 净额 {expected[0]:.2f} 余额 {expected[1]:.2f}, "
+                  f"余额账 净额 {actual[0]:.2f} 余额 {actual[1]:.2f}")
+        print("请执行 python rebuild_daily_balance.py 重新回填")
+        return 1
+
+if __name__ == '__main__':
+    sys.exit(main())
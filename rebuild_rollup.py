@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+交易月度汇总表重建/校验脚本
+
+用法:
+    python rebuild_rollup.py           # 根据交易明细重建月度汇总表
+    python rebuild_rollup.py --verify  # 只核对汇总表与交易明细是否一致
+
+首次部署月度汇总功能时需要执行一次重建，之后汇总表随交易的增删改自动维护。
+"""
+
+import sys
+from app import app, db, rebuild_transaction_rollup, verify_transaction_rollup
+
+def main():
+    verify_only = '--verify' in sys.argv[1:]
+    with app.app_context():
+        db.create_all()
+
+        if not verify_only:
+            print("开始重建交易月度汇总表...")
+            count = rebuild_transaction_rollup()
+            print(f"✓ 已写入 {count} 条汇总记录")
+
+        print("开始核对汇总表与交易明细...")
+        mismatches = verify_transaction_rollup()
+        if not mismatches:
+            print("✓ 汇总表与交易明细一致")
+            return 0
+
+        print(f"发现 {len(mismatches)} 处不一致:")
+        for key, expected, actual in mismatches:
+            month, transaction_type, category_id, supplier_id = key
+            print(f"  {month} {transaction_type} 分类={category_id} 供应商={supplier_id}: "
+                  f"明细 {expected[0]:.2f}/{expected[1]} 笔, 汇总 {actual[0]:.2f}/{actual[1]} 笔")
+        print("请执行 python rebuild_rollup.py 重建汇总表")
+        return 1
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""
+测试夹具：应用连接临时目录中的 SQLite 数据库，每个测试前重建全部表
+
+用法（在项目根目录）:
+    python -m pytest tests
+"""
+
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_workdir = tempfile.mkdtemp(prefix='moneymind_test_')
+
+# 数据库地址等配置在导入 app 时确定，须在导入前设置
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(_workdir, 'test.db')
+os.environ['LEDGER_ENGINE'] = 'false'
+os.environ['PDF_REPORT_PREGENERATE'] = 'false'
+os.environ['JOB_FOLDER'] = os.path.join(_workdir, 'jobs')
+os.environ['PDF_CACHE_FOLDER'] = os.path.join(_workdir, 'report_cache')
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+import app as moneymind  # noqa: E402
+from werkzeug.security import generate_password_hash  # noqa: E402
+
+ADMIN_PASSWORD = 'test-password'
+
+def reset_database():
+    """删除并重建全部表，清空进程内缓存和计数器"""
+    with moneymind.app.app_context():
+        moneymind.db.drop_all()
+        moneymind.db.create_all()
+    for cache in moneymind.caches.values():
+        cache.clear()
+    moneymind.entity_counters.invalidate()
+
+def seed_reference_data():
+    """管理员、收支分类各两个、供应商两个、商品一个，返回 {名称: id}"""
+    with moneymind.app.app_context():
+        admin = moneymind.User(username='admin', email='admin@localhost',
+                               password_hash=generate_password_hash(ADMIN_PASSWORD), role='admin')
+        moneymind.db.session.add(admin)
+        moneymind.db.session.flush()
+        categories = [moneymind.Category(name=name, type=transaction_type, color='#999999', user_id=admin.id)
+                      for name, transaction_type in (('销售', 'income'), ('其他收入', 'income'),
+                                                     ('进货', 'expense'), ('房租', 'expense'))]
+        suppliers = [moneymind.Supplier(name=name) for name in ('果园', '批发市场')]
+        moneymind.db.session.add_all(categories + suppliers)
+        moneymind.db.session.flush()
+        product = moneymind.Product(name='苹果', supplier_id=suppliers[0].id)
+        moneymind.db.session.add(product)
+        moneymind.db.session.commit()
+        ids = {'admin': admin.id, 'product': product.id}
+        ids.update((category.name, category.id) for category in categories)
+        ids.update((supplier.name, supplier.id) for supplier in suppliers)
+        return ids
+
+def login(client):
+    response = client.post('/login', data={'username': 'admin', 'password': ADMIN_PASSWORD})
+    assert response.status_code == 302
+    return client
+
+@pytest.fixture
+def app_module():
+    return moneymind
+
+@pytest.fixture
+def ids():
+    reset_database()
+    return seed_reference_data()
+
+@pytest.fixture
+def client(ids):
+    return login(moneymind.app.test_client())
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+"""交易批量接口：数值校验与写入失败时的响应"""
+
+import pytest
+from sqlalchemy.exc import IntegrityError
+
+@pytest.fixture
+def token(app_module, ids):
+    with app_module.app.app_context():
+        return app_module.create_api_token('收银机', ids['admin'])
+
+def post_batch(app_module, token, body):
+    return app_module.app.test_client().post('/api/transactions/batch', data=body,
+                                             content_type='application/json',
+                                             headers={'Authorization': f'Bearer {token}'})
+
+def create_body(ids, amount='12.5', quantity='null'):
+    # 直接拼 JSON 文本：NaN、Infinity 不是标准 JSON，但 Python 的 json 模块会接受
+    return ('{"items": [{"op": "create", "data": {"date": "2024-05-01", "type": "expense", '
+            f'"category_id": {ids["进货"]}, "amount": {amount}, "quantity": {quantity}}}}}]}}')
+
+@pytest.mark.parametrize('amount', ['NaN', 'Infinity', '-Infinity'])
+def test_non_finite_amount_is_rejected(app_module, ids, token, amount):
+    response = post_batch(app_module, token, create_body(ids, amount=amount))
+    assert response.status_code == 422
+    assert response.get_json()['results'] == [{'index': 0, 'status': 'error', 'message': 'amount 必须是数字'}]
+    with app_module.app.app_context():
+        assert app_module.Transaction.query.count() == 0
+        assert app_module.DailyBalance.query.count() == 0
+
+def test_non_finite_quantity_is_rejected(app_module, ids, token):
+    response = post_batch(app_module, token, create_body(ids, quantity='Infinity'))
+    assert response.status_code == 422
+    assert response.get_json()['results'][0]['message'] == 'quantity 必须是数字'
+
+def test_valid_batch_is_written(app_module, ids, token):
+    response = post_batch(app_module, token, create_body(ids, quantity='3'))
+    assert response.status_code == 200
+    assert response.get_json()['created'] == 1
+    with app_module.app.app_context():
+        assert app_module.balance_as_of() == -12.5
+
+def test_write_failure_does_not_leak_sql(app_module, ids, token, monkeypatch):
+    def fail(deltas):
+        raise IntegrityError('INSERT INTO transaction_monthly_rollup (month, total) VALUES (?, ?)',
+                             ('2024-05', 12.5), Exception('UNIQUE constraint failed'))
+    monkeypatch.setattr(app_module, 'apply_transaction_deltas', fail)
+    response = post_batch(app_module, token, create_body(ids))
+    assert response.status_code == 500
+    body = response.get_json()
+    assert body == {'success': False, 'message': '写入失败，请稍后重试'}
+    with app_module.app.app_context():
+        assert app_module.Transaction.query.count() == 0
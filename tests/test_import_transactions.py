@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+"""CSV 导入：数值列的校验"""
+
+import io
+
+import pytest
+
+HEADER = '交易日期,交易类型,分类,金额,数量,单价\n'
+
+def import_csv(app_module, ids, text):
+    with app_module.app.app_context():
+        return app_module.import_transactions_file(io.BytesIO((HEADER + text).encode('utf-8')), 'import.csv',
+                                                   ids['admin'])
+
+@pytest.mark.parametrize('amount', ['inf', '-inf', 'Infinity', '1e400', 'nan', 'NaN'])
+def test_non_finite_amount_is_a_row_error(app_module, ids, amount):
+    result = import_csv(app_module, ids, f'2024-05-01,收入,销售,{amount},,\n2024-05-02,收入,销售,10,,\n')
+    assert result.inserted == 1
+    assert result.errors == [(2, f'金额不是有效数字：{amount}')]
+    with app_module.app.app_context():
+        assert app_module.balance_as_of() == 10
+        assert app_module.verify_transaction_rollup() == []
+        assert app_module.verify_daily_balance() == []
+
+@pytest.mark.parametrize('amount', ['0', '-5', '-0.01'])
+def test_non_positive_amount_is_a_row_error(app_module, ids, amount):
+    result = import_csv(app_module, ids, f'2024-05-01,支出,进货,{amount},,\n')
+    assert result.inserted == 0
+    assert result.errors == [(2, '金额必须大于0')]
+
+@pytest.mark.parametrize('field, label', [('quantity', '数量'), ('unit_price', '单价')])
+def test_non_finite_quantity_and_price_are_row_errors(app_module, ids, field, label):
+    values = {'quantity': '', 'unit_price': ''}
+    values[field] = 'nan'
+    result = import_csv(app_module, ids, f"2024-05-01,支出,进货,12.5,{values['quantity']},{values['unit_price']}\n")
+    assert result.inserted == 0
+    assert result.errors == [(2, f'{label}不是有效数字：nan')]
+
+def test_import_page_reports_non_finite_rows(app_module, client):
+    data = {'file': (io.BytesIO((HEADER + '2024-05-01,收入,销售,1e400,,\n').encode('utf-8')), 'import.csv')}
+    response = client.post('/import_transactions', data=data, content_type='multipart/form-data')
+    assert response.status_code == 200
+    assert '金额不是有效数字：1e400' in response.get_data(as_text=True)
+    with app_module.app.app_context():
+        assert app_module.Transaction.query.count() == 0
+
+def test_verification_reports_non_finite_ledgers(app_module, ids):
+    import_csv(app_module, ids, '2024-05-01,收入,销售,10,,\n')
+    with app_module.app.app_context():
+        app_module.db.session.query(app_module.TransactionMonthlyRollup).update({'total': float('inf')})
+        app_module.db.session.query(app_module.DailyBalance).update({'balance': float('inf')})
+        app_module.db.session.commit()
+        assert app_module.verify_transaction_rollup()
+        assert app_module.verify_daily_balance()
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""关键词检索：SQLite 上通过 FTS5 trigram 全文索引表检索，结果与逐行包含匹配一致；MySQL 上各词按长度走全文索引或 LIKE"""
+
+import logging
+from datetime import datetime
+
+import pytest
+
+DESCRIPTIONS = [
+    ('进货红富士苹果', '果园直供'),
+    ('苹果汁 50% 促销', None),
+    ('香蕉', '批发市场 A_1 档口'),
+    ('Apple juice', 'ORCHARD'),
+    (None, '红富士苹果与香蕉'),
+    ('房租', None),
+]
+
+KEYWORDS = ['红富士', '苹果', '香蕉 苹果', '红富士苹果 果园', 'apple', 'orchard', '50%', 'A_1', '"引号"', '房', '不存在的词']
+
+@pytest.fixture
+def transactions(app_module, ids):
+    with app_module.app.app_context():
+        for description, supplier_description in DESCRIPTIONS:
+            app_module.db.session.add(app_module.Transaction(
+                amount=1, type='expense', category_id=ids['进货'], user_id=ids['admin'], date=datetime(2024, 5, 1),
+                description=description, supplier_description=supplier_description))
+        app_module.db.session.commit()
+
+def searched(app_module, keyword):
+    return sorted(row.id for row in app_module.Transaction.query.filter(
+        app_module.transaction_search_condition(keyword)))
+
+def expected(app_module, keyword):
+    rows = app_module.Transaction.query.all()
+    def hit(text, term):
+        return text is not None and term.lower() in text.lower()
+    return sorted(row.id for row in rows
+                  if all(hit(row.description, term) or hit(row.supplier_description, term)
+                         for term in keyword.split()))
+
+def test_fts_table_is_created_with_transaction_table(app_module, ids):
+    with app_module.app.app_context():
+        assert app_module.transaction_fts_table() == app_module.TRANSACTION_FTS_TABLE
+
+@pytest.mark.parametrize('keyword', KEYWORDS)
+def test_results_match_substring_search(app_module, transactions, keyword):
+    with app_module.app.app_context():
+        assert searched(app_module, keyword) == expected(app_module, keyword)
+
+def test_index_follows_updates_deletes_and_bulk_inserts(app_module, ids, transactions):
+    with app_module.app.app_context():
+        session = app_module.db.session
+        first = app_module.Transaction.query.filter_by(description='进货红富士苹果').one()
+        first.description = '进货砂糖橘'
+        session.delete(app_module.Transaction.query.filter_by(description='香蕉').one())
+        session.commit()
+        day = datetime(2024, 5, 2)
+        month, day_number = app_module.date_buckets(day)
+        session.execute(app_module.Transaction.__table__.insert(), [
+            {'date': day, 'month': month, 'day_number': day_number, 'type': 'expense', 'amount': 1.0,
+             'category_id': ids['进货'], 'user_id': ids['admin'], 'description': '砂糖橘 第二批'}])
+        session.commit()
+        for keyword in ('红富士', '砂糖橘', '香蕉', '批发市场'):
+            assert searched(app_module, keyword) == expected(app_module, keyword)
+        assert len(searched(app_module, '砂糖橘')) == 2
+
+def test_long_terms_use_the_fts_index(app_module, transactions):
+    with app_module.app.app_context():
+        statement = app_module.db.select(app_module.Transaction.id).where(
+            app_module.transaction_search_condition('红富士苹果'))
+        compiled = statement.compile(app_module.db.engine, compile_kwargs={'literal_binds': True})
+        plan = ' '.join(str(row[-1]) for row in app_module.db.session.execute(
+            app_module.db.text(f'EXPLAIN QUERY PLAN {compiled}')))
+        assert 'MATCH' in str(compiled)
+        assert 'LIKE' not in str(compiled)
+        assert 'VIRTUAL TABLE INDEX' in plan
+
+def test_short_terms_are_filtered_with_like(app_module, transactions):
+    # trigram 索引只能检索不短于 3 个字符的词，更短的词用 LIKE 在索引命中的行中筛选
+    with app_module.app.app_context():
+        compiled = str(app_module.transaction_search_condition('红富士 果园').compile(app_module.db.engine))
+        assert 'MATCH' in compiled and 'LIKE' in compiled
+
+def test_missing_fts_table_falls_back_with_a_warning(app_module, transactions, monkeypatch, caplog):
+    monkeypatch.setattr(app_module, '_transaction_fts_ready', False)
+    monkeypatch.setattr(app_module, '_transaction_fts_warned', False)
+    with app_module.app.app_context():
+        app_module.db.session.execute(app_module.db.text(f'DROP TABLE {app_module.TRANSACTION_FTS_TABLE}'))
+        app_module.db.session.commit()
+        with caplog.at_level(logging.WARNING):
+            assert app_module.transaction_fts_table() is None
+        assert 'migrate.py' in caplog.text
+        assert searched(app_module, '红富士') == expected(app_module, '红富士')
+
+def mysql_condition(app_module, keyword):
+    from sqlalchemy.dialects import mysql
+    dialect = mysql.dialect()
+    condition = app_module.db_backend.keyword_condition(
+        dialect, (app_module.Transaction.description, app_module.Transaction.supplier_description), keyword)
+    return str(condition.compile(dialect=dialect, compile_kwargs={'literal_binds': True}))
+
+def test_mysql_uses_fulltext_for_long_terms_alongside_short_ones(app_module):
+    sql = mysql_condition(app_module, '红富士 苹 果园')
+    assert sql.count('MATCH') == 1
+    assert '+"红富士" +"果园"' in sql
+    # 比 ngram_token_size 短的词在索引命中的行中用 LIKE 筛选
+    assert "LIKE '%%苹%%'" in sql
+    assert 'LIKE' not in mysql_condition(app_module, '红富士 果园')
+
+def test_mysql_short_terms_follow_ngram_token_size(app_module, monkeypatch):
+    assert 'MATCH' not in mysql_condition(app_module, '苹')
+    monkeypatch.setenv('NGRAM_TOKEN_SIZE', '1')
+    sql = mysql_condition(app_module, '苹 果')
+    assert '+"苹" +"果"' in sql and 'LIKE' not in sql
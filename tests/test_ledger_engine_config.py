@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+"""列存分析引擎是可选的：不设置 LEDGER_ENGINE 时关闭，设为 true 才启用"""
+
+import os
+import subprocess
+import sys
+
+from conftest import ROOT
+
+def ledger_engine_setting(tmp_path, value=None):
+    """在新进程中导入 app（配置在导入时确定），返回 LEDGER_ENGINE 配置值"""
+    env = {key: val for key, val in os.environ.items() if key != 'LEDGER_ENGINE'}
+    env['DATABASE_URL'] = 'sqlite:///' + str(tmp_path / 'config.db')
+    if value is not None:
+        env['LEDGER_ENGINE'] = value
+    result = subprocess.run([sys.executable, '-c', "import app; print(app.app.config['LEDGER_ENGINE'])"],
+                            cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+    return result.stdout.strip().splitlines()[-1]
+
+def test_disabled_by_default(tmp_path):
+    assert ledger_engine_setting(tmp_path) == 'False'
+
+def test_enabled_when_opted_in(tmp_path):
+    assert ledger_engine_setting(tmp_path, 'true') == 'True'
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""列表页、导出和后台任务的 SQL 查询次数与数据行数无关：两份行数不同的数据上每个页面的查询次数相同"""
+
+import os
+from datetime import datetime, timedelta
+
+from sqlalchemy import event
+
+from conftest import reset_database, seed_reference_data, login
+from check_query_counts import ROUTES, JOBS
+
+SIZES = (40, 400)
+
+def seed_scaled_data(app_module, ids, size):
+    """写入 size 笔交易；分类、供应商、商品的个数也随 size 增长，每页列出的交易涉及的关联记录各不相同，
+    逐行懒加载关联对象的页面查询次数会随之增加。返回第一个供应商的 id"""
+    m = app_module
+    related = max(2, size // 20)
+    now = datetime.now()
+    with m.app.app_context():
+        categories = {transaction_type: [m.Category(name=f'{transaction_type}-{i}', type=transaction_type,
+                                                    color='#999999', user_id=ids['admin']) for i in range(related)]
+                      for transaction_type in ('income', 'expense')}
+        suppliers = [m.Supplier(name=f'供应商{i}') for i in range(related)]
+        m.db.session.add_all(suppliers + categories['income'] + categories['expense'])
+        m.db.session.flush()
+        products = [m.Product(name=f'商品{i}', supplier_id=supplier.id) for i, supplier in enumerate(suppliers)]
+        m.db.session.add_all(products)
+        m.db.session.flush()
+        for i in range(size):
+            transaction_type = 'income' if i % 2 else 'expense'
+            expense = transaction_type == 'expense'
+            m.db.session.add(m.Transaction(
+                amount=10 + i % 97, type=transaction_type, category_id=categories[transaction_type][i % related].id,
+                user_id=ids['admin'], description=f'交易 {i}', date=now - timedelta(hours=37 * i),
+                supplier_id=suppliers[i % related].id if expense else None,
+                product_id=products[i % related].id if expense else None))
+        m.db.session.commit()
+        m.rebuild_transaction_rollup()
+        m.rebuild_daily_balance()
+        return suppliers[0].id
+
+def query_counts(app_module, size, folder):
+    """重建数据库并写入 size 笔交易，返回 {页面或任务: 查询次数}"""
+    reset_database()
+    ids = seed_reference_data()
+    supplier_id = seed_scaled_data(app_module, ids, size)
+    for cache in app_module.caches.values():
+        cache.clear()
+    app_module.entity_counters.invalidate()
+
+    statements = []
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    client = login(app_module.app.test_client())
+    with app_module.app.app_context():
+        engine = app_module.db.engine
+    counts = {}
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        for url in ROUTES + [f'/supplier/{supplier_id}']:
+            statements.clear()
+            response = client.get(url)
+            response.get_data()
+            response.close()
+            assert response.status_code < 400, url
+            counts[url] = len(statements)
+        with app_module.app.app_context():
+            for kind, params, available in JOBS:
+                if not available:
+                    continue
+                statements.clear()
+                app_module.JOB_KINDS[kind].run(params, os.path.join(folder, f'{kind}_{size}'), lambda *args: None)
+                counts[kind] = len(statements)
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+    return counts
+
+def test_query_counts_do_not_grow_with_rows(app_module, tmp_path, monkeypatch):
+    monkeypatch.setitem(app_module.app.config, 'PDF_CACHE_FOLDER', str(tmp_path / 'report_cache'))
+    small, large = (query_counts(app_module, size, str(tmp_path)) for size in SIZES)
+    assert small.keys() == large.keys()
+    differing = {name: (small[name], large[name]) for name in small if small[name] != large[name]}
+    assert differing == {}, f'查询次数随数据行数变化（{SIZES[0]} 笔 / {SIZES[1]} 笔）: {differing}'
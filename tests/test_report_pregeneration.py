@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+"""上月报告预生成：由服务启动的后台线程定期检查提交，不依赖页面访问"""
+
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+
+class Submissions(list):
+    """记录提交的任务，第一次提交时 event 置位"""
+    def __init__(self):
+        super().__init__()
+        self.event = threading.Event()
+
+@pytest.fixture
+def submitted(app_module, tmp_path, monkeypatch):
+    calls = Submissions()
+    def submit_job(kind, params, user_id):
+        calls.append((kind, params))
+        calls.event.set()
+        return f'job{len(calls)}'
+    monkeypatch.setattr(app_module, 'submit_job', submit_job)
+    monkeypatch.setitem(app_module.app.config, 'PDF_CACHE_FOLDER', str(tmp_path / 'report_cache'))
+    monkeypatch.setitem(app_module.app.config, 'PDF_REPORT_PREGENERATE', True)
+    return calls
+
+def test_statistics_page_does_not_submit(app_module, client, submitted):
+    response = client.get('/statistics')
+    assert response.status_code == 200
+    assert submitted == []
+
+def test_background_thread_submits_at_startup(app_module, ids, submitted):
+    if not app_module.PDF_AVAILABLE:
+        pytest.skip('reportlab 未安装')
+    thread = app_module.start_report_pregeneration()
+    assert thread is not None and thread.daemon
+    assert submitted.event.wait(10)
+    month_start = app_module.month_floor(datetime.now())
+    assert submitted == [('pdf_report', {
+        'start_date': app_module.month_floor(month_start, 1).strftime('%Y-%m-%d'),
+        'end_date': (month_start - timedelta(days=1)).strftime('%Y-%m-%d'),
+    })]
+
+def test_disabled_pregeneration_starts_no_thread(app_module, submitted, monkeypatch):
+    monkeypatch.setitem(app_module.app.config, 'PDF_REPORT_PREGENERATE', False)
+    assert app_module.start_report_pregeneration() is None
+
+def test_checks_at_month_rollover(app_module):
+    assert app_module._pregeneration_delay(datetime(2024, 5, 31, 23, 59)) == 60
+    assert app_module._pregeneration_delay(datetime(2024, 5, 15, 12, 0)) == app_module.PREGENERATE_CHECK_INTERVAL
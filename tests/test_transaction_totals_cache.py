@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+"""收支记录列表的记录数与小计缓存：其他进程写入的数据在 TTL 到期后反映到列表"""
+
+from datetime import datetime
+
+def write_outside_process(app_module, ids, count):
+    """模拟导入脚本或其他工作进程的写入：本进程收不到提交通知"""
+    day = datetime(2024, 5, 1)
+    month, day_number = app_module.date_buckets(day)
+    with app_module.app.app_context():
+        app_module.db.session.execute(app_module.Transaction.__table__.insert(), [
+            {'date': day, 'month': month, 'day_number': day_number, 'type': 'income', 'amount': 10.0,
+             'category_id': ids['销售'], 'user_id': ids['admin']}
+            for _ in range(count)])
+        app_module.db.session.commit()
+
+def listed_total(client):
+    response = client.get('/transactions?start_date=2024-01-01&end_date=2024-12-31')
+    assert response.status_code == 200
+    text = response.get_data(as_text=True)
+    return text.split('共找到 <span class="font-medium text-primary">', 1)[1].split('</span>', 1)[0]
+
+def test_cache_has_ttl(app_module):
+    assert app_module.transaction_totals_cache.ttl == app_module.app.config['TRANSACTION_TOTALS_CACHE_TTL']
+
+def test_outside_writes_show_after_ttl(app_module, ids, client, monkeypatch):
+    write_outside_process(app_module, ids, 2)
+    assert listed_total(client) == '2'
+
+    write_outside_process(app_module, ids, 3)
+    assert listed_total(client) == '2'  # TTL 内仍用缓存
+
+    monkeypatch.setattr(app_module.transaction_totals_cache, 'ttl', 0)
+    assert listed_total(client) == '5'
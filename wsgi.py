@@ -1,5 +1,5 @@
 import os
-from app import app, db
+from app import app, db, preload_ledger_engine, start_report_pregeneration
 from app import User
 from werkzeug.security import generate_password_hash
 
@@ -31,8 +31,12 @@ def init_db():
             print(f"数据库初始化失败: {e}")
             raise
 
-# 初始化数据库
-init_db()
+# 初始化数据库、在后台载入交易列存引擎并启动上月报告预生成检查
+# （后台任务进程以 spawn 方式启动时会重新导入本模块，名称为 __mp_main__，这些都不需要）
+if __name__ != '__mp_main__':
+    init_db()
+    preload_ledger_engine()
+    start_report_pregeneration()
 
 # WSGI应用对象
 application = app